@@ -0,0 +1,318 @@
+"""Startup time benchmarks for the ChipStream CLI and GUI
+
+Every scenario is executed in fresh Python processes:
+
+- "cold": one run with an empty bytecode cache (``-X pycache_prefix``
+  pointing to a new directory), i.e. all modules are compiled
+- "warm": several runs with the regular bytecode cache; the median
+  is reported
+- "breakdown": one run with ``-X importtime``; the self-time of all
+  imported modules is summed per top-level package
+
+Results can be stored as a baseline and later runs can be compared
+against it, e.g. after updating dcnum or torch::
+
+    python benchmarks/bench_startup.py --save-baseline
+    python benchmarks/bench_startup.py --compare
+
+The baseline depends on the machine and the Python version and is
+therefore not part of the repository. Record it locally with
+``--save-baseline`` before the first ``--compare`` and only compare
+results obtained in the same environment.
+"""
+import argparse
+import ast
+import collections
+import importlib.metadata
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+#: Default location of the stored baseline
+BASELINE_PATH = pathlib.Path(__file__).parent / "startup_baseline.json"
+#: Test data used for the 'cli-dry-run' scenario if --data is not given
+DEFAULT_DATA = (pathlib.Path(__file__).parents[1] / "tests" / "data"
+                / "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+
+#: Code snippets for the individual scenarios. Each snippet prints
+#: a dictionary with the durations of its phases in seconds.
+#: The string "{data}" is replaced by the path to an input file.
+SCENARIOS = {
+    "cli-import": """
+import time
+t0 = time.perf_counter()
+from chipstream.cli import cli_main
+t1 = time.perf_counter()
+print({"import": t1 - t0})
+""",
+    "cli-version": """
+import time
+t0 = time.perf_counter()
+from chipstream.cli import cli_main
+t1 = time.perf_counter()
+try:
+    cli_main.chipstream_cli(["--version"])
+except SystemExit:
+    pass
+t2 = time.perf_counter()
+print({"import": t1 - t0, "run": t2 - t1})
+""",
+    "cli-help": """
+import time
+t0 = time.perf_counter()
+from chipstream.cli import cli_main
+t1 = time.perf_counter()
+try:
+    cli_main.chipstream_cli(["--help"])
+except SystemExit:
+    pass
+t2 = time.perf_counter()
+print({"import": t1 - t0, "run": t2 - t1})
+""",
+    "cli-dry-run": """
+import time
+t0 = time.perf_counter()
+from chipstream.cli import cli_main
+t1 = time.perf_counter()
+try:
+    cli_main.chipstream_cli([r"{data}", "--dry-run", "--no-index"])
+except SystemExit:
+    pass
+t2 = time.perf_counter()
+print({"import": t1 - t0, "run": t2 - t1})
+""",
+    "gui-import": """
+import time
+t0 = time.perf_counter()
+from chipstream.gui import main_window
+t1 = time.perf_counter()
+print({"import": t1 - t0})
+""",
+    "gui-init": """
+import time
+t0 = time.perf_counter()
+from PyQt6 import QtWidgets
+app = QtWidgets.QApplication([])
+t1 = time.perf_counter()
+from chipstream.gui.main_window import ChipStream
+t2 = time.perf_counter()
+window = ChipStream()
+t3 = time.perf_counter()
+window.close()
+print({"qt": t1 - t0, "import": t2 - t1, "init": t3 - t2})
+""",
+}
+
+
+def get_environment():
+    """Return information about the benchmark environment"""
+    versions = {}
+    for name in ["chipstream", "dcnum", "torch", "numpy", "scipy",
+                 "h5py", "click", "PyQt6"]:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.node(),
+            "versions": versions,
+            }
+
+
+def parse_importtime(stderr):
+    """Sum the `-X importtime` self-times (in seconds) per package"""
+    packages = collections.defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        try:
+            self_us = int(self_us)
+        except ValueError:
+            # header line
+            continue
+        packages[name.strip().split(".")[0]] += self_us * 1e-6
+    return dict(sorted(packages.items(), key=lambda x: -x[1]))
+
+
+def run_snippet(code, xargs=(), env=None):
+    """Run a code snippet in a new interpreter
+
+    Returns the wall time, the phase durations printed by the
+    snippet, and stderr.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *xargs, "-c", code],
+                          capture_output=True,
+                          text=True,
+                          env=env)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark snippet failed:\n{proc.stderr}")
+    # The phases are printed in the last line of stdout
+    phases = ast.literal_eval(proc.stdout.strip().split("\n")[-1])
+    return wall, phases, proc.stderr
+
+
+def run_scenario(name, repeat=5, data=None):
+    """Benchmark a scenario"""
+    code = SCENARIOS[name].replace("{data}", str(data))
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    with tempfile.TemporaryDirectory(prefix="chipstream_bench_") as tdir:
+        # Do not mess with the user's cache and settings
+        env["CHIPSTREAM_CACHE_DIR"] = str(pathlib.Path(tdir) / "cache")
+        env["XDG_CONFIG_HOME"] = str(pathlib.Path(tdir) / "config")
+        cold, cold_phases, _ = run_snippet(
+            code,
+            xargs=["-X", f"pycache_prefix={pathlib.Path(tdir) / 'pyc'}"],
+            env=env)
+        # make sure the regular bytecode cache is populated
+        run_snippet(code, env=env)
+        warm_runs = []
+        warm_phases = collections.defaultdict(list)
+        for _ in range(repeat):
+            wall, phases, _ = run_snippet(code, env=env)
+            warm_runs.append(wall)
+            for key, value in phases.items():
+                warm_phases[key].append(value)
+        _, _, stderr = run_snippet(code, xargs=["-X", "importtime"], env=env)
+    return {
+        "cold": cold,
+        "cold_phases": cold_phases,
+        "warm": statistics.median(warm_runs),
+        "warm_runs": warm_runs,
+        "warm_phases": {k: statistics.median(v)
+                        for k, v in warm_phases.items()},
+        "packages": parse_importtime(stderr),
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_diff=0.05):
+    """Compare results with a baseline and return a list of regressions
+
+    A scenario regressed if its warm median is more than `tolerance`
+    (relative) and more than `min_diff` seconds (absolute) slower than
+    in the baseline.
+    """
+    regressions = []
+    for name, res in results["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        ref = baseline["scenarios"][name]
+        diff = res["warm"] - ref["warm"]
+        if diff > min_diff and diff > tolerance * ref["warm"]:
+            # Find the packages that are responsible
+            culprits = []
+            for pkg, dur in res["packages"].items():
+                pkg_diff = dur - ref["packages"].get(pkg, 0)
+                if pkg_diff > min_diff / 5:
+                    culprits.append(f"{pkg} (+{pkg_diff:.3f}s)")
+            regressions.append(
+                f"{name}: {ref['warm']:.3f}s -> {res['warm']:.3f}s"
+                + (f"; {', '.join(culprits)}" if culprits else ""))
+    return regressions
+
+
+def print_results(results, baseline=None, top=5):
+    for name, res in results["scenarios"].items():
+        line = f"{name:12s} cold {res['cold']:6.3f}s  warm {res['warm']:6.3f}s"
+        if baseline and name in baseline["scenarios"]:
+            line += f"  (baseline {baseline['scenarios'][name]['warm']:.3f}s)"
+        print(line)
+        phases = ", ".join(f"{k} {v:.3f}s"
+                           for k, v in res["warm_phases"].items())
+        print(f"{'':12s} phases: {phases}")
+        packages = ", ".join(f"{k} {v:.3f}s"
+                             for k, v in list(res["packages"].items())[:top])
+        print(f"{'':12s} imports: {packages}")
+
+
+def extract_default_data(path_dir):
+    """Extract the input file of :const:`DEFAULT_DATA` to `path_dir`"""
+    with zipfile.ZipFile(DEFAULT_DATA) as arc:
+        name = [n for n in arc.namelist() if n.endswith(".rtdc")][0]
+        return pathlib.Path(arc.extract(name, path_dir))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-s", "--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="scenario to run (default: all)")
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="number of warm runs per scenario")
+    parser.add_argument("--data", type=pathlib.Path,
+                        help="input .rtdc file for the 'cli-dry-run' "
+                             "scenario (defaults to the test data of "
+                             "the repository)")
+    parser.add_argument("-o", "--output", type=pathlib.Path,
+                        help="write results to this JSON file")
+    parser.add_argument("--baseline", type=pathlib.Path,
+                        default=BASELINE_PATH,
+                        help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare with the baseline and exit with "
+                             "status 1 if startup became slower")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown allowed in --compare mode")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    if ("cli-dry-run" in scenarios and args.data is None
+            and not DEFAULT_DATA.exists()):
+        parser.error("The 'cli-dry-run' scenario requires --data")
+
+    results = {"environment": get_environment(),
+               "repeat": args.repeat,
+               "scenarios": {}}
+    with tempfile.TemporaryDirectory(prefix="chipstream_bench_") as tdir:
+        data = args.data
+        if data is None and "cli-dry-run" in scenarios:
+            data = extract_default_data(tdir)
+        for name in scenarios:
+            results["scenarios"][name] = run_scenario(name,
+                                                      repeat=args.repeat,
+                                                      data=data)
+
+    baseline = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+
+    print_results(results, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {args.baseline}")
+    if args.compare:
+        if baseline is None:
+            parser.error(f"Baseline {args.baseline} does not exist. "
+                         f"Record it with --save-baseline first.")
+        for key in ["machine", "python"]:
+            if baseline["environment"][key] != results["environment"][key]:
+                print(f"Warning: The baseline was recorded with a "
+                      f"different {key} ({baseline['environment'][key]})!")
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print("Startup regressions:")
+            for reg in regressions:
+                print(f" - {reg}")
+            return 1
+        print("No startup regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
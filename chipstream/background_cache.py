@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+
+import h5py
+
+from .staging import rewrite_basin_paths
+from .user_cache import get_cache_dir
+
+
+#: Default maximum total size of the cached background files in bytes
+BACKGROUND_CACHE_SIZE = 2 * 1024**3
+#: Number of bytes read from the beginning and from the end of an
+#: input file for its fingerprint
+FINGERPRINT_SIZE = 2**20
+#: HDF5 attribute of a cached background file with the input file
+#: from which the background was computed
+BACKGROUND_INPUT_ATTR = "chipstream:background input"
+
+
+def get_input_fingerprint(path: pathlib.Path) -> str:
+    """Return a fingerprint of the content of an input file
+
+    Hashing the entire input file would take as long as reading it,
+    which is what the background cache should avoid. The fingerprint
+    is the MD5 hash of the file size and the first and last
+    :const:`FINGERPRINT_SIZE` bytes, which contain the HDF5 metadata
+    of the measurement. Unlike the file identity used by the dataset
+    index, the fingerprint does not change when the file is copied
+    (e.g. to the staging area) or moved.
+    """
+    size = os.stat(path).st_size
+    hasher = hashlib.md5(str(size).encode("utf-8"))
+    with open(path, "rb") as fd:
+        hasher.update(fd.read(FINGERPRINT_SIZE))
+        fd.seek(max(0, size - FINGERPRINT_SIZE))
+        hasher.update(fd.read(FINGERPRINT_SIZE))
+    return hasher.hexdigest()
+
+
+class BackgroundCache:
+    def __init__(self,
+                 path: pathlib.Path | str | None = None,
+                 max_bytes: int = BACKGROUND_CACHE_SIZE):
+        """Content-addressed cache for computed background data
+
+        The background data of an input file are fully determined by
+        the content of the input file and the pipeline identifiers
+        "gen_id", "dat_id", and "bg_id". Jobs that only differ in
+        segmentation, feature extraction, or gating therefore reuse
+        the temporary input file with the background data (see
+        :class:`.ResumableJobRunner`) of a previous job.
+
+        Parameters
+        ----------
+        path:
+            cache directory; defaults to the directory "background"
+            in the user cache directory (see :func:`.get_cache_dir`)
+        max_bytes:
+            maximum total size of the cached files; the least recently
+            used files are removed when the cache is full
+        """
+        if path is None:
+            path = get_cache_dir() / "background"
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @property
+    def used_bytes(self) -> int:
+        """Total size of the cached files"""
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self, keep: pathlib.Path | None = None):
+        """Remove the least recently used files until the cache fits
+
+        The file `keep` (e.g. the file that was just added) is not
+        removed.
+        """
+        entries = sorted(self.get_entries(), key=lambda e: e[2])
+        used = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if used <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            used -= size
+
+    def get_entries(self) -> list:
+        """Return tuples (path, size, time of last use) of cached files"""
+        entries = []
+        for path in self.path.glob("*.rtdc"):
+            try:
+                st = path.stat()
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def get_entry_path(self, key: str) -> pathlib.Path:
+        return self.path / f"{key}.rtdc"
+
+    def get_key(self, path_in: pathlib.Path, ppdict: dict) -> str:
+        """Return the cache key for an input file and pipeline identifiers
+
+        See :func:`get_input_fingerprint` for how the input file is
+        identified. `ppdict` must contain the pipeline identifiers
+        "gen_id", "dat_id", and "bg_id".
+        """
+        key = json.dumps({
+            "input": get_input_fingerprint(path_in),
+            "gen_id": ppdict["gen_id"],
+            "dat_id": ppdict["dat_id"],
+            "bg_id": ppdict["bg_id"],
+        }, sort_keys=True)
+        return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    def restore(self,
+                key: str,
+                path_temp_in: pathlib.Path,
+                path_in: pathlib.Path) -> bool:
+        """Copy cached background data to the temporary input file
+
+        The file basins are pointed to the input file `path_in`.
+        Returns False if there are no cached data for `key`.
+        """
+        path_entry = self.get_entry_path(key)
+        path_temp = path_temp_in.with_name(path_temp_in.name + "~")
+        try:
+            shutil.copyfile(path_entry, path_temp)
+        except FileNotFoundError:
+            return False
+        try:
+            # mark as recently used
+            os.utime(path_entry)
+            with h5py.File(path_temp, "r") as h5:
+                path_source = h5.attrs[BACKGROUND_INPUT_ATTR]
+            rewrite_basin_paths(path_temp, path_source, path_in)
+            path_temp.replace(path_temp_in)
+        finally:
+            path_temp.unlink(missing_ok=True)
+        return True
+
+    def store(self,
+              key: str,
+              path_temp_in: pathlib.Path,
+              path_in: pathlib.Path):
+        """Add the temporary input file of a job to the cache
+
+        Files larger than the cache are not added.
+        """
+        if pathlib.Path(path_temp_in).stat().st_size > self.max_bytes:
+            return
+        path_entry = self.get_entry_path(key)
+        # Concurrent jobs might store the same entry.
+        path_temp = path_entry.with_name(f"{path_entry.name}.{os.getpid()}~")
+        try:
+            shutil.copyfile(path_temp_in, path_temp)
+            with h5py.File(path_temp, "a") as h5:
+                h5.attrs[BACKGROUND_INPUT_ATTR] = \
+                    str(pathlib.Path(path_in).resolve())
+            path_temp.replace(path_entry)
+        finally:
+            path_temp.unlink(missing_ok=True)
+        self.evict(keep=path_entry)
@@ -1,3 +1,21 @@
+import pathlib
+import sys
+
+
+def is_server_command(args):
+    """Whether the command line arguments select the job server mode
+
+    The job server commands (`chipstream-cli serve` and
+    `chipstream-cli submit`) are not click subcommands, because the
+    main command takes an input path as its first argument. An input
+    file or directory named "serve" or "submit" in the current working
+    directory takes precedence.
+    """
+    return (len(args) > 0
+            and args[0] in ["serve", "submit"]
+            and not pathlib.Path(args[0]).exists())
+
+
 def main():
     try:
         import click
@@ -8,5 +26,13 @@ def main():
         print("Please install the 'click' Python package to access the CLI!")
         return None
 
+    if is_server_command(sys.argv[1:]):
+        # Job server mode (`chipstream-cli serve`/`chipstream-cli submit`)
+        from . import cli_serve
+        command = {"serve": cli_serve.chipstream_serve,
+                   "submit": cli_serve.chipstream_submit}[sys.argv[1]]
+        return command(args=sys.argv[2:],
+                       prog_name=f"chipstream-cli {sys.argv[1]}")
+
     from .cli_main import chipstream_cli
     return chipstream_cli()
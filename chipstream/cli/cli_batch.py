@@ -0,0 +1,393 @@
+import collections
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import contextlib
+import functools
+import multiprocessing as mp
+import pathlib
+from typing import Iterable, List, Literal, Tuple
+
+import click
+
+from ..background_cache import BACKGROUND_CACHE_SIZE
+from ..dataset_index import DatasetIndex
+from ..input_probe import InputProbe
+from ..memory import fit_job_to_memory, get_max_concurrent_jobs
+from ..prefetch import prefetch
+from ..preview import format_duration
+from ..staging import StagingArea
+from ..write_behind import OutputMover
+
+from . import cli_common as cm
+from .cli_proc import (
+    close_output_mover, preflight_dataset, preflight_variants,
+    preview_dataset, process_dataset, run_job, run_variant_jobs
+)
+
+
+# Use "spawn" for the job processes. dcnum spawns its own worker
+# processes and we must not fork a process with running threads.
+mp_spawn = mp.get_context("spawn")
+
+
+def split_cpu_budget(num_cpus: int, num_jobs: int) -> List[int]:
+    """Split a CPU budget into one CPU count per concurrent job
+
+    Each job gets at least one CPU. If `num_cpus` is not a multiple
+    of `num_jobs`, the remaining CPUs are distributed among the
+    first jobs.
+    """
+    num_jobs = max(1, num_jobs)
+    base = max(1, num_cpus // num_jobs)
+    slots = [base] * num_jobs
+    for ii in range(max(0, num_cpus - base * num_jobs)):
+        slots[ii] += 1
+    return slots
+
+
+def limit_concurrent_jobs(
+        path_pairs: List[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_jobs: int,
+        max_memory: int,
+        segmentation_method: str,
+        index_path: pathlib.Path | None = None) -> int:
+    """Reduce the number of concurrent jobs to fit into a memory budget
+
+    The memory required for processing each dataset with a single
+    process is estimated (see :func:`.fit_job_to_memory`) and the
+    largest estimate determines how many jobs may run at the same time.
+    """
+    seg_code = cm.get_segmenters()[segmentation_method].get_ppid_code()
+    dataset_index = DatasetIndex(index_path) if index_path else None
+    min_job_memory = 0
+    for pi, _ in path_pairs:
+        try:
+            with InputProbe(pi, dataset_index) as probe:
+                _, _, memory = fit_job_to_memory(
+                    max_memory=max_memory,
+                    image_shape=probe.image_shape,
+                    event_count=probe.event_count,
+                    num_procs=1,
+                    segmenter_code=seg_code)
+        except Exception:
+            # Problems are reported when the dataset is processed.
+            continue
+        min_job_memory = max(min_job_memory, memory)
+    return get_max_concurrent_jobs(max_memory=max_memory,
+                                   min_job_memory=min_job_memory,
+                                   concurrent_jobs=num_jobs)
+
+
+def _init_job_process(verbose):
+    """Set up logging in a job process (spawned processes start blank)"""
+    cm.setup_root_logger(verbose=verbose)
+
+
+def process_datasets_concurrently(
+        path_pairs: Iterable[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_jobs: int,
+        num_cpus: int,
+        verbose: bool = False,
+        **process_kwargs):
+    """Process several datasets at the same time
+
+    Every dataset is processed with :func:`.process_dataset` in a
+    separate job process, each running its own `DCNumJobRunner`.
+    Separate processes (instead of threads) make sure that the dcnum
+    logs of the individual jobs do not get mixed up. The CPU budget
+    `num_cpus` is split among the `num_jobs` job slots and a new job
+    is started with the CPU count of a slot as soon as that slot
+    becomes available.
+
+    Parameters
+    ----------
+    path_pairs:
+        tuples (path_in, path_out) in processing order; this may be a
+        generator that is consumed while the datasets are processed
+    num_jobs:
+        maximum number of jobs running at the same time
+    num_cpus:
+        total number of CPUs to distribute among the jobs
+    verbose:
+        whether to print debugging log messages in the job processes
+    process_kwargs:
+        keyword arguments for :func:`.process_dataset`, excluding
+        `path_in`, `path_out`, and `num_cpus`
+
+    Returns
+    -------
+    failed: int
+        number of failed jobs, analogous to the return value of
+        :func:`.process_dataset`
+
+    Notes
+    -----
+    Like in serial processing, the first job that raises an exception
+    stops the batch: No new jobs are started, the running jobs are
+    allowed to finish, and the exception of the failed job that comes
+    first in `path_pairs` is raised.
+    """
+    slots = split_cpu_budget(num_cpus, num_jobs)
+    path_pairs = iter(path_pairs)
+    futures = {}
+    errors = {}
+    failed = 0
+    index = 0
+    with ProcessPoolExecutor(max_workers=len(slots),
+                             mp_context=mp_spawn,
+                             initializer=_init_job_process,
+                             initargs=(verbose,)) as pool:
+        while True:
+            # Occupy all free slots
+            while slots and not errors:
+                pair = next(path_pairs, None)
+                if pair is None:
+                    break
+                pi, po = pair
+                cpus = slots.pop(0)
+                click.secho(f"\nProcessing {pi} ({cpus} CPUs)")
+                fut = pool.submit(process_dataset,
+                                  path_in=pi,
+                                  path_out=po,
+                                  num_cpus=cpus,
+                                  # only JSON lines can be interleaved
+                                  show_progress=process_kwargs.get(
+                                      "progress_format") == "json",
+                                  **process_kwargs)
+                futures[fut] = (index, pi, cpus)
+                index += 1
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx, pi, cpus = futures.pop(fut)
+                slots.append(cpus)
+                try:
+                    failed += fut.result()
+                except BaseException as e:
+                    errors[idx] = e
+                else:
+                    click.secho(f"Finished {pi}")
+    if errors:
+        raise errors[min(errors)]
+    return failed
+
+
+def process_datasets_prefetched(
+        path_pairs: Iterable[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_cpus: int,
+        show_progress: bool = True,
+        progress_format: Literal["text", "json"] = "text",
+        print_report: bool = False,
+        stage_dir: pathlib.Path | None = None,
+        stage_max_size: int | None = None,
+        write_behind_dir: pathlib.Path | None = None,
+        variants: List[dict] = (),
+        background_cache_size: int = BACKGROUND_CACHE_SIZE,
+        **process_kwargs):
+    """Process datasets one after another with prefetched preflight
+
+    While one dataset is being processed, the preflight checks of
+    the next dataset (see :func:`.preflight_dataset`) are performed in
+    a background thread. The next job can thus be started right after
+    the current job finished. The messages of the preflight checks
+    are printed when the corresponding job is started. If `stage_dir`
+    is given, the next input file is also copied to that directory
+    in the background (see :class:`.StagingArea`). If `write_behind_dir`
+    is given, the output files are written to that directory and moved
+    to their destination while the next dataset is processed (see
+    :class:`.OutputMover`).
+
+    Parameters
+    ----------
+    path_pairs:
+        tuples (path_in, path_out) in processing order; this may be a
+        generator that is consumed while the datasets are processed
+    num_cpus:
+        number of CPUs to use for each job
+    show_progress:
+        whether to print the progress of each job
+    progress_format:
+        format of the progress updates (see :func:`.run_job`)
+    print_report:
+        whether to print the performance report of each job
+    stage_dir:
+        staging directory for the input files
+    stage_max_size:
+        maximum size of the staging directory in bytes
+    write_behind_dir:
+        local directory for the output files
+    variants:
+        pipeline variants for every dataset (see
+        :func:`.preflight_variants`)
+    background_cache_size:
+        maximum size of the background cache in bytes (see
+        :func:`.run_job`)
+    process_kwargs:
+        keyword arguments for :func:`.process_dataset`, excluding
+        `path_in`, `path_out`, and `num_cpus`
+
+    Returns
+    -------
+    failed: int
+        number of failed jobs, analogous to the return value of
+        :func:`.process_dataset`
+    """
+    failed = 0
+    if variants:
+        preflight = functools.partial(preflight_variants, variants=variants)
+    else:
+        preflight = preflight_dataset
+    # tuples (path_in, messages) of the datasets passed to `prefetch`
+    items = collections.deque()
+    if stage_dir is not None and not process_kwargs.get("dry_run"):
+        staging_area = StagingArea(stage_dir, stage_max_size)
+    else:
+        staging_area = None
+    if write_behind_dir is not None and not process_kwargs.get("dry_run"):
+        output_mover = OutputMover(write_behind_dir)
+    else:
+        output_mover = None
+    try:
+        def iter_kwargs():
+            for pi, po in path_pairs:
+                msgs = []
+                items.append((pi, msgs))
+                yield dict(path_in=pi,
+                           path_out=po,
+                           num_cpus=num_cpus,
+                           echo=msgs.append,
+                           staging_area=staging_area,
+                           output_mover=output_mover,
+                           **process_kwargs)
+
+        with contextlib.ExitStack() as stack:
+            # Make sure pending preflight checks are cancelled on errors
+            futures = stack.enter_context(
+                contextlib.closing(prefetch(preflight, iter_kwargs())))
+            if staging_area is not None:
+                # Closed before the prefetch thread is joined, because the
+                # prefetch thread might be waiting for space in the staging
+                # area.
+                stack.callback(staging_area.close)
+            for fut in futures:
+                pi, msgs = items.popleft()
+                click.secho(f"\nProcessing {pi}")
+                try:
+                    result = fut.result()
+                finally:
+                    for msg in msgs:
+                        click.echo(msg)
+                run_kwargs = dict(
+                    show_progress=show_progress,
+                    index_path=process_kwargs.get("index_path"),
+                    progress_format=progress_format,
+                    print_report=print_report,
+                    staging_area=staging_area,
+                    output_mover=output_mover,
+                    background_cache_size=background_cache_size)
+                if variants:
+                    failed += run_variant_jobs(result, **run_kwargs)
+                elif result is not None:
+                    failed += run_job(result, **run_kwargs)
+    finally:
+        if output_mover is not None:
+            # Wait for the output files of the last jobs
+            failed += close_output_mover(output_mover)
+    return failed
+
+
+def process_datasets_watched(
+        path_pairs: Iterable[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_cpus: int,
+        show_progress: bool = True,
+        **process_kwargs):
+    """Process datasets as they arrive in a watched directory
+
+    Unlike in :func:`process_datasets_prefetched`, the next dataset
+    is not prepared ahead of time, because `path_pairs` (see
+    :func:`.iter_watched_path_pairs`) only yields a dataset when it
+    is complete, and waiting for it would delay the current dataset.
+    A dataset that cannot be processed does not stop the watch mode.
+
+    Parameters
+    ----------
+    path_pairs:
+        tuples (path_in, path_out) of the datasets to process
+    num_cpus:
+        number of CPUs to use for each job
+    show_progress:
+        whether to print the progress of each job
+    process_kwargs:
+        keyword arguments for :func:`.process_dataset`, excluding
+        `path_in`, `path_out`, and `num_cpus`
+
+    Returns
+    -------
+    failed: int
+        number of failed jobs, analogous to the return value of
+        :func:`.process_dataset`
+    """
+    failed = 0
+    for pi, po in path_pairs:
+        click.secho(f"\nProcessing {pi}")
+        try:
+            failed += process_dataset(path_in=pi,
+                                      path_out=po,
+                                      num_cpus=num_cpus,
+                                      show_progress=show_progress,
+                                      **process_kwargs)
+        except click.ClickException as e:
+            e.show()
+            failed += 1
+    return failed
+
+
+def preview_datasets(
+        path_pairs: Iterable[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_cpus: int,
+        show_progress: bool = True,
+        **process_kwargs):
+    """Preview datasets one after another and predict the total time
+
+    Every dataset is previewed with :func:`.preview_dataset`. A dataset
+    that cannot be previewed does not stop the batch. The predicted
+    time for processing all datasets (one after another with
+    `num_cpus` CPUs) is printed at the end.
+
+    Parameters
+    ----------
+    path_pairs:
+        tuples (path_in, path_out) of the datasets to preview
+    num_cpus:
+        number of CPUs to use for each job
+    show_progress:
+        whether to print the progress of each job
+    process_kwargs:
+        keyword arguments for :func:`.process_dataset`, excluding
+        `path_in`, `path_out`, and `num_cpus`
+
+    Returns
+    -------
+    failed: int
+        number of datasets that could not be previewed
+    """
+    failed = 0
+    num_files = 0
+    predicted_time = 0
+    for pi, po in path_pairs:
+        click.secho(f"\nPreviewing {pi}")
+        try:
+            estimate = preview_dataset(path_in=pi,
+                                       path_out=po,
+                                       num_cpus=num_cpus,
+                                       show_progress=show_progress,
+                                       **process_kwargs)
+        except click.ClickException as e:
+            e.show()
+            failed += 1
+        else:
+            num_files += 1
+            predicted_time += estimate["predicted_time"]
+    click.secho(f"\nPredicted time for {num_files} files:\t"
+                f"{format_duration(predicted_time)}")
+    return failed
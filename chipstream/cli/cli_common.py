@@ -49,6 +49,15 @@ def format_help_class_method_info(info_list):
     return "\n".join(choices)
 
 
+def setup_root_logger(verbose=False):
+    """Tell the root logger to pretty-print logs"""
+    root_logger = logging.getLogger()
+    handler = logging.StreamHandler()
+    handler.setFormatter(PrettyFormatter())
+    root_logger.addHandler(handler)
+    handler.setLevel(logging.DEBUG if verbose else logging.WARNING)
+
+
 def get_choices_help_string(class_dict, static_kw_methods=None):
     """Return a chipstream help string for this class
 
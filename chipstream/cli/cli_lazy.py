@@ -0,0 +1,53 @@
+"""Click helpers that defer expensive imports
+
+Importing dcnum (and thus torch) takes seconds. The CLI must not pay
+for these imports when it is only asked for its version or when the
+user made a typo on the command line. The classes in this module
+must therefore not import dcnum at module level.
+"""
+from typing import Callable, Iterable
+
+import click
+
+
+class LazyChoice(click.Choice):
+    def __init__(self,
+                 get_choices: Callable[[], Iterable[str]],
+                 case_sensitive: bool = True):
+        """A :class:`click.Choice` that determines its choices when needed
+
+        Parameters
+        ----------
+        get_choices:
+            function returning the available choices
+        case_sensitive:
+            see :class:`click.Choice`
+        """
+        # Do not call `super().__init__`, it would set `choices`.
+        self.get_choices = get_choices
+        self.case_sensitive = case_sensitive
+        self._choices = None
+
+    @property
+    def choices(self) -> tuple:
+        if self._choices is None:
+            self._choices = tuple(self.get_choices())
+        return self._choices
+
+
+class LazyHelpCommand(click.Command):
+    def __init__(self, *args, help_callback: Callable[[], str], **kwargs):
+        """A :class:`click.Command` that creates its help text when needed
+
+        Parameters
+        ----------
+        help_callback:
+            function returning the help text of the command
+        """
+        super(LazyHelpCommand, self).__init__(*args, **kwargs)
+        self.help_callback = help_callback
+
+    def format_help_text(self, ctx, formatter):
+        if self.help is None:
+            self.help = self.help_callback()
+        super(LazyHelpCommand, self).format_help_text(ctx, formatter)
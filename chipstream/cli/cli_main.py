@@ -1,38 +1,36 @@
-import logging
 import multiprocessing as mp
 import pathlib
+import re
+import shlex
 import sys
 
 import click
-import dcnum
-from dcnum.common import cpu_count
-from dcnum.segm.segm_torch import torch_setup
 
 from .._version import version
+from ..dataset_index import DatasetIndex, get_default_index_path
+from ..discovery import iter_input_files
 
-from . import cli_common as cm
-from .cli_proc import process_dataset
+from .cli_lazy import LazyChoice, LazyHelpCommand
 
+# Note that dcnum (and with it torch) is only imported when needed, so
+# that `--version`, invalid arguments, and dry runs are fast.
 
-def print_system_info(ctx, param, value):
-    if not value or ctx.resilient_parsing:
-        return
-    print("chipstream version:\t", version)
-    print("dcnum version:\t", dcnum.__version__)
-    print("installed segmenters:\t",
-          ", ".join(cm.get_segmenters().keys()))
-    print("available segmenters:\t",
-          ", ".join(cm.get_available_segmenters().keys()))
-    try:
-        has_cuda = torch_setup.torch.cuda.is_available()
-    except BaseException:
-        has_cuda = False
-    print("CUDA compute available:\t", str(has_cuda).lower())
-    ctx.exit()
 
+def get_background_method_choices():
+    from . import cli_common as cm
+    return sorted(cm.get_available_background_methods().keys())
 
-@click.command(name="chipstream-cli",
-               help=f"""
+
+def get_segmentation_method_choices():
+    # Checking whether a segmenter is available may require importing
+    # torch, which is why availability is checked in `chipstream_cli`.
+    from . import cli_common as cm
+    return sorted(cm.get_segmenters().keys())
+
+
+def get_help_text():
+    from . import cli_common as cm
+    return f"""
 Segmentation and feature extraction for deformability cytometry data.
 
 Read the image data from an input file, perform segmentation, feature
@@ -65,11 +63,202 @@ Process an .rtdc measurement, without computing the Haralick texture features::
 
  chipstream-cli -kf haralick=False M001_data.rtdc
 
+Segment an .rtdc measurement with two different thresholds, computing
+the background only once (output files "M001_data_dcn.rtdc" and
+"M001_data_t4_dcn.rtdc")::
+
+ chipstream-cli -ks thresh=-6 --variant "t4:-ks thresh=-4" M001_data.rtdc
+
 Recursively analyze a directory containing .rtdc files::
 
  chipstream-cli --recursive directory_name
 
-""")
+Submit a job to a job server started with ``chipstream-cli serve``, which
+keeps the pipeline loaded between jobs (see ``chipstream-cli submit --help``)::
+
+ chipstream-cli submit M001_data.rtdc
+
+"""
+
+
+def check_segmenters_available(segmentation_method, variants=()):
+    """Make sure that the segmenters of a run (and its variants) can be used
+
+    Checking the availability may require importing torch.
+    """
+    from . import cli_common as cm
+    if not cm.get_segmenters()[segmentation_method].is_available():
+        raise click.BadParameter(
+            f"The segmenter '{segmentation_method}' is not available "
+            f"(see `--info`).",
+            param_hint="'-s' / '--segmentation-method'")
+    for variant in variants:
+        seg_method = variant.get("segmentation_method", segmentation_method)
+        seg_cls = cm.get_segmenters().get(seg_method)
+        if seg_cls is None or not seg_cls.is_available():
+            raise click.BadParameter(
+                f"The segmenter '{seg_method}' of variant "
+                f"'{variant['name']}' is not available (see `--info`).",
+                param_hint="'--variant'")
+
+
+def get_recursive_path_pairs(path_in, path_out=None, **discovery_kwargs):
+    """Return tuples (path_in, path_out) for all input files in a directory
+
+    See :func:`iter_recursive_path_pairs` for the parameters.
+    """
+    return list(iter_recursive_path_pairs(path_in, path_out,
+                                          **discovery_kwargs))
+
+
+def iter_recursive_path_pairs(path_in, path_out=None, include=None,
+                              exclude=(), max_depth=None):
+    """Yield tuples (path_in, path_out) for all input files in a directory
+
+    The input files are yielded in alphabetical order while the
+    directory tree is being searched (see :class:`.InputDiscovery`).
+    If `path_out` is None, the output files are placed next to the
+    input files. Otherwise, the directory tree of `path_in` is mirrored
+    in `path_out`. The file name patterns `include` (defaults to
+    "*.rtdc") and `exclude` as well as the maximum directory depth
+    `max_depth` restrict the search. Output files ("*_dcn.rtdc") are
+    always excluded.
+    """
+    for pi in iter_input_files(path_in,
+                               include=include or ["*.rtdc"],
+                               exclude=["*_dcn.rtdc"] + list(exclude),
+                               max_depth=max_depth):
+        yield pi, get_recursive_path_out(path_in, pi, path_out)
+
+
+def iter_watched_path_pairs(path_in, path_out=None, include=None,
+                            exclude=(), max_depth=None):
+    """Yield tuples (path_in, path_out) for new input files in a directory
+
+    This yields the files that exist and all files that are created
+    later on, as soon as they are complete (see :class:`.FolderWatcher`).
+    The generator does not stop by itself. See
+    :func:`iter_recursive_path_pairs` for the parameters.
+    """
+    from ..watch import FolderWatcher
+    watcher = FolderWatcher(path_in,
+                            include=include or ["*.rtdc"],
+                            exclude=["*_dcn.rtdc"] + list(exclude),
+                            max_depth=max_depth)
+    for pi in watcher:
+        yield pi, get_recursive_path_out(path_in, pi, path_out)
+
+
+def get_recursive_path_out(path_in, path_in_file, path_out=None):
+    """Return the output path for an input file in a directory tree
+
+    If `path_out` is None, None is returned (output file next to
+    the input file). Otherwise, the directory tree of `path_in` is
+    mirrored in `path_out`.
+    """
+    if path_out is None:
+        return None
+    poi = path_out / path_in_file.relative_to(path_in)
+    return poi.with_name(poi.stem + "_dcn.rtdc")
+
+
+def validate_variants(ctx, param, value):
+    """Parse pipeline variants given as "NAME:OPTIONS"
+
+    OPTIONS are the segmentation method (``-s``) and keyword arguments
+    for segmentation (``-ks``), feature extraction (``-kf``), and
+    gating (``-kg``), e.g. "t4:-ks thresh=-4". Returns a list of
+    dictionaries (see :func:`.preflight_variants`).
+    """
+    options = {"-s": "segmentation_method",
+               "-ks": "segmentation_kwargs",
+               "-kf": "feature_kwargs",
+               "-kg": "gate_kwargs"}
+    variants = []
+    for spec in value:
+        name, _, opts = spec.partition(":")
+        if not re.fullmatch(r"[\w.+-]+", name):
+            raise click.BadParameter(
+                f"Invalid variant '{spec}', expected a name followed by "
+                f"options, e.g. 't4:-ks thresh=-4'")
+        if name in [v["name"] for v in variants]:
+            raise click.BadParameter(f"Duplicate variant name '{name}'")
+        args = shlex.split(opts)
+        if len(args) % 2 or not args:
+            raise click.BadParameter(
+                f"Invalid options '{opts}' for variant '{name}', expected "
+                f"pairs of an option and a value, e.g. '-ks thresh=-4'")
+        variant = {"name": name}
+        for opt, val in zip(args[::2], args[1::2]):
+            if opt not in options:
+                raise click.BadParameter(
+                    f"Invalid option '{opt}' for variant '{name}', "
+                    f"expected one of {', '.join(options)}")
+            if opt == "-s":
+                variant[options[opt]] = val.lower()
+            else:
+                variant.setdefault(options[opt], []).append(val)
+        variants.append(variant)
+    return variants
+
+
+def validate_background_cache_size(ctx, param, value):
+    from ..memory import parse_memory
+    try:
+        if value.strip().lower() == "auto":
+            raise ValueError(f"Invalid size '{value}', expected e.g. "
+                             f"'2G' or '0'")
+        return parse_memory(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def validate_max_memory(ctx, param, value):
+    if value is None:
+        return None
+    from ..memory import parse_memory
+    try:
+        return parse_memory(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def validate_stage_max_size(ctx, param, value):
+    if value is None:
+        return None
+    from ..memory import parse_memory
+    try:
+        if value.strip().lower() == "auto":
+            raise ValueError(f"Invalid size '{value}', expected e.g. "
+                             f"'500G'")
+        return parse_memory(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def print_system_info(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+    import dcnum
+    from dcnum.segm.segm_torch import torch_setup
+    from . import cli_common as cm
+    print("chipstream version:\t", version)
+    print("dcnum version:\t", dcnum.__version__)
+    print("installed segmenters:\t",
+          ", ".join(cm.get_segmenters().keys()))
+    print("available segmenters:\t",
+          ", ".join(cm.get_available_segmenters().keys()))
+    try:
+        has_cuda = torch_setup.torch.cuda.is_available()
+    except BaseException:
+        has_cuda = False
+    print("CUDA compute available:\t", str(has_cuda).lower())
+    ctx.exit()
+
+
+@click.command(name="chipstream-cli",
+               cls=LazyHelpCommand,
+               help_callback=get_help_text)
 @click.argument("path_in",
                 type=click.Path(exists=True,
                                 dir_okay=True,
@@ -83,9 +272,8 @@ Recursively analyze a directory containing .rtdc files::
                                 path_type=pathlib.Path),
                 )
 @click.option("-b", "--background-method",
-              type=click.Choice(
-                  sorted(cm.get_available_background_methods().keys()),
-                  case_sensitive=False),
+              type=LazyChoice(get_background_method_choices,
+                              case_sensitive=False),
               default="sparsemed", show_default=True,
               help="Background computation method to use.")
 @click.option("-kb", "background_kwargs",
@@ -95,8 +283,8 @@ Recursively analyze a directory containing .rtdc files::
               metavar="KEY=VALUE",
               )
 @click.option("-s", "--segmentation-method",
-              type=click.Choice(sorted(cm.get_available_segmenters().keys()),
-                                case_sensitive=False),
+              type=LazyChoice(get_segmentation_method_choices,
+                              case_sensitive=False),
               default="thresh", show_default=True,
               help="Segmentation method to use.")
 @click.option("-ks", "segmentation_kwargs",
@@ -116,6 +304,27 @@ Recursively analyze a directory containing .rtdc files::
               help="Optional ``KEY=VALUE`` argument for event gating.",
               metavar="KEY=VALUE",
               )
+@click.option("--variant", "variants",
+              multiple=True, callback=validate_variants,
+              metavar="NAME:OPTIONS",
+              help="Additional pipeline variant for a parameter study, "
+                   "e.g. 't4:-ks thresh=-4'. OPTIONS may contain ``-s``, "
+                   "``-ks``, ``-kf``, and ``-kg`` and replace the "
+                   "corresponding options above. Each variant is written "
+                   "to its own output file (e.g. 'M001_data_NAME_dcn.rtdc'). "
+                   "The background is only computed once for all "
+                   "variants. Can be specified multiple times.")
+@click.option("-kd", "flickering_kwargs",
+              multiple=True,
+              help="Optional ``KEY=VALUE`` argument for flickering "
+                   "detection, which determines ``offset_correction`` "
+                   "for the 'sparsemed' background method if not given "
+                   "via ``-kb``. By default, the first 'max_frames' frames "
+                   "are analyzed. Set 'num_chunks' to sample these frames "
+                   "from evenly spaced image chunks instead, which keeps "
+                   "the amount of data read independent of dataset size.",
+              metavar="KEY=VALUE",
+              )
 @click.option("-p", "--pixel-size", type=float, default=0,
               help="Set/override the pixel size for feature "
                    "extraction [µm].")
@@ -134,17 +343,147 @@ Recursively analyze a directory containing .rtdc files::
               help="Data compression algorithm and level, either 'none' or "
                    "one of 'zstd-1' to 'zstd-9'. Decrease compression level "
                    "when the CPU is too slow, increase it when this disk "
-                   "is too slow.")
+                   "is too slow. With 'auto', the level with the highest "
+                   "throughput is determined by compressing sample data "
+                   "of the input file and measuring the write speed of "
+                   "the output directory. The result is cached for each "
+                   "machine and output directory.")
+@click.option("--override", is_flag=True,
+              help="Replace existing output files that were created with "
+                   "a different pipeline. Output files that were created "
+                   "with the same pipeline are always skipped.")
+@click.option("--no-index", is_flag=True,
+              help="Do not use the persistent dataset index. By default, "
+                   "ChipStream remembers metadata of input files and the "
+                   "pipeline hashes of output files, so that repeated runs "
+                   "do not have to open unchanged HDF5 files.")
+@click.option("--recompute-flickering", is_flag=True,
+              help="Detect image flickering for the 'sparsemed' background "
+                   "method even if the result for an input file is already "
+                   "in the dataset index.")
 @click.option("-r", "--recursive", is_flag=True,
               help="Recurse into subdirectories.")
+@click.option("--include", "include", multiple=True, metavar="PATTERN",
+              help="Only process input files whose names match this "
+                   "pattern (e.g. 'M00*.rtdc') in recursive mode. Can be "
+                   "specified multiple times. Defaults to '*.rtdc'.")
+@click.option("--exclude", "exclude", multiple=True, metavar="PATTERN",
+              help="Ignore files and directories whose names match this "
+                   "pattern (e.g. '.snapshot' or '*_raw.rtdc') in "
+                   "recursive mode. Can be specified multiple times.")
+@click.option("--max-depth", type=click.IntRange(min=0),
+              help="Maximum depth of the subdirectories to search in "
+                   "recursive mode (0 means only PATH_IN itself).")
+@click.option("--watch", is_flag=True,
+              help="Keep watching PATH_IN (recursive mode) and process "
+                   "new input files as soon as they are completely "
+                   "written. The directory tree is polled every few "
+                   "seconds. Press Ctrl+C to stop.")
+@click.option("--order",
+              type=click.Choice(["alphabetical", "largest", "smallest",
+                                 "cost"]),
+              default="alphabetical", show_default=True,
+              help="Order in which the input files are processed in "
+                   "recursive mode. 'largest' (file size) and 'cost' "
+                   "(number of events times image size) process the "
+                   "most expensive files first, which keeps concurrent "
+                   "jobs (``-j``) from ending with a single long job. "
+                   "'smallest' yields the first results quickly.")
 @click.option("--num-cpus",
-              type=click.IntRange(min=1,
-                                  max=cpu_count(),
-                                  clamp=True),
-              help="Number of processes to create."
+              type=click.IntRange(min=1),
+              help="Number of processes to create (at most the number "
+                   "of CPUs)."
               )
+@click.option("-j", "--concurrent-jobs",
+              type=click.IntRange(min=1),
+              default=1, show_default=True,
+              help="Number of datasets to process at the same time in "
+                   "recursive mode. The CPUs given by ``--num-cpus`` are "
+                   "split among the concurrent jobs. Use this for "
+                   "directories with many small files.")
+@click.option("--max-memory", type=str, callback=validate_max_memory,
+              help="Memory budget for processing, e.g. '64G', or 'auto' "
+                   "for the memory currently available. The memory usage "
+                   "of each job is estimated from the image size and "
+                   "the number of processes per job (``--num-cpus``), "
+                   "the image chunk size, and the number of concurrent "
+                   "jobs (``-j``) are reduced so that the budget is not "
+                   "exceeded.")
+@click.option("--stage-dir",
+              type=click.Path(file_okay=False,
+                              writable=True,
+                              resolve_path=True,
+                              path_type=pathlib.Path),
+              help="Copy each input file to this directory (e.g. on a "
+                   "local SSD or tmpfs) and process the copy, which is "
+                   "removed afterwards. In recursive mode, the next input "
+                   "file is copied while the current file is processed. "
+                   "Use this for input files on slow network shares.")
+@click.option("--stage-max-size", type=str,
+              callback=validate_stage_max_size,
+              help="Maximum total size of the files in ``--stage-dir``, "
+                   "e.g. '100G'. Input files that do not fit are processed "
+                   "without staging.")
+@click.option("--write-behind-dir",
+              type=click.Path(file_okay=False,
+                              writable=True,
+                              resolve_path=True,
+                              path_type=pathlib.Path),
+              help="Write each output file to this directory (e.g. on a "
+                   "local SSD) and move it to its destination when the "
+                   "job is done. In recursive mode, the output file is "
+                   "moved while the next file is processed. The moved "
+                   "files are verified (size and hash) and failed moves "
+                   "are retried. Use this for output files on slow "
+                   "network shares.")
+@click.option("--background-cache-size", type=str, default="2G",
+              show_default=True, callback=validate_background_cache_size,
+              help="Maximum size of the background cache in the user "
+                   "cache directory. Computed background data are "
+                   "cached for every input file and background method, "
+                   "so that processing the same file again with a "
+                   "different segmenter, feature extraction, or gating "
+                   "does not compute the background again. The least "
+                   "recently used data are removed when the cache is "
+                   "full. Set to '0' to disable the cache.")
 @click.option("--dry-run", is_flag=True,
               help="Only print the pipeline identifiers and exit.")
+@click.option("--plan", "plan_path",
+              type=click.Path(dir_okay=False,
+                              writable=True,
+                              resolve_path=True,
+                              path_type=pathlib.Path),
+              help="Write the pipeline identifiers, pipeline hash, output "
+                   "path, and output state of every input file (and of "
+                   "every ``--variant``) to a JSON "
+                   "or CSV file (depending on the file suffix) and exit "
+                   "without processing anything. Input files are planned "
+                   "in parallel using ``--num-cpus`` threads.")
+@click.option("--preview", is_flag=True,
+              help="Only process an evenly spread sample of about 1000 "
+                   "events of each input file and predict the time of a "
+                   "full run from the event rate of the sample. The "
+                   "sample is written to a preview output file (suffix "
+                   "'_preview_dcn.rtdc') that is replaced in every run. "
+                   "Use this to check the pipeline settings and to plan "
+                   "large batches.")
+@click.option("--progress", "progress",
+              type=click.Choice(["text", "json", "none"]),
+              default="text", show_default=True,
+              help="How to report the progress of running jobs. With "
+                   "'json', every state change and progress update is "
+                   "printed as a single line of JSON containing the keys "
+                   "'event' ('state' or 'progress'), 'path_in', 'state', "
+                   "'progress', 'events', 'frames_per_second', "
+                   "'events_per_second', 'bytes_written', and 'elapsed'. "
+                   "In this mode, the progress of concurrent jobs "
+                   "(``-j``) is reported as well.")
+@click.option("--report", "print_report", is_flag=True,
+              help="Print a performance report (time spent in each "
+                   "processing step, event rate, CPU utilization, peak "
+                   "memory, output size) after each job. The report is "
+                   "always written to a JSON file next to the output "
+                   "file (suffix '_report.json').")
 @click.option("--verbose", is_flag=True,
               help="Yield a more verbose output.")
 @click.option("--debug", is_flag=True,
@@ -162,16 +501,55 @@ def chipstream_cli(
     segmentation_kwargs=None,
     feature_kwargs=None,
     gate_kwargs=None,
+    variants=(),
+    flickering_kwargs=None,
     pixel_size=0,
     limit_events="0",
     drain_basins=False,
     compression="zstd-5",
+    override=False,
+    no_index=False,
+    recompute_flickering=False,
     recursive=False,
+    include=(),
+    exclude=(),
+    max_depth=None,
+    watch=False,
+    order="alphabetical",
     num_cpus=None,
+    concurrent_jobs=1,
+    max_memory=None,
+    stage_dir=None,
+    stage_max_size=None,
+    write_behind_dir=None,
+    background_cache_size=None,
     dry_run=False,
+    plan_path=None,
+    preview=False,
+    progress="text",
+    print_report=False,
     verbose=False,
     debug=False,
 ):
+    from dcnum.common import cpu_count
+    from . import cli_common as cm
+
+    if preview:
+        for name, value in [("--plan", plan_path is not None),
+                            ("--watch", watch),
+                            ("--dry-run", dry_run),
+                            ("--limit-events", limit_events != "0"),
+                            ("--variant", bool(variants))]:
+            if value:
+                raise click.BadParameter(
+                    f"`{name}` cannot be combined with `--preview`.",
+                    param_hint="'--preview'")
+
+    if not dry_run and plan_path is None:
+        # Dry runs and plans only compute the pipeline identifiers, which
+        # does not require the segmenter to be available (e.g. torch).
+        check_segmenters_available(segmentation_method, variants)
+
     if debug:
         click.secho("Running in debug mode (this will be slow)",
                     fg="yellow")
@@ -194,11 +572,7 @@ def chipstream_cli(
         index_mapping = int(limit_events)
 
     # Tell the root logger to pretty-print logs
-    root_logger = logging.getLogger()
-    handler = logging.StreamHandler()
-    handler.setFormatter(cm.PrettyFormatter())
-    root_logger.addHandler(handler)
-    handler.setLevel(logging.DEBUG if verbose else logging.WARNING)
+    cm.setup_root_logger(verbose=verbose)
 
     mp.freeze_support()
 
@@ -214,29 +588,154 @@ def chipstream_cli(
         # Below this line are arguments that do not define the pipeline ID
         basin_strategy="drain" if drain_basins else "tap",
         compression=compression,
-        num_cpus=num_cpus or cpu_count(),
         dry_run=dry_run,
         debug=debug,
+        override=override,
+        index_path=None if no_index else get_default_index_path(),
+        recompute_flickering=recompute_flickering,
+        flickering_kwargs=flickering_kwargs,
+        progress_format="json" if progress == "json" else "text",
+        print_report=print_report,
+        max_memory=max_memory,
+        stage_dir=stage_dir,
+        stage_max_size=stage_max_size,
+        write_behind_dir=write_behind_dir,
+        variants=variants,
+        background_cache_size=background_cache_size,
         )
+    num_cpus = min(num_cpus or cpu_count(), cpu_count())
+    discovery_kwargs = dict(include=include,
+                            exclude=exclude,
+                            max_depth=max_depth)
 
-    if recursive:
+    if plan_path is not None:
+        from .cli_plan import plan_datasets, write_plan
+        if recursive:
+            path_pairs = get_recursive_path_pairs(path_in, path_out,
+                                                  **discovery_kwargs)
+        elif path_in.is_dir():
+            raise click.BadParameter(
+                f"PATH_IN must be a file, but '{path_in}' is a directory. "
+                f"Did you forget to specify the `--recursive` flag?",
+                param_hint="PATH_IN")
+        else:
+            path_pairs = [(path_in, path_out)]
+        plan_kwargs = {k: process_kwargs[k] for k in [
+            "background_method", "background_kwargs", "segmentation_method",
+            "segmentation_kwargs", "feature_kwargs", "gate_kwargs",
+            "pixel_size", "index_mapping", "index_path",
+            "recompute_flickering", "flickering_kwargs", "variants"]}
+        plans = plan_datasets(path_pairs, num_threads=num_cpus, **plan_kwargs)
+        write_plan(plan_path, plans, settings=plan_kwargs)
+        states = [p["out_state"] for p in plans]
+        click.secho(f"Planned {len(plans)} files ("
+                    f"{states.count('missing')} missing, "
+                    f"{states.count('stale')} stale, "
+                    f"{states.count('current')} up to date, "
+                    f"{states.count('error')} errors): {plan_path}")
+        failed = states.count("error")
+        if failed:
+            click.secho(f"Could not plan {failed} files", fg="red")
+        exit_code = bool(failed)
+    elif preview:
+        from .cli_batch import preview_datasets
+        if recursive:
+            path_pairs = iter_recursive_path_pairs(path_in, path_out,
+                                                   **discovery_kwargs)
+        elif path_in.is_dir():
+            raise click.BadParameter(
+                f"PATH_IN must be a file, but '{path_in}' is a directory. "
+                f"Did you forget to specify the `--recursive` flag?",
+                param_hint="PATH_IN")
+        else:
+            path_pairs = [(path_in, path_out)]
+        failed = preview_datasets(path_pairs=path_pairs,
+                                  num_cpus=num_cpus,
+                                  show_progress=progress != "none",
+                                  **process_kwargs)
+        if failed:
+            click.secho(f"Could not preview {failed} files", fg="red")
+        exit_code = bool(failed)
+    elif watch:
+        if not path_in.is_dir():
+            raise click.BadParameter(
+                f"PATH_IN must be a directory in watch mode, but "
+                f"'{path_in}' is a file.",
+                param_hint="PATH_IN")
+        from .cli_batch import process_datasets_watched
+        click.secho(f"Watching {path_in} for new files (press Ctrl+C to "
+                    f"stop)")
+        path_pairs = iter_watched_path_pairs(path_in, path_out,
+                                             **discovery_kwargs)
+        process_datasets_watched(path_pairs=path_pairs,
+                                 num_cpus=num_cpus,
+                                 show_progress=progress != "none",
+                                 **process_kwargs)
+        exit_code = 0
+    elif recursive:
         failed = 0  # keeps track of files that failed to process
-        for pi in sorted(path_in.rglob("*.rtdc")):
-            if pi.name.endswith("_dcn.rtdc"):
-                continue
-            if path_out is not None:
-                poi = path_out / pi.relative_to(path_in)
-                po = poi.with_name(poi.stem + "_dcn.rtdc")
-                po.parent.mkdir(parents=True, exist_ok=True)
-            else:
-                po = None
-            click.secho(f"\nProcessing {pi}")
-            failed += process_dataset(path_in=pi,
-                                      path_out=po,
-                                      **process_kwargs)
-            if dry_run:
+        # Processing starts while the directory tree is still searched.
+        path_pairs = iter_recursive_path_pairs(path_in, path_out,
+                                               **discovery_kwargs)
+        if order != "alphabetical" and not dry_run:
+            from ..job_order import order_paths
+            index_path = process_kwargs["index_path"]
+            path_pairs = order_paths(
+                path_pairs,
+                strategy=order,
+                key=lambda pp: pp[0],
+                dataset_index=DatasetIndex(index_path) if index_path else None)
+
+        if concurrent_jobs > 1 and not dry_run and not debug:
+            from .cli_batch import (
+                limit_concurrent_jobs, process_datasets_concurrently
+            )
+            if max_memory:
+                # All input files are required for the memory estimate.
+                path_pairs = list(path_pairs)
+                num_jobs = limit_concurrent_jobs(
+                    path_pairs=path_pairs,
+                    num_jobs=concurrent_jobs,
+                    max_memory=max_memory,
+                    segmentation_method=segmentation_method,
+                    index_path=process_kwargs["index_path"])
+                if num_jobs < concurrent_jobs:
+                    click.secho(f"Running {num_jobs} instead of "
+                                f"{concurrent_jobs} concurrent jobs due "
+                                f"to the memory budget", fg="yellow")
+                concurrent_jobs = num_jobs
+                # Each job gets its share of the memory budget
+                process_kwargs["max_memory"] = max_memory // num_jobs
+            if stage_max_size:
+                # Each job has its own staging area
+                process_kwargs["stage_max_size"] = \
+                    stage_max_size // concurrent_jobs
+            failed += process_datasets_concurrently(
+                path_pairs=path_pairs,
+                num_jobs=concurrent_jobs,
+                num_cpus=num_cpus,
+                verbose=verbose,
+                **process_kwargs)
+        elif dry_run:
+            from .cli_proc import process_dataset
+            for pi, po in path_pairs:
+                click.secho(f"\nProcessing {pi}")
+                failed += process_dataset(path_in=pi,
+                                          path_out=po,
+                                          num_cpus=num_cpus,
+                                          show_progress=progress != "none",
+                                          **process_kwargs)
                 click.secho("Stopping dry run after one iteration")
                 break
+        else:
+            from .cli_batch import process_datasets_prefetched
+            # Preflight checks of the next dataset are performed
+            # while the current dataset is processed.
+            failed += process_datasets_prefetched(
+                path_pairs=path_pairs,
+                num_cpus=num_cpus,
+                show_progress=progress != "none",
+                **process_kwargs)
         if failed:
             click.secho(f"Could not process {failed} files", fg="red")
         exit_code = bool(failed)
@@ -251,9 +750,12 @@ def chipstream_cli(
                         f"'{path_out}' is a directory")
             exit_code = 1
         else:
+            from .cli_proc import process_dataset
             # everything ok
             exit_code = process_dataset(path_in=path_in,
                                         path_out=path_out,
+                                        num_cpus=num_cpus,
+                                        show_progress=progress != "none",
                                         **process_kwargs)
     if exit_code:
         click.secho("Encountered problems during processing", fg="red")
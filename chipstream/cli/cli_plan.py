@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import datetime
+import json
+import pathlib
+from typing import List, Tuple
+
+import click
+
+from .._version import version
+from ..dataset_index import DatasetIndex
+from ..input_probe import InputProbe
+
+from .cli_proc import get_variant_path, plan_job
+
+
+#: Columns of a batch plan (in this order for CSV files)
+PLAN_FIELDS = ["path_in", "path_out", "variant", "event_count", "dat_id",
+               "bg_id", "seg_id", "feat_id", "gate_id", "pphash",
+               "out_state", "error"]
+
+
+def plan_dataset(path_in: pathlib.Path,
+                 path_out: pathlib.Path | None = None,
+                 index_path: pathlib.Path | None = None,
+                 variant: dict | None = None,
+                 **plan_kwargs) -> dict:
+    """Compute the plan for a single dataset
+
+    In contrast to :func:`.plan_job`, problems with the input file
+    do not raise an exception, but are recorded in the "error" field
+    of the returned dictionary with "out_state" set to "error".
+    If a pipeline `variant` is given (see :func:`.preflight_variants`),
+    its options replace those in `plan_kwargs` and the plan is computed
+    for the output file of the variant (see :func:`.get_variant_path`).
+    """
+    if variant is not None:
+        if path_out is None:
+            path_out = path_in.with_name(path_in.stem + "_dcn.rtdc")
+        path_out = get_variant_path(path_out, variant["name"])
+        plan_kwargs = dict(plan_kwargs)
+        plan_kwargs.update({k: v for k, v in variant.items() if k != "name"})
+    dataset_index = DatasetIndex(index_path) if index_path else None
+    try:
+        with InputProbe(path_in, dataset_index) as probe:
+            plan = plan_job(probe=probe,
+                            path_out=path_out,
+                            echo=lambda msg: None,
+                            **plan_kwargs)
+    except click.ClickException as e:
+        plan = {"path_in": path_in,
+                "path_out": path_out,
+                "out_state": "error",
+                "error": e.format_message()}
+    except Exception as e:
+        plan = {"path_in": path_in,
+                "path_out": path_out,
+                "out_state": "error",
+                "error": f"{e.__class__.__name__}: {e}"}
+    plan["variant"] = None if variant is None else variant["name"]
+    return {key: plan.get(key) for key in PLAN_FIELDS}
+
+
+def plan_datasets(
+        path_pairs: List[Tuple[pathlib.Path, pathlib.Path | None]],
+        num_threads: int,
+        variants: List[dict] = (),
+        **plan_kwargs) -> List[dict]:
+    """Compute the plans for several datasets in parallel
+
+    Threads are used, because planning mostly consists of waiting for
+    the file system and the dataset index. Repeated planning is fast,
+    because the input file metadata are taken from the dataset index.
+
+    Parameters
+    ----------
+    path_pairs:
+        list of tuples (path_in, path_out)
+    num_threads:
+        number of datasets to plan at the same time
+    variants:
+        pipeline variants that are planned in addition to the pipeline
+        defined by `plan_kwargs` (see :func:`.preflight_variants`)
+    plan_kwargs:
+        keyword arguments for :func:`plan_dataset`
+
+    Returns
+    -------
+    plans: list of dict
+        one plan for each item in `path_pairs` (same order), followed
+        by one plan for each of the `variants`, see
+        :const:`PLAN_FIELDS` for the keys
+    """
+    with ThreadPoolExecutor(max_workers=max(1, num_threads),
+                            thread_name_prefix="ChipStreamPlan") as pool:
+        futures = [pool.submit(plan_dataset,
+                               path_in=pi,
+                               path_out=po,
+                               variant=variant,
+                               **plan_kwargs)
+                   for pi, po in path_pairs
+                   for variant in [None] + list(variants)]
+        return [fut.result() for fut in futures]
+
+
+def write_plan(path: pathlib.Path,
+               plans: List[dict],
+               settings: dict | None = None):
+    """Write a batch plan to a JSON or CSV file
+
+    The format is determined by the suffix of `path` (".csv" for CSV,
+    JSON otherwise). JSON files additionally contain the ChipStream
+    version, the creation time, and the pipeline `settings`.
+    """
+    path = pathlib.Path(path)
+    rows = []
+    for plan in plans:
+        rows.append({key: str(val) if isinstance(val, pathlib.Path) else val
+                     for key, val in plan.items()})
+    if path.suffix.lower() == ".csv":
+        with path.open("w", newline="", encoding="utf-8") as fd:
+            writer = csv.DictWriter(fd, fieldnames=PLAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        data = {
+            "chipstream version": version,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "settings": settings or {},
+            "datasets": rows,
+        }
+        path.write_text(json.dumps(data, indent=2, default=str),
+                        encoding="utf-8")
@@ -1,17 +1,39 @@
+import json
 import pathlib
-import time
-from typing import List, Literal
+from typing import Callable, List, Literal
+import warnings
 
 import click
 import dcnum.logic
 from dcnum.meta import ppid
-import dcnum.read
 import dcnum.segm
 
+from ..background_cache import BACKGROUND_CACHE_SIZE, BackgroundCache
+from ..compression import get_auto_compression
+from ..dataset_index import DatasetIndex
+from ..input_probe import InputProbe
+from ..job_report import (
+    JobReporter, format_report, get_report_path, write_report
+)
+from ..memory import DEFAULT_CHUNK_SIZE, MiB, fit_job_to_memory
+from ..model_cache import preload_model, sync_model_cache
+from ..output_state import get_output_state
+from ..preview import (
+    extrapolate_runtime, format_estimate, get_preview_mapping,
+    get_preview_path
+)
+from ..progress import (
+    format_status_json, format_status_text, monitor_runner
+)
+from ..resume import ResumableJobRunner, get_shared_background_path
+from ..staging import StagingArea, stage_job, unstage_job
+from ..write_behind import OutputMover, submit_job_output, write_behind_job
+
 from . import cli_common as cm
 from .cli_valid import (
-    validate_background_kwargs, validate_feature_kwargs, validate_gate_kwargs,
-    validate_pixel_size, validate_segmentation_kwargs
+    validate_background_kwargs, validate_feature_kwargs,
+    validate_flickering_kwargs, validate_gate_kwargs,
+    validate_segmentation_kwargs
 )
 
 
@@ -32,22 +54,430 @@ def process_dataset(
     num_cpus: int,
     dry_run: bool,
     debug: bool,
+    override: bool = False,
+    show_progress: bool = True,
+    index_path: pathlib.Path | None = None,
+    recompute_flickering: bool = False,
+    flickering_kwargs: List[str] = (),
+    progress_format: Literal["text", "json"] = "text",
+    print_report: bool = False,
+    max_memory: int | None = None,
+    stage_dir: pathlib.Path | None = None,
+    stage_max_size: int | None = None,
+    write_behind_dir: pathlib.Path | None = None,
+    variants: List[dict] = (),
+    background_cache_size: int = BACKGROUND_CACHE_SIZE,
 ):
+    staging_area = None
+    output_mover = None
+    if stage_dir is not None and not dry_run:
+        # There is no other job to overlap the copy with, but the
+        # workers read from the local copy.
+        staging_area = StagingArea(stage_dir, stage_max_size)
+    if write_behind_dir is not None and not dry_run:
+        output_mover = OutputMover(write_behind_dir)
+    failed = 0
+    try:
+        preflight_kwargs = dict(
+            path_in=path_in,
+            path_out=path_out,
+            background_method=background_method,
+            background_kwargs=background_kwargs,
+            segmentation_method=segmentation_method,
+            segmentation_kwargs=segmentation_kwargs,
+            feature_kwargs=feature_kwargs,
+            gate_kwargs=gate_kwargs,
+            pixel_size=pixel_size,
+            index_mapping=index_mapping,
+            basin_strategy=basin_strategy,
+            compression=compression,
+            num_cpus=num_cpus,
+            dry_run=dry_run,
+            debug=debug,
+            override=override,
+            index_path=index_path,
+            recompute_flickering=recompute_flickering,
+            flickering_kwargs=flickering_kwargs,
+            max_memory=max_memory,
+            staging_area=staging_area,
+            output_mover=output_mover,
+        )
+        run_kwargs = dict(
+            show_progress=show_progress,
+            index_path=index_path,
+            progress_format=progress_format,
+            print_report=print_report,
+            staging_area=staging_area,
+            output_mover=output_mover,
+            background_cache_size=background_cache_size,
+        )
+        if variants:
+            jobs = preflight_variants(variants=variants, **preflight_kwargs)
+            failed += run_variant_jobs(jobs, **run_kwargs)
+        else:
+            job = preflight_dataset(**preflight_kwargs)
+            if job is not None:
+                failed += run_job(job, **run_kwargs)
+    finally:
+        if staging_area is not None:
+            staging_area.close()
+        if output_mover is not None:
+            failed += close_output_mover(output_mover)
+    return failed
+
+
+def preview_dataset(
+    path_in: pathlib.Path,
+    path_out: pathlib.Path | None,
+    index_path: pathlib.Path | None = None,
+    num_events: int | None = None,
+    **process_kwargs
+) -> dict:
+    """Process a sample of a dataset and predict the time of a full run
+
+    Every n-th event of the input file is processed, `num_events`
+    events in total (see :func:`.get_preview_mapping`), so that the
+    preview covers the entire measurement. The preview output file (see
+    :func:`.get_preview_path`) and its performance report are
+    replaced in every run. The prediction (see
+    :func:`.extrapolate_runtime`) is added to the report and printed.
+    Staging, write-behind, the background cache, and pipeline variants
+    are not used, because they would distort the timing of the
+    sample. See :func:`process_dataset` for the keyword arguments.
+    """
+    dataset_index = DatasetIndex(index_path) if index_path else None
+    try:
+        with InputProbe(path_in, dataset_index) as probe:
+            event_count = probe.event_count
+    except Exception:
+        raise click.ClickException(
+            f"Not a valid input file '{path_in}'.")
+    if path_out is None:
+        path_out = path_in.with_name(path_in.stem + "_dcn.rtdc")
+    path_preview = get_preview_path(path_out)
+    path_preview.unlink(missing_ok=True)
+    index_mapping = get_preview_mapping(event_count, num_events)
+    process_kwargs.update(
+        index_mapping=index_mapping,
+        override=True,
+        stage_dir=None,
+        write_behind_dir=None,
+        variants=(),
+        background_cache_size=0,
+    )
+    process_dataset(path_in=path_in,
+                    path_out=path_preview,
+                    index_path=index_path,
+                    **process_kwargs)
+    report = json.loads(get_report_path(path_preview).read_text())
+    estimate = extrapolate_runtime(report, event_count, index_mapping)
+    report["preview"] = estimate
+    write_report(report)
+    click.echo(format_estimate(estimate))
+    return estimate
+
+
+def close_output_mover(output_mover: OutputMover) -> int:
+    """Wait for all output files to be moved and report failed moves
+
+    Returns the number of output files that could not be moved.
+    """
+    if output_mover.num_pending:
+        click.echo("Waiting for output files to be moved...")
+    failed = output_mover.close()
+    for path_local, path_out, error in failed:
+        click.secho(f"Could not move '{path_local}' to '{path_out}': "
+                    f"{error}. The output file is moved without "
+                    f"processing the input file again when you run the "
+                    f"same command again.", fg="red")
+    return len(failed)
+
+
+def preflight_dataset(
+    path_in: pathlib.Path,
+    index_path: pathlib.Path | None = None,
+    echo: Callable = click.echo,
+    staging_area: StagingArea | None = None,
+    output_mover: OutputMover | None = None,
+    **prepare_kwargs
+) -> dcnum.logic.DCNumPipelineJob | None:
+    """Perform all checks on a dataset and return the pipeline job
+
+    This does not start any processing and is safe to call from a
+    background thread (with `echo` collecting the messages for later
+    output). See :func:`prepare_job` for the keyword arguments and
+    the return value. If `staging_area` is given, the input file is
+    copied to the staging area and the returned job reads from the
+    copy (see :func:`.stage_job`). If `output_mover` is given, the
+    returned job writes to its local directory (see
+    :func:`.write_behind_job`).
+    """
+    dataset_index = DatasetIndex(index_path) if index_path else None
+    # The input file is opened at most once for all checks.
+    with InputProbe(path_in, dataset_index) as probe:
+        job = prepare_job(probe=probe, echo=echo, **prepare_kwargs)
+    if job is not None and output_mover is not None:
+        path_out = job["path_out"]
+        job = write_behind_job(job, output_mover)
+        if job is None:
+            echo(f"Moving output file '{path_out}' of a previous run")
+        else:
+            echo(f"Local output:\t{job['path_out']}")
+    if job is not None and staging_area is not None:
+        job = stage_job(job, staging_area)
+        if job["path_in"] != path_in:
+            echo(f"Staged input:\t{job['path_in']}")
+    return job
+
+
+def preflight_variants(
+    path_in: pathlib.Path,
+    path_out: pathlib.Path | None,
+    variants: List[dict],
+    echo: Callable = click.echo,
+    **preflight_kwargs
+) -> List[dcnum.logic.DCNumPipelineJob]:
+    """Perform the checks for several pipeline variants of a dataset
+
+    The first job uses the pipeline defined by `preflight_kwargs` and
+    writes to `path_out`. Every entry in `variants` is a dictionary
+    with the "name" of the variant and keyword arguments that replace
+    the segmentation, feature extraction, or gating arguments in
+    `preflight_kwargs` (see :func:`preflight_dataset`). The output
+    file of a variant is named after the variant (see
+    :func:`get_variant_path`). Returns the jobs that have to be run
+    (see :func:`run_variant_jobs`).
+    """
+    if path_out is None:
+        path_out = path_in.with_name(path_in.stem + "_dcn.rtdc")
+    jobs = []
+    for variant in [{"name": None}] + list(variants):
+        kwargs = dict(preflight_kwargs)
+        kwargs.update({k: v for k, v in variant.items() if k != "name"})
+        if variant["name"] is not None:
+            echo(f"Variant:\t{variant['name']}")
+        job = preflight_dataset(
+            path_in=path_in,
+            path_out=get_variant_path(path_out, variant["name"]),
+            echo=echo,
+            **kwargs)
+        if job is not None:
+            jobs.append(job)
+    return jobs
+
+
+def get_variant_path(path_out: pathlib.Path,
+                     name: str | None) -> pathlib.Path:
+    """Return the output path of a pipeline variant
+
+    The name of the variant is inserted before the "_dcn" suffix, e.g.
+    "M001_data_t4_dcn.rtdc" for the variant "t4", so that the output
+    files of variants are not mistaken for input files in recursive
+    mode. For other file names, the name of the variant is appended.
+    If `name` is None, `path_out` is returned.
+    """
+    if name is None:
+        return path_out
+    stem = path_out.stem
+    if stem.endswith("_dcn"):
+        stem = f"{stem[:-4]}_{name}_dcn"
+    else:
+        stem = f"{stem}_{name}"
+    return path_out.with_name(stem + path_out.suffix)
+
+
+def run_variant_jobs(jobs: List[dcnum.logic.DCNumPipelineJob],
+                     staging_area: StagingArea | None = None,
+                     **run_kwargs) -> int:
+    """Run the jobs of the pipeline variants of a dataset
+
+    The jobs created with :func:`preflight_variants` share the
+    background data: The background is computed by the first job and
+    stored in a temporary input file (see
+    :func:`.get_shared_background_path`), which the other jobs use
+    for segmentation and feature extraction. The staged input file
+    (if any) is released after the last job. If a job fails, the
+    temporary input file is kept, so that the background does not
+    have to be computed again in the next run. See :func:`run_job`
+    for the keyword arguments.
+    """
+    if not jobs:
+        return 0
+    path_background = get_shared_background_path(jobs[0])
+    failed = 0
+    for ii, job in enumerate(jobs):
+        click.echo(f"Running variant {ii + 1} of {len(jobs)} "
+                   f"({job['path_out'].name})")
+        failed += run_job(job,
+                          staging_area=staging_area,
+                          path_background=path_background,
+                          release_staged=ii == len(jobs) - 1,
+                          **run_kwargs)
+    path_background.unlink(missing_ok=True)
+    return failed
+
+
+def run_job(job: dcnum.logic.DCNumPipelineJob,
+            show_progress: bool = True,
+            index_path: pathlib.Path | None = None,
+            progress_format: Literal["text", "json"] = "text",
+            print_report: bool = False,
+            staging_area: StagingArea | None = None,
+            output_mover: OutputMover | None = None,
+            path_background: pathlib.Path | None = None,
+            release_staged: bool = True,
+            background_cache_size: int = BACKGROUND_CACHE_SIZE,
+            echo: Callable = click.echo,
+            on_event: Callable | None = None,
+            ):
+    """Run a pipeline job created with :func:`prepare_job`
+
+    With `progress_format` set to "json", status updates are printed
+    as JSON lines (see :func:`.format_status_json`) that are tagged with
+    the input path of the job. Jobs that were interrupted after the
+    background computation reuse the background data of the interrupted
+    run (see :class:`.ResumableJobRunner`).
+    A performance report is written next to the output file (see
+    :func:`.get_report_path`) and printed if `print_report` is set.
+    For jobs that read from the `staging_area` (see
+    :func:`preflight_dataset`), the staged input file is removed
+    after processing (see :func:`.unstage_job`), unless
+    `release_staged` is False. For jobs that write to the local
+    directory of the `output_mover`, the output file is moved to its
+    destination in the background (see :func:`.submit_job_output`).
+    If `path_background` is given, the background data are read from
+    or written to that file (see :class:`.ResumableJobRunner`).
+    Background data are reused from and added to the background cache
+    (see :class:`.BackgroundCache`) with the maximum size
+    `background_cache_size` in bytes (0 disables the cache).
+
+    Messages for the user are written with `echo`. If `on_event` is
+    given, it is called with every status update of the job (the
+    status with the additional key "event" set to "state" or
+    "progress", see :func:`.format_status_json`) and with the report
+    of the job (``{"event": "report", "report": report}``).
+    """
+    path_in = job["path_in"]
+    if staging_area is not None:
+        path_in = staging_area.get_original_path(path_in)
+    if background_cache_size:
+        background_cache = BackgroundCache(max_bytes=background_cache_size)
+    else:
+        background_cache = None
+    runner = ResumableJobRunner(job,
+                                path_background=path_background,
+                                background_cache=background_cache)
+    if runner.has_background_checkpoint():
+        if path_background is None:
+            echo("Reusing background data of an interrupted run")
+        else:
+            echo("Reusing shared background data")
+    reporter = JobReporter(runner)
+    runner.start()
+    strlen = 0
+    prev_str = ""
+    prev_state = None
+    for status in monitor_runner(runner):
+        reporter.observe(status)
+        event = "state" if status["state"] != prev_state else "progress"
+        prev_state = status["state"]
+        if on_event is not None:
+            on_event(dict(status, event=event))
+        if not show_progress:
+            continue
+        if progress_format == "json":
+            print(format_status_json(status,
+                                     event=event,
+                                     path_in=path_in),
+                  flush=True)
+        else:
+            print_str = format_status_text(status)
+            # don't clutter stdout
+            if print_str != prev_str:
+                strlen = max(strlen, len(print_str))
+                print(print_str.ljust(strlen), end="\r", flush=True)
+                prev_str = print_str
+    if show_progress and progress_format == "text":
+        print("")  # new line
+
+    runner.join(delete_temporary_files=status["state"] != "error")
+    if staging_area is not None:
+        unstage_job(job, staging_area, release=release_staged)
+    # The report reads the log and the size of the output file, so
+    # it must be created before the output file is moved.
+    report = reporter.get_report()
+    report["path_in"] = str(path_in)
+    path_out = job["path_out"]
+    if output_mover is not None:
+        path_out = submit_job_output(job, output_mover, path_in)
+    report["path_out"] = str(path_out)
+    write_report(report)
+    if on_event is not None:
+        on_event({"event": "report", "report": report})
+    if print_report:
+        echo(format_report(report))
+
+    if status["state"] == "error":
+        raise click.ClickException(runner.error_tb)
+    else:
+        if index_path and path_out == job["path_out"]:
+            # Output files that are moved in the background are added
+            # to the index when they are checked the next time.
+            DatasetIndex(index_path).set_output_hash(path_out,
+                                                     runner.pphash)
+        return 0
+
+
+def plan_job(
+    probe: InputProbe,
+    path_out: pathlib.Path | None,
+    background_method: str,
+    background_kwargs: List[str],
+    segmentation_method: str,
+    segmentation_kwargs: List[str],
+    feature_kwargs: List[str],
+    gate_kwargs: List[str],
+    pixel_size: float,
+    index_mapping: int | slice | None,
+    recompute_flickering: bool = False,
+    flickering_kwargs: List[str] = (),
+    echo: Callable = click.echo,
+) -> dict:
+    """Validate the user input and compute the pipeline identifiers
+
+    This does not modify the file system. All information about the
+    input file is taken from `probe`. Messages for the user are written
+    with `echo`.
+
+    Returns
+    -------
+    plan: dict
+        Dictionary with the input and output paths, the event count
+        of the input file, the pipeline identifiers ("dat_id", "bg_id",
+        "seg_id", "feat_id", "gate_id"), the pipeline hash "pphash",
+        the state of the output file "out_state" (see
+        :func:`.get_output_state`), and the validated keyword arguments
+        for the pipeline steps ("data_kwargs", "background_kwargs",
+        "segmenter_kwargs", "feature_kwargs", "gate_kwargs").
+    """
+    path_in = probe.path_in
     try:
         # Make sure the pixel size makes sense
         if pixel_size == 0:
-            pixel_size = validate_pixel_size(data_path=path_in)
+            pixel_size = probe.pixel_size_valid
+            if pixel_size != probe.pixel_size:
+                warnings.warn(
+                    f"Correcting for invalid pixel size in '{path_in}'!")
 
         # data keyword arguments
         data_kwargs = {"pixel_size": pixel_size,
                        "index_mapping": index_mapping}
 
-        with dcnum.read.HDF5Data(path_in, **data_kwargs) as hd:
-            # Before doing anything else, check whether we have image data in
-            # the input file.
-            has_data = hd.image is not None
-            # Obtain the data PPID
-            dat_id = hd.get_ppid()
+        # Before doing anything else, check whether we have image data in
+        # the input file.
+        has_data = probe.has_image
+        # Obtain the data PPID
+        dat_id = probe.get_dat_id(**data_kwargs)
     except BaseException:
         raise click.ClickException(
             f"Not a valid input file '{path_in}'.")
@@ -58,9 +488,8 @@ def process_dataset(
 
     if path_out is None:
         path_out = path_in.with_name(path_in.stem + "_dcn.rtdc")
-    path_out.parent.mkdir(parents=True, exist_ok=True)
 
-    click.echo(f"Data ID:\t{dat_id}")
+    echo(f"Data ID:\t{dat_id}")
 
     # background keyword arguments
     bg_kwargs = validate_background_kwargs(background_method,
@@ -70,31 +499,34 @@ def process_dataset(
         # We are using the 'sparsemed' background algorithm, and the user
         # did not specify whether they want to perform flickering
         # correction. Thus, we automatically check whether we need that.
-        with dcnum.read.HDF5Data(path_in) as hd:
-            bg_kwargs["offset_correction"] = \
-                dcnum.read.detect_flickering(hd.image)
+        bg_kwargs["offset_correction"] = probe.detect_flickering(
+            recompute=recompute_flickering,
+            flickering_kwargs=validate_flickering_kwargs(flickering_kwargs))
     bg_cls = cm.get_available_background_methods()[background_method]
     bg_id = bg_cls.get_ppid_from_ppkw(bg_kwargs)
-    click.echo(f"Background ID:\t{bg_id}")
+    echo(f"Background ID:\t{bg_id}")
 
     # segmenter keyword arguments
     seg_kwargs = validate_segmentation_kwargs(segmentation_method,
                                               segmentation_kwargs)
     seg_cls = cm.get_segmenters()[segmentation_method]
+    if seg_kwargs.get("model_file"):
+        try:
+            sync_model_cache(seg_kwargs["model_file"])
+        except (OSError, ValueError):
+            pass  # invalid model files are reported by dcnum below
     seg_id = seg_cls.get_ppid_from_ppkw(seg_kwargs)
-    click.echo(f"Segmenter ID:\t{seg_id}")
+    echo(f"Segmenter ID:\t{seg_id}")
 
     # feature keyword arguments
     feat_kwargs = validate_feature_kwargs(feature_kwargs)
-    feat_cls = cm.QueueEventExtractor
-    feat_id = feat_cls.get_ppid_from_ppkw(feat_kwargs)
-    click.echo(f"Feature ID:\t{feat_id}")
+    feat_id = cm.QueueEventExtractor.get_ppid_from_ppkw(feat_kwargs)
+    echo(f"Feature ID:\t{feat_id}")
 
     # gate keyword arguments
-    gate_cls = cm.Gate
     gate_kwargs = validate_gate_kwargs(gate_kwargs)
-    gate_id = gate_cls.get_ppid_from_ppkw(gate_kwargs)
-    click.echo(f"Gate ID:\t{gate_id}")
+    gate_id = cm.Gate.get_ppid_from_ppkw(gate_kwargs)
+    echo(f"Gate ID:\t{gate_id}")
 
     # compute pipeline hash
     pph = ppid.compute_pipeline_hash(
@@ -104,11 +536,123 @@ def process_dataset(
         seg_id=seg_id,
         feat_id=feat_id,
         gate_id=gate_id)
-    click.secho(f"Pipeline hash:\t{pph}")
+    echo(f"Pipeline hash:\t{pph}")
+
+    # check for existing output files
+    out_state = get_output_state(path_out, pph, probe.dataset_index)
+    echo(f"Output state:\t{out_state}")
+
+    return {
+        "path_in": path_in,
+        "path_out": path_out,
+        "event_count": probe.event_count,
+        "dat_id": dat_id,
+        "bg_id": bg_id,
+        "seg_id": seg_id,
+        "feat_id": feat_id,
+        "gate_id": gate_id,
+        "pphash": pph,
+        "out_state": out_state,
+        "data_kwargs": data_kwargs,
+        "background_kwargs": bg_kwargs,
+        "segmenter_kwargs": seg_kwargs,
+        "feature_kwargs": feat_kwargs,
+        "gate_kwargs": gate_kwargs,
+    }
+
+
+def prepare_job(
+    probe: InputProbe,
+    path_out: pathlib.Path,
+    background_method: str,
+    background_kwargs: List[str],
+    segmentation_method: str,
+    segmentation_kwargs: List[str],
+    feature_kwargs: List[str],
+    gate_kwargs: List[str],
+    pixel_size: float,
+    index_mapping: int | slice | None,
+    basin_strategy: Literal["drain", "tap"],
+    compression: str,
+    num_cpus: int,
+    dry_run: bool,
+    debug: bool,
+    override: bool = False,
+    recompute_flickering: bool = False,
+    flickering_kwargs: List[str] = (),
+    max_memory: int | None = None,
+    echo: Callable = click.echo,
+) -> dcnum.logic.DCNumPipelineJob | None:
+    """Validate the user input and set up a pipeline job
+
+    All information about the input file is taken from `probe`.
+    Messages for the user are written with `echo`. Returns None if
+    there is nothing to do (dry run or output file is up to date).
+    If `max_memory` (bytes) is given, the number of processes and the
+    image chunk size are reduced so that the estimated memory usage
+    of the job does not exceed it (see :func:`.fit_job_to_memory`).
+    If `compression` is "auto", the compression level is determined
+    for the output directory (see :func:`.get_auto_compression`).
+    """
+    plan = plan_job(
+        probe=probe,
+        path_out=path_out,
+        background_method=background_method,
+        background_kwargs=background_kwargs,
+        segmentation_method=segmentation_method,
+        segmentation_kwargs=segmentation_kwargs,
+        feature_kwargs=feature_kwargs,
+        gate_kwargs=gate_kwargs,
+        pixel_size=pixel_size,
+        index_mapping=index_mapping,
+        recompute_flickering=recompute_flickering,
+        flickering_kwargs=flickering_kwargs,
+        echo=echo,
+    )
+    path_in = plan["path_in"]
+    path_out = plan["path_out"]
+    data_kwargs = plan["data_kwargs"]
+    bg_cls = cm.get_available_background_methods()[background_method]
+    seg_cls = cm.get_segmenters()[segmentation_method]
+
+    if max_memory:
+        try:
+            num_cpus, chunk_size, memory = fit_job_to_memory(
+                max_memory=max_memory,
+                image_shape=probe.image_shape,
+                event_count=probe.event_count,
+                num_procs=num_cpus,
+                segmenter_code=seg_cls.get_ppid_code())
+        except ValueError as e:
+            raise click.ClickException(f"Cannot process '{path_in}': {e}")
+        if chunk_size < DEFAULT_CHUNK_SIZE:
+            # The chunk size does not affect the pipeline identifiers.
+            data_kwargs = dict(data_kwargs, image_chunk_size=chunk_size)
+        echo(f"Memory estimate:\t{memory / MiB:.0f} MiB ({num_cpus} "
+             f"processes, chunk size {chunk_size})")
 
     if dry_run:
-        click.echo("Dry run complete")
-        return 0
+        echo("Dry run complete")
+        return None
+
+    if plan["out_state"] == "current":
+        echo(f"Output file '{path_out}' is up to date, skipping")
+        return None
+    elif plan["out_state"] == "stale":
+        if override:
+            path_out.unlink()
+        else:
+            raise click.ClickException(
+                f"Output file '{path_out}' exists, but it was not "
+                f"created with the pipeline hash {plan['pphash']}. Please "
+                f"use the `--override` flag to replace stale output files.")
+    path_out.parent.mkdir(parents=True, exist_ok=True)
+
+    if compression == "auto":
+        # The compression does not affect the pipeline identifiers.
+        compression = get_auto_compression(probe.hd, path_out.parent)
+        echo(f"Compression:\t{compression} (calibrated for "
+             f"'{path_out.parent}')")
 
     job = dcnum.logic.DCNumPipelineJob(
         path_in=path_in,
@@ -116,13 +660,13 @@ def process_dataset(
         data_code="hdf",
         data_kwargs=data_kwargs,
         background_code=bg_cls.get_ppid_code(),
-        background_kwargs=bg_kwargs,
+        background_kwargs=plan["background_kwargs"],
         segmenter_code=seg_cls.get_ppid_code(),
-        segmenter_kwargs=seg_kwargs,
-        feature_code=feat_cls.get_ppid_code(),
-        feature_kwargs=feat_kwargs,
-        gate_code=gate_cls.get_ppid_code(),
-        gate_kwargs=gate_kwargs,
+        segmenter_kwargs=plan["segmenter_kwargs"],
+        feature_code=cm.QueueEventExtractor.get_ppid_code(),
+        feature_kwargs=plan["feature_kwargs"],
+        gate_code=cm.Gate.get_ppid_code(),
+        gate_kwargs=plan["gate_kwargs"],
         basin_strategy=basin_strategy,
         compression=compression,
         num_procs=num_cpus,
@@ -130,33 +674,15 @@ def process_dataset(
     )
 
     try:
-        job.validate()
+        probe.validate_job(job)
     except dcnum.segm.SegmenterNotApplicableError as e:
         raise click.ClickException(
             f"Segmenter '{segmentation_method}' cannot be applied "
             f"to '{path_in}': {', '.join(e.reasons_list)}")
 
-    runner = dcnum.logic.DCNumJobRunner(job)
-    runner.start()
-    strlen = 0
-    prev_str = ""
-    while True:
-        status = runner.get_status()
-        progress = status["progress"]
-        state = status["state"]
-        print_str = f"Processing {progress:.0%} ({state})"
-        if print_str != prev_str:  # don't clutter stdout
-            strlen = max(strlen, len(print_str))
-            print(print_str.ljust(strlen), end="\r", flush=True)
-            prev_str = print_str
-        if status["state"] in ["done", "error"]:
-            break
-        time.sleep(.3)  # don't use 100% CPU
-    print("")  # new line
+    if job["segmenter_code"] == "torchsto":
+        # Load the model (if it is not already loaded) now, which
+        # happens in the background while the previous job is running.
+        preload_model(job["segmenter_kwargs"]["model_file"])
 
-    if status["state"] == "error":
-        runner.join(delete_temporary_files=False)
-        raise click.ClickException(runner.error_tb)
-    else:
-        runner.join(delete_temporary_files=True)
-        return 0
+    return job
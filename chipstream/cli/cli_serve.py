@@ -0,0 +1,738 @@
+import collections
+import hmac
+import http.server
+import itertools
+import json
+import logging
+import os
+import pathlib
+import queue
+import secrets
+import sys
+import threading
+import traceback
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import click
+
+from .._version import version
+from ..progress import format_status_json, format_status_text
+from ..user_cache import get_cache_dir
+
+from .cli_main import validate_max_memory
+
+
+#: Default port of the job server (the server only listens on localhost)
+DEFAULT_PORT = 8477
+#: Default URL of the job server
+DEFAULT_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+#: Number of finished jobs the server keeps (the oldest are removed)
+MAX_FINISHED_JOBS = 100
+#: Number of events kept for each job (the oldest are removed)
+MAX_JOB_EVENTS = 1000
+
+#: Parameters of a job request and their default values
+#: (see :func:`.process_dataset`)
+JOB_DEFAULTS = {
+    "path_in": None,
+    "path_out": None,
+    "background_method": "sparsemed",
+    "background_kwargs": [],
+    "segmentation_method": "thresh",
+    "segmentation_kwargs": [],
+    "feature_kwargs": [],
+    "gate_kwargs": [],
+    "flickering_kwargs": [],
+    "pixel_size": 0,
+    "basin_strategy": "tap",
+    "compression": "zstd-5",
+    "num_cpus": None,
+    "override": False,
+    "recompute_flickering": False,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def create_server_token(path: pathlib.Path) -> str:
+    """Create a new access token for the job server
+
+    The token is written to the file `path`, which only the current
+    user can read (permissions 0600), and returned.
+    """
+    path = pathlib.Path(path)
+    path.unlink(missing_ok=True)
+    token = secrets.token_urlsafe(32)
+    # O_EXCL: do not write to a file another user created meanwhile
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as fobj:
+        fobj.write(token)
+    return token
+
+
+def get_token_path(port: int) -> pathlib.Path:
+    """Return the path of the access token file of the job server"""
+    return get_cache_dir() / f"server-{port}.token"
+
+
+def read_server_token(url: str) -> str | None:
+    """Return the access token of the job server at `url`
+
+    Returns None if there is no token for the server (e.g. because
+    it is not running).
+    """
+    port = urllib.parse.urlsplit(url).port or DEFAULT_PORT
+    try:
+        return get_token_path(port).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+class ServerJob:
+    def __init__(self, job_id: int, request: dict):
+        """A job submitted to the :class:`JobServer`"""
+        self.id = job_id
+        self.request = request
+        #: "queued", the state of the job runner while the job is
+        #: running, and "done", "skipped" (output file is up to date),
+        #: or "error" when the job is finished
+        self.state = "queued"
+        #: Messages and status updates of the job, each a dictionary
+        #: with the key "event" ("message", "state", "progress",
+        #: "report", or "finished"); only the latest
+        #: :const:`MAX_JOB_EVENTS` events are kept
+        self.events = collections.deque(maxlen=MAX_JOB_EVENTS)
+        #: Total number of events of the job
+        self.num_events = 0
+
+    def get_summary(self) -> dict:
+        return {"id": self.id,
+                "path_in": self.request["path_in"],
+                "state": self.state,
+                }
+
+
+class JobServer:
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = DEFAULT_PORT,
+                 index_path: pathlib.Path | None = None,
+                 num_cpus: int | None = None,
+                 max_memory: int | None = None,
+                 token_path: pathlib.Path | None = None,
+                 max_finished_jobs: int = MAX_FINISHED_JOBS):
+        """Local server that processes submitted jobs one after another
+
+        The server runs in a single long-lived process, so dcnum, torch,
+        and the segmentation models (dcnum keeps loaded models in
+        memory) are loaded only once and not for every input file.
+        Jobs are submitted via HTTP (see :class:`JobRequestHandler`)
+        and processed in the order of submission in a worker thread.
+
+        Every request must contain the access token of the server,
+        which is created when the server is started and stored in a
+        file that only the current user can read (see
+        :func:`create_server_token`). Other users on the same machine
+        and web pages opened in a browser can therefore not submit
+        jobs.
+
+        Parameters
+        ----------
+        host:
+            address to listen on
+        port:
+            port to listen on (use 0 for a random free port)
+        index_path:
+            path to the persistent dataset index (None disables it)
+        num_cpus:
+            default number of processes for each job
+        max_memory:
+            memory budget of each job (see :func:`.fit_job_to_memory`)
+        token_path:
+            file for the access token (defaults to :func:`get_token_path`)
+        max_finished_jobs:
+            number of finished jobs to keep; the oldest finished jobs
+            are removed
+        """
+        self.index_path = index_path
+        self.num_cpus = num_cpus
+        self.max_memory = max_memory
+        self.max_finished_jobs = max_finished_jobs
+        #: dictionary of the :class:`ServerJob` instances by job ID
+        self.jobs = {}
+        #: IDs of the finished jobs in the order they finished
+        self._finished = collections.deque()
+        self.queue = queue.Queue()
+        #: notifies threads waiting for job events
+        self.condition = threading.Condition()
+        self._job_ids = itertools.count(1)
+        self.httpd = http.server.ThreadingHTTPServer((host, port),
+                                                     JobRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.job_server = self
+        if token_path is None:
+            token_path = get_token_path(self.httpd.server_address[1])
+        self.token_path = pathlib.Path(token_path)
+        self.token = create_server_token(self.token_path)
+        self.worker = threading.Thread(target=self.process_queue,
+                                       daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def warm_up(self):
+        """Import dcnum and all available segmenters ahead of time"""
+        from . import cli_common as cm
+        from . import cli_proc  # noqa: F401
+        cm.get_available_segmenters()
+
+    def start(self):
+        """Start processing jobs and serving requests in the background"""
+        self.worker.start()
+        threading.Thread(target=self.httpd.serve_forever,
+                         daemon=True).start()
+
+    def serve_forever(self):
+        """Process jobs and serve requests until interrupted"""
+        self.worker.start()
+        self.httpd.serve_forever()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the server
+
+        If `wait` is set, wait for the current job to finish. Jobs
+        that are still queued are not processed.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.token_path.unlink(missing_ok=True)
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self.finish_job(job, "error",
+                                message="The job server was shut down")
+        self.queue.put(None)
+        if wait and self.worker.is_alive():
+            self.worker.join()
+
+    def submit(self, request: dict) -> int:
+        """Add a job to the queue and return its ID
+
+        Raises
+        ------
+        ValueError
+            if the request contains unknown parameters, if the input
+            file does not exist, if the output path is not an absolute
+            path ending with "_dcn.rtdc", or if the background or
+            segmentation method is not available
+        """
+        from . import cli_common as cm
+        unknown = sorted(set(request) - set(JOB_DEFAULTS))
+        if unknown:
+            raise ValueError(f"Unknown job parameters: {', '.join(unknown)}")
+        request = dict(JOB_DEFAULTS, **request)
+        if (not request["path_in"]
+                or not pathlib.Path(request["path_in"]).is_file()):
+            raise ValueError(f"Input file '{request['path_in']}' not found")
+        if request["path_out"] is not None:
+            # Existing (stale) output files are replaced, so make sure
+            # that a job cannot overwrite anything but output files.
+            path_out = pathlib.Path(request["path_out"])
+            if (not path_out.is_absolute()
+                    or not path_out.name.endswith("_dcn.rtdc")):
+                raise ValueError(f"The output path '{path_out}' must be an "
+                                 f"absolute path ending with '_dcn.rtdc'")
+        if (request["background_method"]
+                not in cm.get_available_background_methods()):
+            raise ValueError(f"Unknown background method "
+                             f"'{request['background_method']}'")
+        seg_cls = cm.get_segmenters().get(request["segmentation_method"])
+        if seg_cls is None or not seg_cls.is_available():
+            raise ValueError(f"The segmenter "
+                             f"'{request['segmentation_method']}' is not "
+                             f"available")
+        job = ServerJob(next(self._job_ids), request)
+        with self.condition:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job.id
+
+    def add_event(self, job: ServerJob, event: dict):
+        with self.condition:
+            job.events.append(event)
+            job.num_events += 1
+            self.condition.notify_all()
+
+    def add_message(self, job: ServerJob, text: str):
+        self.add_event(job, {"event": "message", "text": text})
+
+    def finish_job(self, job: ServerJob, state: str, message: str = ""):
+        if message:
+            self.add_message(job, message)
+        with self.condition:
+            job.state = state
+            self.add_event(job, {"event": "finished", "state": state})
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished_jobs:
+                self.jobs.pop(self._finished.popleft(), None)
+
+    def get_events(self, job_id: int, since: int = 0,
+                   timeout: float = 0) -> tuple[list, int]:
+        """Return the events of a job starting with index `since`
+
+        If there are no new events, wait at most `timeout` seconds
+        for new events. Returns the events and the index of the next
+        event. Events that were removed from the history of the job
+        (see :const:`MAX_JOB_EVENTS`) are skipped.
+
+        Raises
+        ------
+        KeyError
+            if there is no job with the ID `job_id` (anymore)
+        """
+        with self.condition:
+            job = self.jobs[job_id]
+            self.condition.wait_for(lambda: job.num_events > since,
+                                    timeout=timeout)
+            first = job.num_events - len(job.events)
+            events = list(job.events)[max(since - first, 0):]
+            return events, job.num_events
+
+    def get_summaries(self) -> list:
+        """Return the summaries of all jobs"""
+        with self.condition:
+            return [job.get_summary() for job in self.jobs.values()]
+
+    def process_queue(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            try:
+                state = self.run_job(job)
+            except BaseException:
+                state = "error"
+                self.add_message(job, traceback.format_exc())
+            self.finish_job(job, state)
+            click.echo(f"Job {job.id} {state}: {job.request['path_in']}")
+
+    def run_job(self, job: ServerJob) -> str:
+        """Run a job and return its final state
+
+        The job is run with :func:`.preflight_dataset` and
+        :func:`.run_job`, but all messages and status updates are
+        recorded as events of `job`.
+        """
+        from dcnum.common import cpu_count
+        from .cli_proc import preflight_dataset, run_job
+
+        req = job.request
+        job.state = "setup"
+        num_cpus = min(req["num_cpus"] or self.num_cpus or cpu_count(),
+                       cpu_count())
+
+        def echo(msg):
+            self.add_message(job, msg)
+
+        def on_event(event):
+            if "state" in event:
+                job.state = event["state"]
+            self.add_event(job, event)
+
+        try:
+            dcjob = preflight_dataset(
+                path_in=pathlib.Path(req["path_in"]),
+                path_out=(None if req["path_out"] is None
+                          else pathlib.Path(req["path_out"])),
+                index_path=self.index_path,
+                echo=echo,
+                background_method=req["background_method"],
+                background_kwargs=req["background_kwargs"],
+                segmentation_method=req["segmentation_method"],
+                segmentation_kwargs=req["segmentation_kwargs"],
+                feature_kwargs=req["feature_kwargs"],
+                gate_kwargs=req["gate_kwargs"],
+                pixel_size=req["pixel_size"],
+                index_mapping=None,
+                basin_strategy=req["basin_strategy"],
+                compression=req["compression"],
+                num_cpus=num_cpus,
+                dry_run=False,
+                debug=False,
+                override=req["override"],
+                recompute_flickering=req["recompute_flickering"],
+                flickering_kwargs=req["flickering_kwargs"],
+                max_memory=self.max_memory,
+            )
+            if dcjob is None:
+                # output file is up to date
+                return "skipped"
+            run_job(dcjob,
+                    show_progress=False,
+                    index_path=self.index_path,
+                    echo=echo,
+                    on_event=on_event)
+        except click.ClickException as e:
+            self.add_message(job, e.format_message())
+            return "error"
+        return "done"
+
+
+class JobRequestHandler(http.server.BaseHTTPRequestHandler):
+    """HTTP interface of the :class:`JobServer`
+
+    - ``GET /``: server version and number of jobs
+    - ``GET /jobs``: list of all jobs
+    - ``GET /jobs/<id>?since=<n>&timeout=<s>``: job summary with the
+      events of the job starting with event `n` and the index of the
+      next event ("next"); waits at most `s` seconds for new events
+    - ``POST /jobs``: submit a job (JSON object with the keys in
+      :const:`JOB_DEFAULTS`, content type "application/json"), returns
+      the job ID
+
+    All requests must contain the access token of the server in the
+    header ``Authorization: Bearer <token>`` and a ``Host`` header
+    for the local address of the server (protects against DNS
+    rebinding).
+    """
+    server_version = f"chipstream/{version}"
+
+    def check_request(self) -> bool:
+        """Check the host and the access token of a request
+
+        Sends an error response and returns False if the request
+        is not allowed.
+        """
+        job_server = self.server.job_server
+        host, port = self.server.server_address[:2]
+        hosts = {f"{name}:{port}"
+                 for name in [host, "127.0.0.1", "localhost", "[::1]"]}
+        if self.headers.get("Host") not in hosts:
+            self.send_json({"error": "Invalid host"}, status=403)
+            return False
+        auth = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode("utf-8"),
+                                   f"Bearer {job_server.token}".encode()):
+            self.send_json({"error": "Missing or invalid access token"},
+                           status=401)
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.check_request():
+            return
+        job_server = self.server.job_server
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = urllib.parse.parse_qs(url.query)
+        if parts == [""]:
+            self.send_json({"version": version,
+                            "jobs": len(job_server.jobs),
+                            "queued": job_server.queue.qsize()})
+        elif parts == ["jobs"]:
+            self.send_json(job_server.get_summaries())
+        elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            job_id = int(parts[1])
+            try:
+                since = int(query.get("since", ["0"])[0])
+                timeout = min(float(query.get("timeout", ["0"])[0]), 60)
+            except ValueError:
+                self.send_json({"error": "Invalid query"}, status=400)
+                return
+            try:
+                events, next_event = job_server.get_events(job_id, since,
+                                                           timeout)
+                data = job_server.jobs[job_id].get_summary()
+            except KeyError:
+                self.send_json({"error": f"Not found: {url.path}"},
+                               status=404)
+                return
+            data["events"] = events
+            data["next"] = next_event
+            self.send_json(data)
+        else:
+            self.send_json({"error": f"Not found: {url.path}"}, status=404)
+
+    def do_POST(self):
+        if not self.check_request():
+            return
+        job_server = self.server.job_server
+        if self.path.rstrip("/") != "/jobs":
+            self.send_json({"error": f"Not found: {self.path}"}, status=404)
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.send_json({"error": "Content type must be "
+                                     "'application/json'"},
+                           status=415)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise ValueError("Job request must be a JSON object")
+            job_id = job_server.submit(request)
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+        else:
+            self.send_json({"id": job_id}, status=201)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def request_server(url: str, path: str, data: dict | None = None,
+                   timeout: float = 30):
+    """Send a request to the job server and return the JSON response
+
+    The access token of the server is read from the token file of
+    the current user (see :func:`read_server_token`).
+    """
+    headers = {"Content-Type": "application/json"}
+    token = read_server_token(url)
+    if token is not None:
+        headers["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(
+        url.rstrip("/") + path,
+        data=None if data is None else json.dumps(data).encode("utf-8"),
+        headers=headers,
+        method="GET" if data is None else "POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read())["error"]
+        except BaseException:
+            message = str(e)
+        raise click.ClickException(message)
+    except urllib.error.URLError as e:
+        raise click.ClickException(
+            f"Cannot connect to the job server at {url} ({e.reason}). "
+            f"Start the server with `chipstream-cli serve`.")
+
+
+def stream_job_events(url: str, job_id: int, poll_timeout: float = 10):
+    """Yield the events of a job on the server until it is finished"""
+    since = 0
+    while True:
+        data = request_server(url,
+                              f"/jobs/{job_id}?since={since}"
+                              f"&timeout={poll_timeout}",
+                              timeout=poll_timeout + 30)
+        for event in data["events"]:
+            finished = event["event"] == "finished"
+            yield event
+            if finished:
+                return
+        since = data["next"]
+
+
+@click.command(name="chipstream-cli serve")
+@click.option("--port", type=click.IntRange(min=0, max=65535),
+              default=DEFAULT_PORT, show_default=True,
+              help="Port on localhost the server listens on.")
+@click.option("--num-cpus",
+              type=click.IntRange(min=1),
+              help="Number of processes for each job, unless specified "
+                   "when the job is submitted (at most the number of "
+                   "CPUs).")
+@click.option("--max-memory", type=str, callback=validate_max_memory,
+              help="Memory budget for each job, e.g. '64G', or 'auto' "
+                   "(see ``chipstream-cli --help``).")
+@click.option("--no-index", is_flag=True,
+              help="Do not use the persistent dataset index.")
+@click.option("--verbose", is_flag=True,
+              help="Yield a more verbose output.")
+@click.version_option(version)
+def chipstream_serve(port=DEFAULT_PORT,
+                     num_cpus=None,
+                     max_memory=None,
+                     no_index=False,
+                     verbose=False):
+    """Run a local job server
+
+    The server keeps dcnum, torch, and the segmentation models loaded
+    and processes the jobs submitted with ``chipstream-cli submit`` one
+    after another. Only connections from localhost are accepted and
+    only the current user can submit jobs.
+    """
+    from ..dataset_index import get_default_index_path
+    from . import cli_common as cm
+
+    cm.setup_root_logger(verbose=verbose)
+    try:
+        server = JobServer(
+            port=port,
+            index_path=None if no_index else get_default_index_path(),
+            num_cpus=num_cpus,
+            max_memory=max_memory)
+    except OSError as e:
+        raise click.ClickException(f"Cannot listen on port {port}: {e}")
+    click.echo("Loading processing pipeline...")
+    server.warm_up()
+    click.echo(f"Serving jobs at {server.url} (press Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("Stopping job server")
+    finally:
+        server.shutdown(wait=False)
+
+
+@click.command(name="chipstream-cli submit")
+@click.argument("path_in",
+                type=click.Path(exists=True,
+                                dir_okay=False,
+                                resolve_path=True,
+                                path_type=pathlib.Path))
+@click.argument("path_out",
+                required=False,
+                type=click.Path(dir_okay=False,
+                                writable=True,
+                                resolve_path=True,
+                                path_type=pathlib.Path),
+                )
+@click.option("-b", "--background-method",
+              default="sparsemed", show_default=True,
+              help="Background computation method to use.")
+@click.option("-kb", "background_kwargs", multiple=True, metavar="KEY=VALUE",
+              help="Optional ``KEY=VALUE`` argument for the specified "
+                   "background method")
+@click.option("-s", "--segmentation-method",
+              default="thresh", show_default=True,
+              help="Segmentation method to use.")
+@click.option("-ks", "segmentation_kwargs", multiple=True,
+              metavar="KEY=VALUE",
+              help="Optional ``KEY=VALUE`` argument for the specified "
+                   "segmenter.")
+@click.option("-kf", "feature_kwargs", multiple=True, metavar="KEY=VALUE",
+              help="Optional ``KEY=VALUE`` argument for the specified "
+                   "feature extractor.")
+@click.option("-kg", "gate_kwargs", multiple=True, metavar="KEY=VALUE",
+              help="Optional ``KEY=VALUE`` argument for event gating.")
+@click.option("-kd", "flickering_kwargs", multiple=True, metavar="KEY=VALUE",
+              help="Optional ``KEY=VALUE`` argument for flickering "
+                   "detection.")
+@click.option("-p", "--pixel-size", type=float, default=0,
+              help="Set/override the pixel size for feature "
+                   "extraction [µm].")
+@click.option("--drain-basins", is_flag=True,
+              help="Write all basin features from input to output file.")
+@click.option("-c", "--compression", type=str, default="zstd-5",
+              show_default=True,
+              help="Data compression algorithm and level.")
+@click.option("--override", is_flag=True,
+              help="Replace existing output files that were created with "
+                   "a different pipeline.")
+@click.option("--recompute-flickering", is_flag=True,
+              help="Detect image flickering even if the result for the "
+                   "input file is already in the dataset index.")
+@click.option("--num-cpus",
+              type=click.IntRange(min=1),
+              help="Number of processes to create (at most the number "
+                   "of CPUs).")
+@click.option("--server", "server_url", default=DEFAULT_URL,
+              show_default=True,
+              help="URL of the job server.")
+@click.option("--no-wait", is_flag=True,
+              help="Only submit the job and exit.")
+@click.option("--progress", "progress",
+              type=click.Choice(["text", "json", "none"]),
+              default="text", show_default=True,
+              help="How to report the progress of the job (see "
+                   "``chipstream-cli --help``).")
+@click.option("--report", "print_report", is_flag=True,
+              help="Print a performance report after the job.")
+@click.version_option(version)
+def chipstream_submit(path_in,
+                      path_out=None,
+                      background_method="sparsemed",
+                      background_kwargs=None,
+                      segmentation_method="thresh",
+                      segmentation_kwargs=None,
+                      feature_kwargs=None,
+                      gate_kwargs=None,
+                      flickering_kwargs=None,
+                      pixel_size=0,
+                      drain_basins=False,
+                      compression="zstd-5",
+                      override=False,
+                      recompute_flickering=False,
+                      num_cpus=None,
+                      server_url=DEFAULT_URL,
+                      no_wait=False,
+                      progress="text",
+                      print_report=False,
+                      ):
+    """Submit a job to a running job server
+
+    The job is processed by the server started with
+    ``chipstream-cli serve``. PATH_OUT must end with '_dcn.rtdc'.
+    Unless ``--no-wait`` is given, the messages and the progress of
+    the job are shown until it is finished.
+    """
+    request = {
+        "path_in": str(path_in),
+        "path_out": None if path_out is None else str(path_out),
+        "background_method": background_method,
+        "background_kwargs": list(background_kwargs or []),
+        "segmentation_method": segmentation_method,
+        "segmentation_kwargs": list(segmentation_kwargs or []),
+        "feature_kwargs": list(feature_kwargs or []),
+        "gate_kwargs": list(gate_kwargs or []),
+        "flickering_kwargs": list(flickering_kwargs or []),
+        "pixel_size": pixel_size,
+        "basin_strategy": "drain" if drain_basins else "tap",
+        "compression": compression,
+        "num_cpus": num_cpus,
+        "override": override,
+        "recompute_flickering": recompute_flickering,
+    }
+    job_id = request_server(server_url, "/jobs", data=request)["id"]
+    click.echo(f"Submitted job {job_id} to {server_url}")
+    if no_wait:
+        return
+
+    state = "error"
+    strlen = 0
+    for event in stream_job_events(server_url, job_id):
+        kind = event.pop("event")
+        if strlen and kind in ["message", "report"]:
+            print("")  # new line after the progress
+            strlen = 0
+        if kind == "message":
+            click.echo(event["text"])
+        elif kind in ["state", "progress"]:
+            if progress == "json":
+                print(format_status_json(event, event=kind, path_in=path_in),
+                      flush=True)
+            elif progress == "text":
+                print_str = format_status_text(event)
+                strlen = max(strlen, len(print_str))
+                print(print_str.ljust(strlen), end="\r", flush=True)
+        elif kind == "report" and print_report:
+            from ..job_report import format_report
+            click.echo(format_report(event["report"]))
+        elif kind == "finished":
+            state = event["state"]
+    if strlen:
+        print("")  # new line
+
+    if state not in ["done", "skipped"]:
+        click.secho("Encountered problems during processing", fg="red")
+        sys.exit(1)
@@ -2,8 +2,8 @@ import inspect
 import warnings
 
 from dcnum.meta import ppid
-import dcnum.read
-import h5py
+
+from ..input_probe import InputProbe, get_flickering_kwargs
 
 from . import cli_common as cm
 
@@ -46,6 +46,15 @@ def validate_feature_kwargs(args):
     return kwargs
 
 
+def validate_flickering_kwargs(args):
+    """Parse flickering detection keyword arguments
+
+    The keyword arguments are validated and populated with the default
+    values by :func:`.get_flickering_kwargs`, like in the GUI.
+    """
+    return get_flickering_kwargs(dict(a.split("=") for a in args))
+
+
 def validate_gate_kwargs(args):
     spec = inspect.getfullargspec(cm.Gate.__init__)
     valid_kw_appr = spec.kwonlyargs
@@ -63,35 +72,11 @@ def validate_gate_kwargs(args):
 
 
 def validate_pixel_size(data_path):
-    with h5py.File(data_path) as h5:
-        did = h5.attrs.get("setup:identifier", "EMPTY")
-        pixel_size = h5.attrs.get("imaging:pixel size", 0)
-        if (did.startswith("RC-")
-                and (pixel_size < 0.255 or pixel_size > 0.275)):
-            hd = dcnum.read.HDF5Data(h5, pixel_size=0.260)  # placeholder
+    with InputProbe(data_path) as probe:
+        if probe.pixel_size_valid != probe.pixel_size:
             warnings.warn(
-                f"Correcting for invalid pixel size in '{hd.path}'!")
-            # Set default pixel size for Rivercyte devices
-            # Check the logs for the device name used.
-            logdat = hd.logs.get("cytoshot-acquisition", [])
-            for line in logdat:
-                line = line.strip().lower()
-                if line.startswith("device name:"):
-                    dev_name = line.split(":")[1].strip()
-                    break
-            else:
-                # fall-back to old camera
-                dev_name = "naiad 1.0"
-            if dev_name == "naiad 1.0":
-                # Naiad v1.0 camera VLXT06MI
-                pixel_size = 0.2645
-            elif dev_name == "naiad 1.1":
-                # Naiad v1.1 camera VCXU213M
-                pixel_size = 0.2675
-            else:
-                warnings.warn(f"Unknown device name: '{dev_name}'; "
-                              f"Not changing pixel size {pixel_size}")
-        return pixel_size
+                f"Correcting for invalid pixel size in '{data_path}'!")
+        return probe.pixel_size_valid
 
 
 def validate_segmentation_kwargs(seg_method, args):
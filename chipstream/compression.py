@@ -0,0 +1,173 @@
+import json
+import os
+import pathlib
+import platform
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import dcnum.read
+import h5py
+import hdf5plugin
+import numpy as np
+
+from .user_cache import get_cache_dir
+
+
+#: Zstandard compression levels that are tested during calibration
+CALIBRATION_LEVELS = (1, 3, 5, 7, 9)
+#: Number of events used for calibration
+CALIBRATION_EVENTS = 200
+#: Size of the file written for measuring the disk throughput
+CALIBRATION_WRITE_SIZE = 32 * 1024**2
+
+_lock = threading.Lock()
+
+
+def get_calibration_path() -> pathlib.Path:
+    """Return the path of the file with the cached calibrations"""
+    return get_cache_dir() / "compression_calibration.json"
+
+
+def get_calibration_key(dir_out: pathlib.Path) -> str:
+    """Identifier of a calibration (this host and the output directory)
+
+    The host name is part of the key, because the cache directory may
+    be shared between machines (e.g. via a network home directory).
+    """
+    return f"{platform.node()}::{pathlib.Path(dir_out).resolve()}"
+
+
+def get_sample_data(hd: dcnum.read.HDF5Data,
+                    num_events: int = CALIBRATION_EVENTS
+                    ) -> List[np.ndarray]:
+    """Return image and mask data representative of an output file
+
+    If the input file does not contain masks, a rough mask is
+    computed by thresholding the image with respect to the median
+    image, which compresses similarly to a real mask.
+    """
+    size = min(num_events, len(hd))
+    image = np.array(hd.image[:size])
+    if hd.mask is not None:
+        mask = np.array(hd.mask[:size], dtype=bool)
+    else:
+        bg = np.median(image, axis=0)
+        mask = (image.astype(np.int16) - bg) < -6
+    return [image, mask]
+
+
+def measure_compression(data: List[np.ndarray], level: int) -> tuple:
+    """Compress data in-memory with the Zstandard level `level`
+
+    The data are written to an in-memory HDF5 file with one image
+    per chunk, like in the output files of dcnum.
+
+    Returns
+    -------
+    duration: float
+        time required for compressing the data in seconds
+    size: int
+        total size of the compressed data in bytes
+    """
+    with h5py.File(f"calibration-{level}.h5", "w", driver="core",
+                   backing_store=False) as h5:
+        t0 = time.perf_counter()
+        for ii, arr in enumerate(data):
+            h5.create_dataset(f"data{ii}",
+                              data=arr,
+                              chunks=(1,) + arr.shape[1:],
+                              fletcher32=True,
+                              **hdf5plugin.Zstd(clevel=level))
+        h5.flush()
+        duration = time.perf_counter() - t0
+        size = sum(h5[key].id.get_storage_size() for key in h5)
+    return duration, size
+
+
+def measure_write_throughput(dir_out: pathlib.Path,
+                             size: int = CALIBRATION_WRITE_SIZE) -> float:
+    """Measure the write throughput of a directory in bytes per second
+
+    A temporary file with random data is written (and synchronized
+    to the disk) and removed afterwards.
+    """
+    data = np.random.default_rng(42).integers(
+        0, 256, size=size, dtype=np.uint8).tobytes()
+    with tempfile.NamedTemporaryFile(dir=dir_out,
+                                     prefix=".chipstream_calibration_",
+                                     ) as fd:
+        t0 = time.perf_counter()
+        fd.write(data)
+        fd.flush()
+        os.fsync(fd.fileno())
+        duration = time.perf_counter() - t0
+    return size / max(duration, 1e-9)
+
+
+def select_compression(data: List[np.ndarray],
+                       dir_out: pathlib.Path,
+                       levels: tuple = CALIBRATION_LEVELS) -> Dict:
+    """Determine the compression level with the highest throughput
+
+    The data are compressed with all `levels` and the time for
+    writing the compressed data to `dir_out` is computed from the
+    measured write throughput of `dir_out`. Since the output file
+    is compressed and written by the same thread in dcnum, the
+    level with the smallest sum of compression and write time wins.
+
+    Returns
+    -------
+    calibration: dict
+        Dictionary with the selected "compression" (e.g. "zstd-3"),
+        the measured "write_throughput" in bytes per second, and the
+        estimated "throughput" in raw bytes per second for each level.
+    """
+    raw_size = sum(arr.nbytes for arr in data)
+    write_throughput = measure_write_throughput(dir_out)
+    throughput = {}
+    for level in levels:
+        duration, size = measure_compression(data, level)
+        total = duration + size / write_throughput
+        throughput[f"zstd-{level}"] = raw_size / max(total, 1e-9)
+    return {
+        "compression": max(throughput, key=throughput.get),
+        "write_throughput": write_throughput,
+        "throughput": throughput,
+        "time": time.time(),
+    }
+
+
+def get_auto_compression(hd: dcnum.read.HDF5Data,
+                         dir_out: pathlib.Path,
+                         recompute: bool = False) -> str:
+    """Return the compression with the highest throughput for `dir_out`
+
+    The calibration (see :func:`select_compression`) is performed
+    with sample data from `hd` (see :func:`get_sample_data`) and the
+    result is cached for this host and output directory in the user
+    cache directory. Set `recompute` to ignore the cached result.
+    """
+    key = get_calibration_key(dir_out)
+    path = get_calibration_path()
+    with _lock:
+        cache = load_calibrations(path)
+        if key in cache and not recompute:
+            return cache[key]["compression"]
+        calibration = select_compression(get_sample_data(hd), dir_out)
+        # Reload the cache, in case another process modified it.
+        cache = load_calibrations(path)
+        cache[key] = calibration
+        path_temp = path.with_name(f"{path.name}.{os.getpid()}~")
+        path_temp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+        path_temp.replace(path)
+    return calibration["compression"]
+
+
+def load_calibrations(path: pathlib.Path) -> Dict:
+    """Load the cached calibrations, ignoring invalid files"""
+    try:
+        return json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,188 @@
+import contextlib
+import json
+import os
+import pathlib
+import sqlite3
+
+from .user_cache import get_cache_dir
+
+
+def get_default_index_path() -> pathlib.Path:
+    """Return the path of the index shared by the CLI and the GUI"""
+    return get_cache_dir() / "dataset_index.sqlite3"
+
+
+def get_file_identity(path: pathlib.Path) -> tuple[int, int, int]:
+    """Return a tuple (size, mtime_ns, inode) identifying a file on disk
+
+    If any of these values changes, the file must be considered
+    modified and cached information about the file is invalid.
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class DatasetIndex:
+    #: Version of the database layout; databases with a different
+    #: version are reset.
+    schema_version = 3
+
+    def __init__(self, index_path: pathlib.Path | str):
+        """Persistent index of input file metadata and output hashes
+
+        The index is an SQLite database that stores information about
+        input files that would otherwise require opening the HDF5
+        files (pixel size, image shape, event count, flickering) and
+        the pipeline hashes of output files. All entries are keyed by
+        the resolved file path and are only valid as long as size,
+        modification time, and inode of the file have not changed.
+
+        The data pipeline identifier is fully determined by pixel size
+        and index mapping (see :func:`dcnum.read.HDF5Data.get_ppid`),
+        which is why only the pixel size is stored.
+
+        Parameters
+        ----------
+        index_path:
+            path to the SQLite database file (created if necessary)
+        """
+        self.index_path = pathlib.Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.schema_version:
+                for table in ["datasets", "flickering", "outputs"]:
+                    con.execute(f"DROP TABLE IF EXISTS {table}")
+                con.execute(f"PRAGMA user_version={self.schema_version}")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS datasets ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, pixel_size REAL, pixel_size_valid REAL, "
+                "image_shape TEXT, event_count INTEGER)")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS flickering ("
+                "path TEXT, detector TEXT, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, flickering INTEGER, "
+                "PRIMARY KEY (path, detector))")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, pphash TEXT)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a new database connection and commit on exit
+
+        Connecting to an SQLite database is cheap. Using a new
+        connection for every transaction makes this class usable
+        from multiple threads and processes.
+        """
+        con = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _get_row(self, table, path, columns, keys=None):
+        """Return the row for `path` in `table` if the file is unchanged
+
+        Additional primary key columns and their values may be
+        specified with the `keys` dictionary.
+        """
+        path = pathlib.Path(path).resolve()
+        keys = keys or {}
+        try:
+            identity = get_file_identity(path)
+        except OSError:
+            return None
+        where = ["path", "size", "mtime_ns", "inode"] + list(keys)
+        with self._connect() as con:
+            row = con.execute(
+                f"SELECT {', '.join(columns)} FROM {table} "
+                f"WHERE {' AND '.join(f'{w}=?' for w in where)}",
+                (str(path), *identity, *keys.values())).fetchone()
+        return row
+
+    def _set_row(self, table, path, values):
+        """Insert or replace the row for `path` in `table`"""
+        path = pathlib.Path(path).resolve()
+        identity = get_file_identity(path)
+        columns = ["path", "size", "mtime_ns", "inode"] + list(values)
+        with self._connect() as con:
+            con.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['?'] * len(columns))})",
+                (str(path), *identity, *values.values()))
+
+    def get_dataset(self, path_in: pathlib.Path) -> dict | None:
+        """Return the indexed metadata of an input file
+
+        Returns None if the file is not indexed or if it was modified.
+        Otherwise, return a dictionary with the keys "pixel_size"
+        (pixel size from the metadata), "pixel_size_valid" (pixel
+        size after :func:`.input_probe.get_valid_pixel_size`),
+        "image_shape" (None if there are no image data), and
+        "event_count".
+        """
+        row = self._get_row("datasets", path_in,
+                            ["pixel_size", "pixel_size_valid",
+                             "image_shape", "event_count"])
+        if row is None:
+            return None
+        shape = json.loads(row[2])
+        return {"pixel_size": row[0],
+                "pixel_size_valid": row[1],
+                "image_shape": None if shape is None else tuple(shape),
+                "event_count": row[3],
+                }
+
+    def set_dataset(self,
+                    path_in: pathlib.Path,
+                    pixel_size: float,
+                    pixel_size_valid: float,
+                    image_shape: tuple[int, int] | None,
+                    event_count: int):
+        """Store the metadata of an input file in the index"""
+        self._set_row("datasets", path_in, {
+            "pixel_size": pixel_size,
+            "pixel_size_valid": pixel_size_valid,
+            "image_shape": json.dumps(
+                None if image_shape is None else list(image_shape)),
+            "event_count": event_count,
+        })
+
+    def get_flickering(self,
+                       path_in: pathlib.Path,
+                       detector_id: str) -> bool | None:
+        """Return the indexed flickering detection result of an input file
+
+        The `detector_id` identifies the parameters used for flickering
+        detection. Returns None if the file is not indexed for this
+        detector or if it was modified.
+        """
+        row = self._get_row("flickering", path_in, ["flickering"],
+                            keys={"detector": detector_id})
+        return None if row is None else bool(row[0])
+
+    def set_flickering(self,
+                       path_in: pathlib.Path,
+                       detector_id: str,
+                       flickering: bool):
+        """Store the flickering detection result of an input file"""
+        self._set_row("flickering", path_in,
+                      {"detector": detector_id,
+                       "flickering": int(flickering)})
+
+    def get_output_hash(self, path_out: pathlib.Path) -> str | None:
+        """Return the indexed pipeline hash of an output file
+
+        Returns None if the file is not indexed or if it was modified.
+        """
+        row = self._get_row("outputs", path_out, ["pphash"])
+        return None if row is None else row[0]
+
+    def set_output_hash(self, path_out: pathlib.Path, pphash: str):
+        """Store the pipeline hash of an output file in the index"""
+        self._set_row("outputs", path_out, {"pphash": pphash})
@@ -0,0 +1,194 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import fnmatch
+import os
+import pathlib
+from typing import Iterator, List, Sequence
+
+
+#: Default number of threads for listing directories
+DISCOVERY_THREADS = 16
+
+
+class InputDiscovery:
+    def __init__(self,
+                 path: pathlib.Path | str,
+                 include: Sequence[str] = ("*.rtdc",),
+                 exclude: Sequence[str] = ("*_dcn.rtdc",),
+                 max_depth: int | None = None,
+                 num_threads: int = DISCOVERY_THREADS,
+                 follow_symlinks: bool = True):
+        """Find input files in a large directory tree
+
+        Listing a directory on a network share takes a long time,
+        mostly waiting for the file server. The directories are
+        therefore listed with :func:`os.scandir` in a thread pool:
+        As soon as a directory is listed, its subdirectories are
+        submitted to the pool. The files found are yielded in the
+        same order as ``sorted(path.rglob(pattern))`` while the rest
+        of the tree is still being listed, so that the first input
+        file can be processed right away. Unlike
+        :func:`pathlib.Path.rglob`, symbolic links to directories are
+        searched by default.
+
+        Parameters
+        ----------
+        path:
+            directory to search
+        include:
+            file name patterns (see :func:`fnmatch.fnmatch`) of the
+            files to yield
+        exclude:
+            name patterns of files and directories to ignore
+        max_depth:
+            maximum depth of the subdirectories to search; 0 means
+            that only files directly in `path` are yielded
+        num_threads:
+            number of threads for listing directories
+        follow_symlinks:
+            whether to search symbolic links to directories; a link
+            to a directory that contains the link (loop) is ignored
+        """
+        self.path = pathlib.Path(path)
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.max_depth = max_depth
+        self.num_threads = num_threads
+        self.follow_symlinks = follow_symlinks
+        self._pool = None
+
+    def __iter__(self) -> Iterator[pathlib.Path]:
+        with ThreadPoolExecutor(max_workers=self.num_threads,
+                                thread_name_prefix="ChipStreamDiscovery"
+                                ) as pool:
+            self._pool = pool
+            try:
+                # Depth-first traversal with a stack of directory
+                # listings, each a list of tuples (path, future), where
+                # future is None for files and the listing of a
+                # subdirectory otherwise. Like the parts-wise comparison
+                # of `pathlib.Path`, files and subdirectories are sorted
+                # by name together.
+                stack = [iter(self.scan(self.path,
+                                        depth=0,
+                                        parents=(get_dir_id(self.path),)))]
+                while stack:
+                    item = next(stack[-1], None)
+                    if item is None:
+                        stack.pop()
+                    elif item[1] is None:
+                        yield item[0]
+                    else:
+                        stack.append(iter(item[1].result()))
+            finally:
+                self._pool = None
+                # Do not list the remaining directories.
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def is_excluded(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pat) for pat in self.exclude)
+
+    def is_included(self, name: str) -> bool:
+        return (any(fnmatch.fnmatch(name, pat) for pat in self.include)
+                and not self.is_excluded(name))
+
+    def list_dir(self, path: pathlib.Path, depth: int) -> List[tuple]:
+        """List the input files and subdirectories to search in `path`
+
+        Returns a list of tuples (path, is_dir) sorted by name.
+        Directories that cannot be read are ignored, like in
+        :func:`pathlib.Path.rglob`. `depth` is the depth of `path`
+        relative to the search directory.
+        """
+        items = []
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            return items
+        for entry in sorted(entries, key=lambda e: e.name):
+            try:
+                is_dir = entry.is_dir(follow_symlinks=self.follow_symlinks)
+            except OSError:
+                continue
+            if is_dir:
+                if ((self.max_depth is not None and depth >= self.max_depth)
+                        or self.is_excluded(entry.name)):
+                    continue
+                items.append((pathlib.Path(entry.path), True))
+            elif self.is_included(entry.name):
+                items.append((pathlib.Path(entry.path), False))
+        return items
+
+    def scan(self,
+             path: pathlib.Path,
+             depth: int,
+             parents: tuple = ()) -> List[tuple]:
+        """List a directory and submit its subdirectories for listing
+
+        Returns a list of tuples (path, future) sorted by name. For
+        input files, future is None. For subdirectories, future is a
+        :class:`concurrent.futures.Future` of the listing of the
+        subdirectory. `parents` are the identifiers (see
+        :func:`get_dir_id`) of `path` and of all directories above it,
+        which are used to detect loops of symbolic links.
+        """
+        items = []
+        for pp, is_dir in self.list_dir(path, depth):
+            if is_dir:
+                if self.follow_symlinks:
+                    dir_id = get_dir_id(pp)
+                    if dir_id is None or dir_id in parents:
+                        continue
+                    future = self.submit(pp, depth + 1, parents + (dir_id,))
+                else:
+                    future = self.submit(pp, depth + 1)
+                if future is not None:
+                    items.append((pp, future))
+            else:
+                items.append((pp, None))
+        return items
+
+    def submit(self,
+               path: pathlib.Path,
+               depth: int,
+               parents: tuple = ()) -> Future | None:
+        pool = self._pool
+        if pool is None:
+            return None
+        try:
+            return pool.submit(self.scan, path, depth, parents)
+        except RuntimeError:
+            # The pool was shut down, because iteration stopped.
+            return None
+
+
+def get_dir_id(path: pathlib.Path | str) -> tuple[int, int] | None:
+    """Return a tuple (device, inode) identifying a directory
+
+    Symbolic links are resolved. Returns None if the directory
+    cannot be accessed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def iter_input_files(path: pathlib.Path | str,
+                     include: Sequence[str] = ("*.rtdc",),
+                     exclude: Sequence[str] = ("*_dcn.rtdc",),
+                     max_depth: int | None = None,
+                     num_threads: int = DISCOVERY_THREADS,
+                     follow_symlinks: bool = True,
+                     ) -> Iterator[pathlib.Path]:
+    """Yield the input files in a directory tree in sorted order
+
+    See :class:`InputDiscovery` for the parameters.
+    """
+    yield from InputDiscovery(path=path,
+                              include=include,
+                              exclude=exclude,
+                              max_depth=max_depth,
+                              num_threads=num_threads,
+                              follow_symlinks=follow_symlinks)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import atexit
+import collections
 import functools
 from importlib import import_module
 import importlib.resources
@@ -9,6 +10,8 @@ import logging
 import pathlib
 import signal
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import webbrowser
@@ -21,7 +24,12 @@ from PyQt6 import QtCore, QtGui, QtWidgets
 from PyQt6.QtCore import QStandardPaths
 from torch.cuda import is_available as cuda_is_available
 
+from ..dataset_index import DatasetIndex, get_default_index_path
+from ..discovery import iter_input_files
+from ..job_order import ORDER_STRATEGIES
 from ..path_cache import PathCache
+from ..preview import format_duration
+from ..watch import FolderWatcher
 from .._version import version
 
 from .main_window_ui import Ui_MainWindow
@@ -40,7 +48,8 @@ class ChipStream(QtWidgets.QMainWindow):
         application will print the version after initialization
         and exit.
         """
-        self.job_manager = ChipStreamJobManager()
+        self.job_manager = ChipStreamJobManager(
+            dataset_index=DatasetIndex(get_default_index_path()))
         QtWidgets.QMainWindow.__init__(self)
 
         self.ui = Ui_MainWindow()
@@ -125,6 +134,23 @@ class ChipStream(QtWidgets.QMainWindow):
         # Maximum CPU count
         self.ui.spinBox_procs.setMaximum(cpu_count())
         self.ui.spinBox_procs.setValue(cpu_count())
+        # Memory budget (GiB) at most the total memory
+        self.ui.doubleSpinBox_max_memory.setMaximum(
+            psutil.virtual_memory().total / 1024**3)
+        # Staging directory for input files
+        self.ui.lineEdit_stage_dir.setText(self.settings.value(
+            "processing/stage_dir",
+            str(pathlib.Path(tempfile.gettempdir()) / "ChipStream-staging")))
+        self.ui.checkBox_stage.toggled.connect(
+            self.ui.lineEdit_stage_dir.setEnabled)
+        self.ui.checkBox_stage.toggled.connect(
+            self.ui.toolButton_stage_dir.setEnabled)
+        self.ui.checkBox_stage.toggled.connect(
+            self.ui.doubleSpinBox_stage_max_size.setEnabled)
+        self.ui.toolButton_stage_dir.clicked.connect(self.on_stage_dir)
+        # Processing order
+        for strategy, description in ORDER_STRATEGIES.items():
+            self.ui.comboBox_order.addItem(description, strategy)
 
         # GUI
         self.setWindowTitle(f"ChipStream {version}")
@@ -134,6 +160,7 @@ class ChipStream(QtWidgets.QMainWindow):
         # File menu
         self.ui.actionAdd.triggered.connect(self.on_action_add)
         self.ui.actionClear.triggered.connect(self.on_action_clear)
+        self.ui.actionWatch.toggled.connect(self.on_action_watch)
         self.ui.actionQuit.triggered.connect(self.on_action_quit)
         # Help menu
         self.ui.actionDocumentation.triggered.connect(self.on_action_docs)
@@ -142,6 +169,7 @@ class ChipStream(QtWidgets.QMainWindow):
 
         # Command button
         self.ui.pushButton_run.clicked.connect(self.on_run)
+        self.ui.pushButton_preview.clicked.connect(self.on_preview)
 
         # Path selection
         cache_loc = pathlib.Path(
@@ -158,6 +186,9 @@ class ChipStream(QtWidgets.QMainWindow):
         self.ui.comboBox_output.addItem("Select output directory", "new")
         self.ui.comboBox_output.currentIndexChanged.connect(self.on_path_out)
 
+        #: Whether the last run was a preview (see :func:`on_preview`)
+        self.preview = False
+
         # Signals
         self.run_completed.connect(self.on_run_completed)
         self.ui.tableWidget_input.row_selected.connect(self.on_select_job)
@@ -175,6 +206,22 @@ class ChipStream(QtWidgets.QMainWindow):
             self.ui.tableWidget_input.on_selection_changed)
         self.timer.start(1000)
 
+        # Watch mode: new input files found by `self.watcher` are
+        # processed whenever the job manager is idle.
+        self.watcher = None
+        self.timer_watch = QtCore.QTimer()
+        self.timer_watch.timeout.connect(self.on_watch_timer)
+
+        # Dropped directories are searched in background threads and
+        # the input files are added as soon as they are found.
+        self.dropped_paths = collections.deque()
+        self.discovery_threads = []
+        self.discovery_stop = threading.Event()
+        #: Whether input files found after a run was started are processed
+        self.run_dropped = False
+        self.timer_drop = QtCore.QTimer()
+        self.timer_drop.timeout.connect(self.on_drop_timer)
+
         splash.splash_close()
 
         # finalize
@@ -191,6 +238,9 @@ class ChipStream(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot(QtCore.QEvent)
     def closeEvent(self, event):
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.discovery_stop.set()
         jobs_running = self.is_running()
         if jobs_running:
             self.job_manager.close(force=True)
@@ -202,6 +252,20 @@ class ChipStream(QtWidgets.QMainWindow):
             # ourselves.
             psutil.Process().kill()
 
+    def discover_paths(self, path, stop):
+        """Search a dropped directory for input files (background thread)
+
+        The input files are added to `self.dropped_paths` as they are
+        found. Setting the :class:`threading.Event` `stop` stops the
+        search.
+        """
+        # Output files ("*_dcn.rtdc") are not excluded, like in the
+        # file dialog.
+        for pi in iter_input_files(path, exclude=()):
+            if stop.is_set():
+                break
+            self.dropped_paths.append(pi)
+
     @QtCore.pyqtSlot(QtCore.QEvent)
     def dragEnterEvent(self, e):
         """Whether files are accepted"""
@@ -212,17 +276,49 @@ class ChipStream(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot(QtCore.QEvent)
     def dropEvent(self, e):
-        """Add dropped files to view"""
+        """Add dropped files to view
+
+        Dropped directories are searched in the background (see
+        :func:`discover_paths`) and :func:`on_drop_timer` adds the
+        files found while the search is still running.
+        """
         urls = e.mimeData().urls()
-        pathlist = []
         for ff in urls:
             pp = pathlib.Path(ff.toLocalFile())
             if pp.is_dir():
-                for pi in pp.rglob("*.rtdc"):
-                    pathlist.append(pi)
+                thread = threading.Thread(target=self.discover_paths,
+                                          args=(pp, self.discovery_stop),
+                                          name="ChipStreamDropDiscovery",
+                                          daemon=True)
+                thread.start()
+                self.discovery_threads.append(thread)
             elif pp.suffix == ".rtdc":
-                pathlist.append(pp)
-        self.append_paths(pathlist)
+                self.dropped_paths.append(pp)
+        self.timer_drop.start(200)
+        self.on_drop_timer()
+
+    def get_flickering_kwargs(self):
+        if self.ui.checkBox_flickering_sampled.isChecked():
+            return {"num_chunks": 10}
+        else:
+            return {}
+
+    def get_max_memory(self):
+        """Return the memory budget in bytes or None if not set"""
+        max_memory = self.ui.doubleSpinBox_max_memory.value()
+        return int(max_memory * 1024**3) if max_memory else None
+
+    def get_stage_dir(self):
+        """Return the staging directory or None if staging is disabled"""
+        stage_dir = self.ui.lineEdit_stage_dir.text().strip()
+        if self.ui.checkBox_stage.isChecked() and stage_dir:
+            return pathlib.Path(stage_dir)
+        return None
+
+    def get_stage_max_size(self):
+        """Return the maximum size of the staging area in bytes or None"""
+        max_size = self.ui.doubleSpinBox_stage_max_size.value()
+        return int(max_size * 1024**3) if max_size else None
 
     def get_job_kwargs(self):
         # did the user select a pixel size?
@@ -273,6 +369,17 @@ class ChipStream(QtWidgets.QMainWindow):
 
         return job_kwargs
 
+    def get_run_kwargs(self):
+        """Keyword arguments for running jobs with the job manager"""
+        return dict(
+            job_kwargs=self.get_job_kwargs(),
+            callback_when_done=self.run_completed.emit,
+            flickering_kwargs=self.get_flickering_kwargs(),
+            max_memory=self.get_max_memory(),
+            stage_dir=self.get_stage_dir(),
+            stage_max_size=self.get_stage_max_size(),
+            preview=self.preview)
+
     def is_running(self):
         return self.job_manager.is_busy()
 
@@ -307,9 +414,75 @@ class ChipStream(QtWidgets.QMainWindow):
     @QtCore.pyqtSlot()
     def on_action_clear(self):
         """Clear the current table view"""
+        # Stop searching dropped directories.
+        self.discovery_stop.set()
+        self.discovery_stop = threading.Event()
+        self.dropped_paths.clear()
         self.job_manager.clear()
         self.ui.tableWidget_input.update_from_job_manager()
 
+    @QtCore.pyqtSlot(bool)
+    def on_action_watch(self, checked):
+        """Start or stop watching a directory for new input files"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+            self.timer_watch.stop()
+        if checked:
+            path = QtWidgets.QFileDialog.getExistingDirectory(
+                self,
+                "Select directory to watch",
+                self.settings.value("paths/watch_dir", ""))
+            if not path:
+                # User pressed cancel
+                self.ui.actionWatch.blockSignals(True)
+                self.ui.actionWatch.setChecked(False)
+                self.ui.actionWatch.blockSignals(False)
+                return
+            self.settings.setValue("paths/watch_dir", path)
+            self.watcher = FolderWatcher(path)
+            self.watcher.start()
+            self.timer_watch.start(1000)
+            self.ui.statusbar.showMessage(f"Watching {path}")
+        else:
+            self.ui.statusbar.clearMessage()
+
+    @QtCore.pyqtSlot()
+    def on_watch_timer(self):
+        """Add new files found by the watcher and process them
+
+        Only the new files are processed; failed jobs are not retried.
+        """
+        if self.watcher is None or self.job_manager.is_busy():
+            return
+        paths = self.watcher.get_ready_paths()
+        if paths:
+            self.preview = False
+            self.run_paths(paths)
+
+    @QtCore.pyqtSlot()
+    def on_drop_timer(self):
+        """Add input files found in dropped directories
+
+        Files found after the user started a run are processed as
+        soon as the job manager is idle.
+        """
+        self.discovery_threads = [th for th in self.discovery_threads
+                                  if th.is_alive()]
+        if self.job_manager.is_busy():
+            return
+        paths = []
+        while self.dropped_paths:
+            paths.append(self.dropped_paths.popleft())
+        if paths:
+            if self.run_dropped:
+                self.run_paths(paths)
+            else:
+                self.append_paths(paths)
+        elif not self.discovery_threads:
+            self.timer_drop.stop()
+            self.run_dropped = False
+
     @QtCore.pyqtSlot()
     def on_action_docs(self):
         webbrowser.open("https://chipstream.readthedocs.io")
@@ -390,19 +563,33 @@ class ChipStream(QtWidgets.QMainWindow):
             self.job_manager.set_output_path(self.path_cache[data])
 
     @QtCore.pyqtSlot()
-    def on_run(self):
+    def on_preview(self):
+        """Preview the analysis and predict the processing time"""
+        self.on_run(preview=True)
+
+    @QtCore.pyqtSlot()
+    def on_run(self, preview=False):
         """Run the analysis"""
         # When we start running, we disable all the controls until we are
         # finished. The user can still add items to the list but not
         # change the pipeline.
         self.ui.widget_options.setEnabled(False)
-        self.job_manager.run_all_in_thread(
-            job_kwargs=self.get_job_kwargs(),
-            callback_when_done=self.run_completed.emit)
+        self.job_manager.order_paths(self.ui.comboBox_order.currentData())
+        self.ui.tableWidget_input.update_from_job_manager()
+        self.preview = preview
+        # Files that are still being searched are processed afterwards.
+        self.run_dropped = bool(self.discovery_threads or self.dropped_paths)
+        self.job_manager.run_all_in_thread(**self.get_run_kwargs())
 
     @QtCore.pyqtSlot()
     def on_run_completed(self):
         self.ui.widget_options.setEnabled(True)
+        if self.preview:
+            predicted_time = self.job_manager.get_predicted_time()
+            if predicted_time is not None:
+                self.ui.statusbar.showMessage(
+                    f"Predicted processing time: "
+                    f"{format_duration(predicted_time)}")
 
     @QtCore.pyqtSlot(int)
     def on_select_job(self, row):
@@ -421,6 +608,18 @@ class ChipStream(QtWidgets.QMainWindow):
                 # Automatically scroll to the bottom
                 sb.setValue(sb.maximum())
 
+    @QtCore.pyqtSlot()
+    def on_stage_dir(self):
+        """Ask the user for the staging directory and remember it"""
+        path = QtWidgets.QFileDialog.getExistingDirectory(
+            self,
+            "Choose staging directory (e.g. on a local SSD)",
+            self.ui.lineEdit_stage_dir.text(),
+        )
+        if path:
+            self.ui.lineEdit_stage_dir.setText(path)
+            self.settings.setValue("processing/stage_dir", path)
+
     @QtCore.pyqtSlot()
     def on_torch_model_add(self):
         """Ask the user for a path to a .dcnm file and remember it"""
@@ -451,6 +650,16 @@ class ChipStream(QtWidgets.QMainWindow):
         dlg = TorchModelProperties(self, model_file)
         dlg.exec()
 
+    def run_paths(self, paths):
+        """Add input paths and process only these paths
+
+        Jobs that were run before keep their state (see
+        :func:`.ChipStreamJobManager.run_paths`).
+        """
+        self.ui.widget_options.setEnabled(False)
+        self.job_manager.run_paths(paths, **self.get_run_kwargs())
+        self.ui.tableWidget_input.update_from_job_manager()
+
 
 @functools.lru_cache(maxsize=100)
 def get_icon(name):
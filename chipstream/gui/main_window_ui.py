@@ -222,16 +222,53 @@ class Ui_MainWindow(object):
         self.spinBox_procs.setMaximum(64)
         self.spinBox_procs.setObjectName("spinBox_procs")
         self.verticalLayout_8.addWidget(self.spinBox_procs)
+        self.doubleSpinBox_max_memory = QtWidgets.QDoubleSpinBox(parent=self.groupBox_6)
+        self.doubleSpinBox_max_memory.setDecimals(1)
+        self.doubleSpinBox_max_memory.setMinimum(0.0)
+        self.doubleSpinBox_max_memory.setMaximum(4096.0)
+        self.doubleSpinBox_max_memory.setSingleStep(1.0)
+        self.doubleSpinBox_max_memory.setObjectName("doubleSpinBox_max_memory")
+        self.verticalLayout_8.addWidget(self.doubleSpinBox_max_memory)
         self.comboBox_output = QtWidgets.QComboBox(parent=self.groupBox_6)
         self.comboBox_output.setObjectName("comboBox_output")
         self.comboBox_output.addItem("")
         self.comboBox_output.addItem("")
         self.verticalLayout_8.addWidget(self.comboBox_output)
+        self.comboBox_order = QtWidgets.QComboBox(parent=self.groupBox_6)
+        self.comboBox_order.setObjectName("comboBox_order")
+        self.verticalLayout_8.addWidget(self.comboBox_order)
+        self.horizontalLayout_stage = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_stage.setObjectName("horizontalLayout_stage")
+        self.checkBox_stage = QtWidgets.QCheckBox(parent=self.groupBox_6)
+        self.checkBox_stage.setObjectName("checkBox_stage")
+        self.horizontalLayout_stage.addWidget(self.checkBox_stage)
+        self.lineEdit_stage_dir = QtWidgets.QLineEdit(parent=self.groupBox_6)
+        self.lineEdit_stage_dir.setEnabled(False)
+        self.lineEdit_stage_dir.setObjectName("lineEdit_stage_dir")
+        self.horizontalLayout_stage.addWidget(self.lineEdit_stage_dir)
+        self.toolButton_stage_dir = QtWidgets.QToolButton(parent=self.groupBox_6)
+        self.toolButton_stage_dir.setEnabled(False)
+        self.toolButton_stage_dir.setObjectName("toolButton_stage_dir")
+        self.horizontalLayout_stage.addWidget(self.toolButton_stage_dir)
+        self.verticalLayout_8.addLayout(self.horizontalLayout_stage)
+        self.doubleSpinBox_stage_max_size = QtWidgets.QDoubleSpinBox(parent=self.groupBox_6)
+        self.doubleSpinBox_stage_max_size.setEnabled(False)
+        self.doubleSpinBox_stage_max_size.setDecimals(1)
+        self.doubleSpinBox_stage_max_size.setMaximum(100000.0)
+        self.doubleSpinBox_stage_max_size.setSingleStep(10.0)
+        self.doubleSpinBox_stage_max_size.setObjectName("doubleSpinBox_stage_max_size")
+        self.verticalLayout_8.addWidget(self.doubleSpinBox_stage_max_size)
         self.checkBox_basins = QtWidgets.QCheckBox(parent=self.groupBox_6)
         self.checkBox_basins.setChecked(True)
         self.checkBox_basins.setObjectName("checkBox_basins")
         self.verticalLayout_8.addWidget(self.checkBox_basins)
+        self.checkBox_flickering_sampled = QtWidgets.QCheckBox(parent=self.groupBox_6)
+        self.checkBox_flickering_sampled.setObjectName("checkBox_flickering_sampled")
+        self.verticalLayout_8.addWidget(self.checkBox_flickering_sampled)
         self.verticalLayout.addWidget(self.groupBox_6)
+        self.pushButton_preview = QtWidgets.QPushButton(parent=self.widget_options)
+        self.pushButton_preview.setObjectName("pushButton_preview")
+        self.verticalLayout.addWidget(self.pushButton_preview)
         self.pushButton_run = QtWidgets.QPushButton(parent=self.widget_options)
         self.pushButton_run.setObjectName("pushButton_run")
         self.verticalLayout.addWidget(self.pushButton_run)
@@ -264,11 +301,15 @@ class Ui_MainWindow(object):
         self.actionAdd.setObjectName("actionAdd")
         self.actionClear = QtGui.QAction(parent=MainWindow)
         self.actionClear.setObjectName("actionClear")
+        self.actionWatch = QtGui.QAction(parent=MainWindow)
+        self.actionWatch.setCheckable(True)
+        self.actionWatch.setObjectName("actionWatch")
         self.menuHelp.addAction(self.actionDocumentation)
         self.menuHelp.addAction(self.actionSoftware)
         self.menuHelp.addAction(self.actionAbout)
         self.menuFile.addAction(self.actionAdd)
         self.menuFile.addAction(self.actionClear)
+        self.menuFile.addAction(self.actionWatch)
         self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionQuit)
         self.menubar.addAction(self.menuFile.menuAction())
@@ -319,10 +360,24 @@ class Ui_MainWindow(object):
         self.groupBox_6.setTitle(_translate("MainWindow", "Processing"))
         self.spinBox_procs.setToolTip(_translate("MainWindow", "Number of CPU threads to use, reduce if you need a responsive system"))
         self.spinBox_procs.setSuffix(_translate("MainWindow", " Worker threads"))
+        self.doubleSpinBox_max_memory.setToolTip(_translate("MainWindow", "Memory budget for processing; the number of worker threads and the image chunk size are reduced if a job would require more memory"))
+        self.doubleSpinBox_max_memory.setSpecialValueText(_translate("MainWindow", "No memory limit"))
+        self.doubleSpinBox_max_memory.setSuffix(_translate("MainWindow", " GiB memory limit"))
         self.comboBox_output.setItemText(0, _translate("MainWindow", "Output alongside input files"))
         self.comboBox_output.setItemText(1, _translate("MainWindow", "Select output path..."))
+        self.comboBox_order.setToolTip(_translate("MainWindow", "Order in which the input files are processed. Processing large files first avoids waiting for a single large file at the end, processing small files first yields the first results quickly."))
+        self.checkBox_stage.setToolTip(_translate("MainWindow", "Copy each input file to a local staging directory and process the copy; the next input file is copied while the current file is processed. Use this for input files on slow network shares."))
+        self.checkBox_stage.setText(_translate("MainWindow", "Stage inputs in"))
+        self.toolButton_stage_dir.setText(_translate("MainWindow", "..."))
+        self.doubleSpinBox_stage_max_size.setToolTip(_translate("MainWindow", "Maximum total size of the files in the staging directory; input files that do not fit are processed without staging"))
+        self.doubleSpinBox_stage_max_size.setSpecialValueText(_translate("MainWindow", "No staging size limit"))
+        self.doubleSpinBox_stage_max_size.setSuffix(_translate("MainWindow", " GiB staging limit"))
         self.checkBox_basins.setToolTip(_translate("MainWindow", "Produce smaller output files faster by referring to the input data via basins"))
         self.checkBox_basins.setText(_translate("MainWindow", "Exploit basins"))
+        self.checkBox_flickering_sampled.setToolTip(_translate("MainWindow", "Detect flickering from a fixed number of image chunks distributed over the entire dataset, so that the time required for flickering detection does not depend on dataset size"))
+        self.checkBox_flickering_sampled.setText(_translate("MainWindow", "Sampled flickering detection"))
+        self.pushButton_preview.setToolTip(_translate("MainWindow", "Process an evenly spread sample of events of each input file and predict the processing time of a full run"))
+        self.pushButton_preview.setText(_translate("MainWindow", "Preview"))
         self.pushButton_run.setText(_translate("MainWindow", "   Run Pipeline"))
         self.menuHelp.setTitle(_translate("MainWindow", "Help"))
         self.menuFile.setTitle(_translate("MainWindow", "File"))
@@ -333,4 +388,6 @@ class Ui_MainWindow(object):
         self.actionQuit.setText(_translate("MainWindow", "Quit"))
         self.actionAdd.setText(_translate("MainWindow", "Add data"))
         self.actionClear.setText(_translate("MainWindow", "Clear list"))
+        self.actionWatch.setText(_translate("MainWindow", "Watch directory..."))
+        self.actionWatch.setToolTip(_translate("MainWindow", "Process new files in a directory as soon as they are completely written"))
 from chipstream.gui.table_progress import ProgressTable
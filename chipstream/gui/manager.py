@@ -2,24 +2,42 @@ from __future__ import annotations
 
 import copy
 from functools import lru_cache
+import json
 import pathlib
 import threading
 import traceback
 from typing import Callable
-import warnings
 
+from dcnum.common import cpu_count
 import dcnum.read
 from dcnum import logic as dclogic
-import h5py
 import psutil
 
+from ..background_cache import BackgroundCache
+from ..dataset_index import DatasetIndex
+from ..input_probe import InputProbe
+from ..job_order import order_paths
+from ..job_report import (
+    JobReporter, format_report, get_report_path, write_report
+)
+from ..memory import DEFAULT_CHUNK_SIZE, fit_job_to_memory
+from ..model_cache import preload_model, sync_model_cache
+from ..output_state import get_output_state
+from ..prefetch import prefetch
+from ..preview import (
+    extrapolate_runtime, get_preview_mapping, get_preview_path
+)
+from ..progress import monitor_runner
+from ..resume import ResumableJobRunner
+from ..staging import StagingArea, stage_job, unstage_job
+
 
 class JobStillRunningError(BaseException):
     pass
 
 
 class ChipStreamJobManager:
-    def __init__(self):
+    def __init__(self, dataset_index: DatasetIndex | None = None):
         #: Input path list containing tuples of (path, state-string) for
         #: each input path. This is a list that is shared with the worker
         #: thread and kept updated by the worker during the run.
@@ -30,6 +48,9 @@ class ChipStreamJobManager:
         self._runner_list = []
         self._worker = None
         self.busy_lock = threading.Lock()
+        #: Persistent index for looking up input metadata and output
+        #: pipeline hashes
+        self.dataset_index = dataset_index
 
     def __getitem__(self, index):
         runner = self.get_runner(index)
@@ -85,7 +106,9 @@ class ChipStreamJobManager:
                 "Manager is busy, use `force=True` to close regardless")
 
     def is_busy(self):
-        return self.busy_lock.locked()
+        # The worker might not have acquired the lock yet.
+        return (self.busy_lock.locked()
+                or (self._worker is not None and self._worker.is_alive()))
 
     def join(self):
         if self._worker is not None and self._worker.is_alive():
@@ -99,7 +122,12 @@ class ChipStreamJobManager:
             if runner.state == "error":
                 return str(runner.error_tb)
             elif runner.state == "done":
-                return fetch_dcnum_log_from_file(runner.job["path_out"])
+                info = fetch_dcnum_log_from_file(runner.job["path_out"])
+                path_report = get_report_path(runner.job["path_out"])
+                if path_report.exists():
+                    report = json.loads(path_report.read_text())
+                    info = format_report(report) + "\n\n" + info
+                return info
             else:
                 # Open currently running log
                 return runner.path_log.read_text()
@@ -143,6 +171,26 @@ class ChipStreamJobManager:
                     pout.append(self._path_out / anch / prel)
         return pout
 
+    def get_predicted_time(self) -> float | None:
+        """Return the predicted time for processing all input files
+
+        The prediction is the sum of the predictions of the last
+        preview run (see :func:`run_all_in_thread`). Returns None if
+        there are no predictions.
+        """
+        predicted_time = None
+        for runner in self._runner_list:
+            if runner is None or runner.state != "done":
+                continue
+            path_report = get_report_path(runner.job["path_out"])
+            try:
+                report = json.loads(path_report.read_text())
+                predicted_time = (predicted_time or 0) \
+                    + report["preview"]["predicted_time"]
+            except (OSError, KeyError, ValueError):
+                continue
+        return predicted_time
+
     def get_paths_in(self):
         """Return input path list"""
         return [pp[0] for pp in self._path_in_list]
@@ -153,9 +201,37 @@ class ChipStreamJobManager:
         else:
             return self._runner_list[index]
 
+    def order_paths(self, strategy: str):
+        """Change the order in which the input paths are processed
+
+        See :func:`.job_order.order_paths` for the available strategies.
+        The paths are only reordered if the manager is not busy, and
+        the runners of a previous run are discarded.
+        """
+        if not self.is_busy():
+            self._path_in_list[:] = order_paths(
+                self._path_in_list,
+                strategy=strategy,
+                key=lambda pp: pp[0],
+                dataset_index=self.dataset_index)
+            self._runner_list.clear()
+
     def run_all_in_thread(self,
                           job_kwargs: dict | None = None,
-                          callback_when_done: Callable | None = None):
+                          callback_when_done: Callable | None = None,
+                          recompute_flickering: bool = False,
+                          flickering_kwargs: dict | None = None,
+                          max_memory: int | None = None,
+                          stage_dir: pathlib.Path | None = None,
+                          stage_max_size: int | None = None,
+                          preview: bool = False,
+                          indices: list[int] | None = None):
+        """Process the input paths in a background thread
+
+        If `indices` is given, only the input paths with these indices
+        are processed and all other input paths keep their state.
+        See :class:`JobWorker` for the other parameters.
+        """
         if job_kwargs is None:
             job_kwargs = {}
         self._worker = JobWorker(paths_in=self._path_in_list,
@@ -164,9 +240,34 @@ class ChipStreamJobManager:
                                  runners=self._runner_list,
                                  busy_lock=self.busy_lock,
                                  callback_when_done=callback_when_done,
+                                 dataset_index=self.dataset_index,
+                                 recompute_flickering=recompute_flickering,
+                                 flickering_kwargs=flickering_kwargs,
+                                 max_memory=max_memory,
+                                 stage_dir=stage_dir,
+                                 stage_max_size=stage_max_size,
+                                 preview=preview,
+                                 indices=indices,
                                  )
         self._worker.start()
 
+    def run_paths(self, paths, **kwargs):
+        """Add input paths and process only these paths in a thread
+
+        In contrast to :func:`run_all_in_thread`, the input paths that
+        were added before are not processed again (e.g. failed jobs
+        are not retried). See :func:`run_all_in_thread` for the
+        keyword arguments.
+        """
+        if self.is_busy():
+            raise ValueError("Manager is busy, cannot run new paths")
+        start = len(self._path_in_list)
+        for pp in paths:
+            self._path_in_list.append([pathlib.Path(pp), "created"])
+        self.run_all_in_thread(
+            indices=list(range(start, len(self._path_in_list))),
+            **kwargs)
+
     def set_output_path(self, path_out):
         if path_out is not None:
             path_out = pathlib.Path(path_out)
@@ -193,6 +294,14 @@ class JobWorker(threading.Thread):
                  busy_lock: threading.Lock | None = None,
                  callback_when_done: Callable | None = None,
                  override: bool = False,
+                 dataset_index: DatasetIndex | None = None,
+                 recompute_flickering: bool = False,
+                 flickering_kwargs: dict | None = None,
+                 max_memory: int | None = None,
+                 stage_dir: pathlib.Path | None = None,
+                 stage_max_size: int | None = None,
+                 preview: bool = False,
+                 indices: list[int] | None = None,
                  *args, **kwargs):
         """Thread for running the pipeline
 
@@ -205,7 +314,8 @@ class JobWorker(threading.Thread):
         job_kwargs:
             List of keyword arguments for the DCNumJob instance
         runners:
-            Empty list which is filled with runner instances
+            List which is filled with the runner instance of each item
+            in `paths_in` (same index, None for items not processed)
         busy_lock:
             This threading.Lock is locked during processing
         callback_when_done:
@@ -214,6 +324,34 @@ class JobWorker(threading.Thread):
             Whether to override the output file if it already exists.
             This does not override files that already have the correct
             pipeline identifiers.
+        dataset_index:
+            Persistent index for looking up and storing input file
+            metadata and the pipeline hashes of output files
+        recompute_flickering:
+            Whether to detect flickering even if the result is already
+            stored in `dataset_index`
+        flickering_kwargs:
+            Keyword arguments for :func:`.input_probe.detect_flickering`
+        max_memory:
+            Memory budget in bytes; the number of processes and the
+            image chunk size of each job are reduced accordingly
+            (see :func:`.memory.fit_job_to_memory`)
+        stage_dir:
+            Staging directory; if set, the input files are copied
+            to this directory ahead of processing and the jobs read
+            from the copies (see :class:`.staging.StagingArea`)
+        stage_max_size:
+            Maximum total size of the files in `stage_dir` in bytes
+        preview:
+            Only process an evenly spread sample of the events of
+            each input file (see :func:`.preview.get_preview_mapping`)
+            and write a preview output file (see
+            :func:`.preview.get_preview_path`), whose report contains
+            the predicted time of a full run; staging and the
+            background cache are not used in this mode
+        indices:
+            Indices of the items in `paths_in` to process; if not set,
+            all items are processed and `runners` is cleared first
         """
         super(JobWorker, self).__init__(*args, **kwargs)
         self.paths_in = paths_in
@@ -224,70 +362,175 @@ class JobWorker(threading.Thread):
         self.busy_lock = busy_lock or threading.Lock()
         self.callback_when_done = callback_when_done
         self.override = override
+        self.dataset_index = dataset_index
+        self.recompute_flickering = recompute_flickering
+        self.flickering_kwargs = flickering_kwargs
+        self.max_memory = max_memory
+        self.stage_dir = stage_dir
+        self.stage_max_size = stage_max_size
+        self.staging_area = None
+        self.preview = preview
+        self.indices = indices
+        #: Event counts of the input files by output path (preview mode)
+        self.event_counts = {}
 
     def run(self):
         with self.busy_lock:
-            self.runners.clear()
-            # reset all job states
-            [pp.__setitem__(1, "created") for pp in self.paths_in]
-            # run jobs
-            for ii, (pp, _) in enumerate(self.paths_in):
-                try:
-                    self.run_job(path_in=pp, path_out=self.paths_out[ii])
-                except BaseException:
-                    # Create a dummy error runner
-                    self.runners.append(ErrorredRunner(traceback.format_exc()))
-                # write final state to path list
-                runner = self.runners[ii]
-                self.paths_in[ii][1] = runner.get_status()["state"]
+            if self.indices is None:
+                indices = list(range(len(self.paths_in)))
+                self.runners.clear()
+            else:
+                indices = list(self.indices)
+            # reset the job states
+            for ii in indices:
+                self.paths_in[ii][1] = "created"
+            # The preflight checks of the next job are performed in
+            # a background thread while the current job is running.
+            kwargs_list = [{"path_in": self.paths_in[ii][0],
+                            "path_out": self.paths_out[ii]}
+                           for ii in indices]
+            if self.preview:
+                for kwargs in kwargs_list:
+                    kwargs["path_out"] = get_preview_path(kwargs["path_out"])
+            if self.stage_dir is not None and not self.preview:
+                self.staging_area = StagingArea(self.stage_dir,
+                                                self.stage_max_size)
+            futures = prefetch(self.prepare_job, kwargs_list)
+            try:
+                # run jobs
+                for ii, fut in zip(indices, futures):
+                    try:
+                        self.run_job(*fut.result(), index=ii)
+                    except BaseException:
+                        # Create a dummy error runner
+                        self.set_runner(
+                            ii, ErrorredRunner(traceback.format_exc()))
+                    # write final state to path list
+                    runner = self.runners[ii]
+                    self.paths_in[ii][1] = runner.get_status()["state"]
+            finally:
+                if self.staging_area is not None:
+                    self.staging_area.close()
         if self.callback_when_done is not None:
             self.callback_when_done()
 
-    def run_job(self, path_in, path_out):
+    def prepare_job(self, path_in, path_out):
+        """Create a job and perform all checks before running it
+
+        This method may be called in a background thread ahead of time.
+
+        Returns
+        -------
+        job: dcnum.logic.DCNumPipelineJob
+            the validated pipeline job
+        out_state: str
+            state of the output file (see :func:`.get_output_state`)
+        """
         job_kwargs = copy.deepcopy(self.job_kwargs)
-        # We are using the 'sparsemed' background algorithm by default,
-        # and we would like to perform flickering correction if necessary.
-        with dcnum.read.HDF5Data(path_in) as hd:
+        # The input file is opened at most once for all checks below.
+        with InputProbe(path_in, self.dataset_index) as probe:
+            # Setting the pixel size prevents the job from opening
+            # the input file again.
+            data_kwargs = job_kwargs.get("data_kwargs") or {}
+            data_kwargs.setdefault("pixel_size", probe.pixel_size)
+            job_kwargs["data_kwargs"] = data_kwargs
+            if self.preview:
+                data_kwargs["index_mapping"] = get_preview_mapping(
+                    probe.event_count)
+                self.event_counts[pathlib.Path(path_out)] = \
+                    probe.event_count
+                # The preview output file is replaced in every run.
+                pathlib.Path(path_out).unlink(missing_ok=True)
+            # We are using the 'sparsemed' background algorithm by default,
+            # and we would like to perform flickering correction if
+            # necessary.
             job_kwargs.setdefault(
                 "background_kwargs", {})["offset_correction"] = \
-                    dcnum.read.detect_flickering(hd.image)
-
-        job = dclogic.DCNumPipelineJob(path_in=path_in,
-                                       path_out=path_out,
-                                       **job_kwargs)
-        self.jobs.append(job)
-        # Make sure the job will run (This must be done after adding it
-        # to the jobs list and before adding it to the runners list)
-        job.validate()
-        with dclogic.DCNumJobRunner(job) as runner:
-            self.runners.append(runner)
+                probe.detect_flickering(
+                    recompute=self.recompute_flickering,
+                    flickering_kwargs=self.flickering_kwargs)
+            if self.max_memory:
+                num_procs, chunk_size, _ = fit_job_to_memory(
+                    max_memory=self.max_memory,
+                    image_shape=probe.image_shape,
+                    event_count=probe.event_count,
+                    num_procs=job_kwargs.get("num_procs") or cpu_count(),
+                    segmenter_code=job_kwargs["segmenter_code"])
+                job_kwargs["num_procs"] = num_procs
+                if chunk_size < DEFAULT_CHUNK_SIZE:
+                    data_kwargs["image_chunk_size"] = chunk_size
+
+            model_file = (job_kwargs.get("segmenter_kwargs")
+                          or {}).get("model_file")
+            if model_file:
+                sync_model_cache(model_file)
+
+            job = dclogic.DCNumPipelineJob(path_in=path_in,
+                                           path_out=path_out,
+                                           **job_kwargs)
+            # Make sure the job will run (This must be done after adding it
+            # to the jobs list, so that failed jobs are listed as well).
+            # The jobs are prepared one after another by `prefetch`, so
+            # they are appended in the order of the input paths.
+            self.jobs.append(job)
+            probe.validate_job(job)
+        _, pphash = job.get_ppid(ret_hash=True)
+        out_state = get_output_state(job["path_out"], pphash,
+                                     self.dataset_index)
+        if job["segmenter_code"] == "torchsto" and out_state != "current":
+            # Load the model while the previous job is running.
+            preload_model(model_file)
+        if self.staging_area is not None and out_state != "current":
+            # Copy the input file while the previous job is running.
+            job = stage_job(job, self.staging_area)
+        return job, out_state
+
+    def run_job(self, job, out_state, index):
+        # The background cache would distort the timing of a preview.
+        background_cache = None if self.preview else BackgroundCache()
+        with ResumableJobRunner(job,
+                                background_cache=background_cache) as runner:
+            self.set_runner(index, runner)
             # We might encounter a scenario in which the output file
             # already exists. If we call `runner.run` in this case,
             # then the runner will raise a FileExistsError. There
             # are several ways to deal with this situation.
             path_out = job["path_out"]
-            if path_out.exists():
-                # If the pipeline ID hash of the output file matches
-                # that of the input file, then we simply skip the run.
-                try:
-                    with h5py.File(path_out) as h5:
-                        hash_act = h5.attrs.get("pipeline:dcnum hash")
-                        if hash_act == runner.pphash:
-                            # We have already processed this file.
-                            runner.state = "done"
-                            return
-                except BaseException:
-                    warnings.warn(f"Could not extract pipeline"
-                                  f"identifier from '{path_out}'!")
-                # If we are here, it means that the pipeline ID hash
-                # did not match. We now have the chance to remove the
-                # output file.
-                if self.override:
-                    path_out.unlink()
+            if out_state == "current":
+                # The pipeline ID hash of the output file matches
+                # that of the input file, we simply skip the run.
+                runner.state = "done"
+                return
+            elif out_state == "stale" and self.override:
+                # The pipeline ID hash did not match. We now have the
+                # chance to remove the output file.
+                path_out.unlink()
             # Run the pipeline, catching any errors the runner doesn't.
-            runner.run()
+            reporter = JobReporter(runner)
+            runner.start()
+            for status in monitor_runner(runner):
+                reporter.observe(status)
+            path_in = job["path_in"]
+            if self.staging_area is not None:
+                path_in = unstage_job(job, self.staging_area)
+            if runner.state == "done" and self.dataset_index is not None:
+                self.dataset_index.set_output_hash(path_out, runner.pphash)
+        report = reporter.get_report()
+        report["path_in"] = str(path_in)
+        if self.preview and runner.state == "done":
+            report["preview"] = extrapolate_runtime(
+                report,
+                event_count=self.event_counts[pathlib.Path(path_out)],
+                index_mapping=job["data_kwargs"]["index_mapping"])
+        write_report(report)
         return runner
 
+    def set_runner(self, index, runner):
+        """Set the runner for the item `index` in `paths_in`"""
+        if len(self.runners) <= index:
+            self.runners.extend([None] * (index + 1 - len(self.runners)))
+        self.runners[index] = runner
+
 
 @lru_cache(maxsize=10000)
 def fetch_dcnum_log_from_file(path):
@@ -0,0 +1,290 @@
+import inspect
+import json
+import pathlib
+import warnings
+
+from dcnum.meta import ppid
+import dcnum.read
+from dcnum.read.cache import HDF5ImageCache
+import h5py
+import numpy as np
+
+from .dataset_index import DatasetIndex
+
+
+class InputProbe:
+    def __init__(self,
+                 path_in: pathlib.Path,
+                 dataset_index: DatasetIndex | None = None):
+        """Gather all information about an input file required for a job
+
+        Opening an HDF5 file on a network share is expensive. Instead
+        of opening the input file for every piece of information
+        (pixel size validation, image data check, data PPID, flickering
+        detection, segmenter applicability), the probe opens the file
+        once, when it is first needed, and keeps it open until
+        :func:`close` is called.
+
+        If a `dataset_index` is given, the metadata are taken from
+        the index and the file is only opened for information that
+        is not in the index.
+
+        Parameters
+        ----------
+        path_in:
+            path to the input .rtdc file
+        dataset_index:
+            persistent index for looking up and storing input metadata
+        """
+        self.path_in = pathlib.Path(path_in)
+        self.dataset_index = dataset_index
+        self._h5 = None
+        self._hd = None
+        self._info = None
+        if dataset_index is not None:
+            self._info = dataset_index.get_dataset(self.path_in)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def hd(self) -> dcnum.read.HDF5Data:
+        """Input data, opened on first access"""
+        if self._hd is None:
+            # Keep the h5py.File open, so that the HDF5 library reuses
+            # it when HDF5Data opens the same path again internally.
+            self._h5 = h5py.File(self.path_in, "r", libver="latest")
+            self._hd = dcnum.read.HDF5Data(self._h5)
+        return self._hd
+
+    @property
+    def info(self) -> dict:
+        """Input metadata (see :func:`.DatasetIndex.get_dataset`)"""
+        if self._info is None:
+            image = self.hd.image
+            self._info = {
+                "pixel_size": self.hd.pixel_size,
+                "pixel_size_valid": get_valid_pixel_size(self.hd),
+                "image_shape": None if image is None else image.image_shape,
+                "event_count": len(self.hd),
+            }
+            if self.dataset_index is not None:
+                self.dataset_index.set_dataset(self.path_in, **self._info)
+        return self._info
+
+    @property
+    def event_count(self) -> int:
+        return self.info["event_count"]
+
+    @property
+    def has_image(self) -> bool:
+        return self.info["image_shape"] is not None
+
+    @property
+    def image_shape(self) -> tuple[int, int] | None:
+        return self.info["image_shape"]
+
+    @property
+    def pixel_size(self) -> float:
+        """Pixel size as stored in the input file"""
+        return self.info["pixel_size"]
+
+    @property
+    def pixel_size_valid(self) -> float:
+        """Pixel size corrected for known invalid values"""
+        return self.info["pixel_size_valid"]
+
+    def close(self):
+        if self._hd is not None:
+            self._hd.close()
+            self._hd = None
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+
+    def detect_flickering(self,
+                          recompute: bool = False,
+                          flickering_kwargs: dict | None = None) -> bool:
+        """Determine whether the images exhibit flickering
+
+        Flickering detection requires reading a large part of the image
+        data. The result is stored in the dataset index (if available)
+        and reused unless `recompute` is set.
+
+        Parameters
+        ----------
+        recompute:
+            ignore the result stored in the dataset index
+        flickering_kwargs:
+            keyword arguments for :func:`detect_flickering`
+        """
+        flickering_kwargs = get_flickering_kwargs(flickering_kwargs)
+        detector_id = get_flickering_detector_id(flickering_kwargs)
+        flickering = None
+        if self.dataset_index is not None and not recompute:
+            flickering = self.dataset_index.get_flickering(self.path_in,
+                                                           detector_id)
+        if flickering is None:
+            flickering = detect_flickering(self.hd.image, **flickering_kwargs)
+            if self.dataset_index is not None:
+                self.dataset_index.set_flickering(self.path_in,
+                                                  detector_id,
+                                                  flickering)
+        return flickering
+
+    def get_dat_id(self,
+                   pixel_size: float | None = None,
+                   index_mapping: int | slice | None = None) -> str:
+        """Return the data pipeline identifier
+
+        Parameters
+        ----------
+        pixel_size:
+            pixel size used for processing; defaults to the pixel size
+            stored in the input file
+        index_mapping:
+            index mapping used for processing
+        """
+        if pixel_size is None:
+            pixel_size = self.pixel_size
+        return dcnum.read.HDF5Data.get_ppid_from_ppkw(
+            {"pixel_size": pixel_size, "index_mapping": index_mapping})
+
+    def validate_job(self, job) -> bool:
+        """Make sure the pipeline will run with this input file
+
+        This is equivalent to :func:`dcnum.logic.DCNumPipelineJob.validate`,
+        but uses the already-opened input file.
+
+        Raises
+        ------
+        dcnum.segm.SegmenterNotApplicableError:
+            the segmenter is incompatible with the input file
+        """
+        seg_cls = job.get_segmenter_class()
+        seg_cls.validate_applicability(
+            segmenter_kwargs=job["segmenter_kwargs"],
+            logs=self.hd.logs,
+            meta=self.hd.meta)
+        return True
+
+
+def detect_flickering(image_data: np.ndarray | HDF5ImageCache,
+                      *,
+                      num_chunks: int = 0,
+                      max_frames: int = 1000,
+                      roi_height: int = 10,
+                      brightness_threshold: float = 2.5,
+                      count_threshold: int = 5) -> bool:
+    """Determine whether an image series experiences flickering
+
+    This is a wrapper around :func:`dcnum.read.detect_flickering`
+    which allows to sample the frames from the entire dataset.
+
+    Parameters
+    ----------
+    image_data:
+        image data
+    num_chunks:
+        If set to 0, analyze the first `max_frames` frames. Otherwise,
+        distribute the `max_frames` frames evenly over `num_chunks`
+        image chunks which are evenly spaced over the dataset. Since
+        only entire chunks can be read from an HDF5 file, the amount
+        of data read is fixed by `num_chunks`, independent of the
+        size of the dataset.
+    max_frames:
+        total number of frames to analyze
+    roi_height:
+        height of the ROI in pixels for which to search for flickering
+    brightness_threshold:
+        brightness difference between individual ROIs median and median
+        of all ROI medians leading to a positive flickering event
+    count_threshold:
+        minimum number of flickering events that would lead to a positive
+        flickering decision
+    """
+    detect_kwargs = {"roi_height": roi_height,
+                     "brightness_threshold": brightness_threshold,
+                     "count_threshold": count_threshold,
+                     }
+    if num_chunks == 0:
+        return bool(dcnum.read.detect_flickering(
+            image_data, max_frames=max_frames, **detect_kwargs))
+
+    size = len(image_data)
+    chunk_size = getattr(image_data, "chunk_size", max_frames)
+    chunk_count = int(np.ceil(size / chunk_size))
+    chunk_indices = np.unique(
+        np.linspace(0, chunk_count - 1, min(num_chunks, chunk_count),
+                    dtype=int))
+    frames_per_chunk = max(1, min(chunk_size,
+                                  max_frames // chunk_indices.size))
+    roi_data = []
+    for idx in chunk_indices:
+        start = idx * chunk_size
+        stop = min(start + frames_per_chunk, size)
+        roi_data.append(np.asarray(image_data[start:stop])[:, :roi_height, :])
+    return bool(dcnum.read.detect_flickering(np.concatenate(roi_data),
+                                             max_frames=max_frames,
+                                             **detect_kwargs))
+
+
+def get_flickering_detector_id(flickering_kwargs: dict | None = None) -> str:
+    """Return a string identifying flickering detection parameters"""
+    return json.dumps(get_flickering_kwargs(flickering_kwargs),
+                      sort_keys=True)
+
+
+def get_flickering_kwargs(flickering_kwargs: dict | None = None) -> dict:
+    """Return keyword arguments for :func:`detect_flickering`
+
+    Missing keyword arguments are populated with the default values.
+    Values are converted to the annotated types, so they may also be
+    given as strings (e.g. from the command line).
+    """
+    spec = inspect.getfullargspec(detect_flickering)
+    kwargs = dict(spec.kwonlydefaults)
+    for key, value in (flickering_kwargs or {}).items():
+        if key not in kwargs:
+            raise ValueError(f"Invalid keyword '{key}' for flickering "
+                             f"detection. Allowed keywords are "
+                             f"{sorted(kwargs.keys())}!")
+        kwargs[key] = ppid.convert_to_dtype(value, spec.annotations[key])
+    return kwargs
+
+
+def get_valid_pixel_size(hd: dcnum.read.HDF5Data) -> float:
+    """Return the pixel size of a dataset, corrected for known issues
+
+    Some Rivercyte devices stored invalid pixel sizes in the data
+    files. For these devices, the pixel size is determined from
+    the camera model recorded in the acquisition logs.
+    """
+    did = hd.h5.attrs.get("setup:identifier", "EMPTY")
+    pixel_size = hd.h5.attrs.get("imaging:pixel size", 0)
+    if (did.startswith("RC-")
+            and (pixel_size < 0.255 or pixel_size > 0.275)):
+        # Set default pixel size for Rivercyte devices
+        # Check the logs for the device name used.
+        logdat = hd.logs.get("cytoshot-acquisition", [])
+        for line in logdat:
+            line = line.strip().lower()
+            if line.startswith("device name:"):
+                dev_name = line.split(":")[1].strip()
+                break
+        else:
+            # fall-back to old camera
+            dev_name = "naiad 1.0"
+        if dev_name == "naiad 1.0":
+            # Naiad v1.0 camera VLXT06MI
+            pixel_size = 0.2645
+        elif dev_name == "naiad 1.1":
+            # Naiad v1.1 camera VCXU213M
+            pixel_size = 0.2675
+        else:
+            warnings.warn(f"Unknown device name: '{dev_name}'; "
+                          f"Not changing pixel size {pixel_size}")
+    return pixel_size
@@ -0,0 +1,97 @@
+import pathlib
+from typing import Callable, List, Literal
+
+from .dataset_index import DatasetIndex
+from .input_probe import InputProbe
+
+
+#: Strategies for ordering the input files of a batch with a
+#: description for the user (see :func:`order_paths`)
+ORDER_STRATEGIES = {
+    "given": "Order added",
+    "alphabetical": "Alphabetical order",
+    "largest": "Largest files first",
+    "smallest": "Smallest files first",
+    "cost": "Most expensive files first",
+}
+
+
+def estimate_cost(path_in: pathlib.Path,
+                  dataset_index: DatasetIndex | None = None) -> int:
+    """Estimate the processing cost of an input file
+
+    The cost is the number of events times the number of pixels per
+    image, taken from the metadata of the input file (or from the
+    `dataset_index`, if available). Files that cannot be read have
+    a cost of zero.
+    """
+    try:
+        with InputProbe(path_in, dataset_index) as probe:
+            if not probe.has_image:
+                return 0
+            height, width = probe.image_shape
+            return probe.event_count * height * width
+    except BaseException:
+        # Problems are reported when the file is processed.
+        return 0
+
+
+def get_file_size(path_in: pathlib.Path) -> int:
+    """Return the size of a file in bytes (zero if it does not exist)"""
+    try:
+        return pathlib.Path(path_in).stat().st_size
+    except OSError:
+        return 0
+
+
+def order_paths(items: List,
+                strategy: Literal["given", "alphabetical", "largest",
+                                  "smallest", "cost"],
+                key: Callable | None = None,
+                dataset_index: DatasetIndex | None = None) -> List:
+    """Return input files in the order in which they should be processed
+
+    Processing the largest (or most expensive) files first reduces
+    the total processing time of a batch with concurrent jobs, because
+    the batch does not end with a single long job running while the
+    other job slots are idle. Processing the smallest files first
+    yields the first results quickly.
+
+    Parameters
+    ----------
+    items:
+        input files or other items, e.g. tuples (path_in, path_out)
+    strategy:
+        one of the keys of :const:`ORDER_STRATEGIES`; "largest" and
+        "smallest" refer to the file size, "cost" to the number of
+        pixels to process (see :func:`estimate_cost`)
+    key:
+        function returning the input path of an item; defaults to
+        the item itself
+    dataset_index:
+        persistent index for looking up input metadata
+
+    Returns
+    -------
+    items: list
+        new list of items; items that are equal in terms of `strategy`
+        keep their original order
+    """
+    if strategy not in ORDER_STRATEGIES:
+        raise ValueError(f"Unknown order strategy '{strategy}', expected "
+                         f"one of {', '.join(ORDER_STRATEGIES)}")
+    if key is None:
+        def key(item):
+            return item
+    items = list(items)
+    if strategy == "alphabetical":
+        items.sort(key=lambda item: str(key(item)))
+    elif strategy == "largest":
+        items.sort(key=lambda item: get_file_size(key(item)), reverse=True)
+    elif strategy == "smallest":
+        items.sort(key=lambda item: get_file_size(key(item)))
+    elif strategy == "cost":
+        costs = [estimate_cost(key(item), dataset_index) for item in items]
+        order = sorted(range(len(items)), key=lambda ii: -costs[ii])
+        items = [items[ii] for ii in order]
+    return items
@@ -0,0 +1,183 @@
+import json
+import pathlib
+import re
+import time
+import warnings
+
+import dcnum.read
+import psutil
+
+from .preview import format_estimate
+
+
+#: Regular expression for the timing lines in the dcnum log, e.g.
+#: "18:56:22 INFO dcnum.Runner-59: Feature extraction time: 0.5s"
+LOG_TIME_REGEXP = re.compile(r": (?P<name>[^:]+?) time: (?P<value>[0-9.]+)s$")
+
+
+def get_report_path(path_out: pathlib.Path) -> pathlib.Path:
+    """Return the path of the performance report for an output file"""
+    path_out = pathlib.Path(path_out)
+    return path_out.with_name(path_out.stem + "_report.json")
+
+
+def get_runner_log(runner) -> str:
+    """Return the dcnum log of a runner (after it was joined)
+
+    For successful runs, the log is read from the output file,
+    because the log file is removed when the runner is joined.
+    """
+    if runner.state == "done":
+        with dcnum.read.HDF5Data(runner.job["path_out"]) as hd:
+            logs = sorted(ll for ll in hd.logs if ll.startswith("dcnum-log-"))
+            if logs:
+                return "\n".join(hd.logs[logs[-1]])
+    elif runner.path_log.exists():
+        return runner.path_log.read_text(encoding="utf-8", errors="ignore")
+    return ""
+
+
+def parse_log_times(log: str) -> dict:
+    """Extract the timing information from a dcnum log
+
+    Returns a dictionary with the lower-case name of each timing entry
+    (e.g. "feature extraction") and the duration in seconds. Note that
+    the durations of the tasks executed by the dcnum workers (data
+    load, segmentation, labeling, label processing, feature extraction)
+    are summed over all workers and thus can exceed the wall time.
+    """
+    times = {}
+    for line in log.split("\n"):
+        match = LOG_TIME_REGEXP.search(line.strip())
+        if match:
+            name = match.group("name").strip().lower()
+            times[name] = times.get(name, 0) + float(match.group("value"))
+    return times
+
+
+class JobReporter:
+    def __init__(self, runner):
+        """Collect performance information about a pipeline job
+
+        Call :func:`observe` with every status update from
+        :func:`.monitor_runner` and :func:`get_report` after the
+        runner was joined.
+
+        Parameters
+        ----------
+        runner: dcnum.logic.DCNumJobRunner
+            job runner that has not yet been started
+        """
+        self.runner = runner
+        self.process = psutil.Process()
+        self.time_start = time.monotonic()
+        self.cpu_start = self.get_cpu_time()
+        #: wall time spent in each state of the runner
+        self.state_times = {}
+        self.peak_rss = 0
+        self._state = None
+        self._state_start = 0
+
+    def get_cpu_time(self) -> float:
+        """CPU time of this process and its terminated child processes"""
+        ct = self.process.cpu_times()
+        return ct.user + ct.system + ct.children_user + ct.children_system
+
+    def get_rss(self) -> int:
+        """Resident set size of this process and its child processes"""
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except (psutil.ZombieProcess, psutil.NoSuchProcess):
+                continue
+        return rss
+
+    def observe(self, status: dict):
+        """Record a status update of the runner"""
+        self.peak_rss = max(self.peak_rss, self.get_rss())
+        now = time.monotonic() - self.time_start
+        state = status["state"]
+        if state != self._state:
+            if self._state is not None:
+                self.state_times[self._state] = \
+                    self.state_times.get(self._state, 0) \
+                    + now - self._state_start
+            self._state = state
+            self._state_start = now
+
+    def get_report(self) -> dict:
+        """Return the performance report of the job
+
+        The report contains the wall time of the job and of each state
+        of the runner ("background", "segmentation", "plumbing", ...),
+        the task times from the dcnum log, the number of events and
+        the event rate, CPU time and average CPU utilization (with
+        respect to the number of processes of the job), the peak
+        memory usage (sampled with every status update), and the size
+        of the output file.
+        """
+        wall_time = time.monotonic() - self.time_start
+        cpu_time = self.get_cpu_time() - self.cpu_start
+        job = self.runner.job
+        num_procs = job["num_procs"]
+        path_out = pathlib.Path(job["path_out"])
+        try:
+            log_times = parse_log_times(get_runner_log(self.runner))
+        except Exception as e:
+            warnings.warn(f"Could not read the dcnum log of '{path_out}': "
+                          f"{e}")
+            log_times = {}
+        segm_time = self.state_times.get("segmentation", 0)
+        return {
+            "path_in": str(job["path_in"]),
+            "path_out": str(path_out),
+            "pipeline hash": self.runner.pphash,
+            "state": self.runner.state,
+            "num_procs": num_procs,
+            "wall_time": wall_time,
+            "state_times": self.state_times,
+            "log_times": log_times,
+            "events": self.runner.event_count,
+            "events_per_second":
+                self.runner.event_count / segm_time if segm_time else 0,
+            "cpu_time": cpu_time,
+            "cpu_utilization":
+                cpu_time / (wall_time * num_procs) if wall_time else 0,
+            "peak_rss": self.peak_rss,
+            "output_bytes":
+                path_out.stat().st_size if path_out.exists() else 0,
+        }
+
+
+def format_report(report: dict) -> str:
+    """Human-readable summary of a performance report"""
+    lines = [f"Wall time:\t{report['wall_time']:.1f}s"]
+    for name, value in report["state_times"].items():
+        lines.append(f" - {name}:\t{value:.1f}s")
+    for name, value in report["log_times"].items():
+        lines.append(f" - {name} (log):\t{value:.1f}s")
+    lines += [
+        f"Events:\t{report['events']} "
+        f"({report['events_per_second']:.1f} events/s)",
+        f"CPU time:\t{report['cpu_time']:.1f}s "
+        f"({report['cpu_utilization']:.0%} of {report['num_procs']} "
+        f"processes)",
+        f"Peak memory:\t{report['peak_rss'] / 1024**2:.0f} MiB",
+        f"Output size:\t{report['output_bytes'] / 1024**2:.1f} MiB",
+    ]
+    if "preview" in report:
+        lines.append(format_estimate(report["preview"]))
+    return "\n".join(lines)
+
+
+def write_report(report: dict, path: pathlib.Path | None = None):
+    """Write a performance report to a JSON file
+
+    By default, the report is written next to the output file
+    (see :func:`get_report_path`).
+    """
+    if path is None:
+        path = get_report_path(report["path_out"])
+    pathlib.Path(path).write_text(json.dumps(report, indent=2),
+                                  encoding="utf-8")
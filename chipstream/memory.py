@@ -0,0 +1,155 @@
+import re
+from typing import Tuple
+
+import numpy as np
+import psutil
+
+
+MiB = 1024**2
+
+#: Default (maximum) number of images in a dcnum image chunk
+DEFAULT_CHUNK_SIZE = 1000
+#: Number of chunk slots in shared memory allocated by dcnum (seven
+#: slots for the pipeline and one for the last, incomplete chunk)
+NUM_CHUNK_SLOTS = 8
+#: Bytes per pixel in a chunk slot: image (uint8), image_bg (uint8),
+#: image_corr (int16), mask (bool), and labels (uint16)
+SLOT_BYTES_PER_PIXEL = 7
+#: Memory of a process without any data (Python interpreter with numpy,
+#: scipy, h5py, and dcnum imported)
+PROCESS_BASE_MEMORY = 200 * MiB
+#: Working memory of a worker process per image pixel (segmentation
+#: and feature extraction create several floating point copies of
+#: the image that is being processed)
+PROCESS_BYTES_PER_PIXEL = 64
+#: Additional memory of a process that runs a torch model
+TORCH_PROCESS_MEMORY = 1000 * MiB
+
+
+def parse_memory(value: str) -> int:
+    """Convert a memory size string (e.g. "16G", "512MiB") to bytes
+
+    The special value "auto" stands for the memory that is currently
+    available on this machine.
+    """
+    value = value.strip()
+    if value.lower() == "auto":
+        return get_available_memory()
+    match = re.fullmatch(r"([0-9.]+)\s*([kKmMgGtT]?)(i?B)?", value)
+    if not match:
+        raise ValueError(f"Invalid memory size '{value}', expected e.g. "
+                         f"'512M', '16G', or 'auto'")
+    number, unit = float(match.group(1)), match.group(2).upper()
+    return int(number * 1024 ** " KMGT".index(unit or " "))
+
+
+def get_available_memory() -> int:
+    """Return the memory available for new processes in bytes"""
+    return psutil.virtual_memory().available
+
+
+def estimate_job_memory(image_shape: Tuple[int, int],
+                        event_count: int,
+                        num_procs: int,
+                        segmenter_code: str = "thresh",
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Estimate the peak memory usage of a pipeline job in bytes
+
+    The estimate comprises the chunk slots that dcnum allocates in
+    shared memory, the job process, and the worker processes
+    (including the writer). This is a rough estimate that
+    errs on the safe side; it is meant for choosing the number of
+    processes, not for accounting.
+
+    Parameters
+    ----------
+    image_shape:
+        shape of a single image in the input file
+    event_count:
+        number of images in the input file
+    num_procs:
+        number of processes for the job (`num_procs` of
+        :class:`dcnum.logic.DCNumPipelineJob`)
+    segmenter_code:
+        code of the segmenter; torch segmenters load a model in the
+        job process ("torchsto") or in every worker ("torchmpo")
+    chunk_size:
+        maximum number of images in an image chunk
+    """
+    pixels = int(np.prod(image_shape))
+    frames = max(1, min(event_count, chunk_size))
+    memory = NUM_CHUNK_SLOTS * frames * pixels * SLOT_BYTES_PER_PIXEL
+    # dcnum uses `num_procs - 1` (at least one) universal workers and
+    # one writer process in addition to the job process.
+    num_processes = max(num_procs, 2) + 1
+    memory += num_processes * (PROCESS_BASE_MEMORY
+                               + pixels * PROCESS_BYTES_PER_PIXEL)
+    if segmenter_code == "torchsto":
+        memory += TORCH_PROCESS_MEMORY
+    elif segmenter_code == "torchmpo":
+        memory += num_procs * TORCH_PROCESS_MEMORY
+    return memory
+
+
+def fit_job_to_memory(max_memory: int,
+                      image_shape: Tuple[int, int],
+                      event_count: int,
+                      num_procs: int,
+                      segmenter_code: str = "thresh",
+                      chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      ) -> Tuple[int, int, int]:
+    """Choose the number of processes and chunk size for a memory budget
+
+    The number of processes is reduced first. If a job with a single
+    process does not fit into `max_memory`, the image chunk size is
+    reduced. See :func:`estimate_job_memory` for the parameters.
+
+    Returns
+    -------
+    num_procs: int
+        number of processes (at most `num_procs`)
+    chunk_size: int
+        image chunk size (at most `chunk_size`)
+    memory: int
+        estimated peak memory usage of the job
+
+    Raises
+    ------
+    ValueError
+        if not even a job with one process and a chunk size of one
+        fits into `max_memory`
+    """
+    def estimate(procs, size):
+        return estimate_job_memory(image_shape=image_shape,
+                                   event_count=event_count,
+                                   num_procs=procs,
+                                   segmenter_code=segmenter_code,
+                                   chunk_size=size)
+
+    while estimate(1, chunk_size) > max_memory:
+        if chunk_size == 1:
+            raise ValueError(
+                f"The memory budget of {max_memory / MiB:.0f} MiB is too "
+                f"small; at least {estimate(1, 1) / MiB:.0f} MiB are "
+                f"required")
+        chunk_size = max(1, chunk_size // 2)
+    while num_procs > 1 and estimate(num_procs, chunk_size) > max_memory:
+        num_procs -= 1
+    return num_procs, chunk_size, estimate(num_procs, chunk_size)
+
+
+def get_max_concurrent_jobs(max_memory: int,
+                            min_job_memory: int,
+                            concurrent_jobs: int) -> int:
+    """Return how many jobs may run at the same time within a budget
+
+    Parameters
+    ----------
+    max_memory:
+        total memory budget
+    min_job_memory:
+        memory required by the largest job with a single process
+    concurrent_jobs:
+        requested number of concurrent jobs
+    """
+    return max(1, min(concurrent_jobs, max_memory // max(1, min_job_memory)))
@@ -0,0 +1,102 @@
+import collections
+import functools
+import hashlib
+import pathlib
+import threading
+
+from .dataset_index import get_file_identity
+
+
+#: Maximum number of models kept in memory by :func:`preload_model`
+MAX_CACHED_MODELS = 2
+
+_lock = threading.RLock()
+#: Hashes of the model files in the dcnum model cache by file name
+_model_hashes = {}
+#: Models loaded by :func:`preload_model` with keys (model hash, device)
+#: and the corresponding dcnum cache keys as values (least recently
+#: used first)
+_loaded_models = collections.OrderedDict()
+
+
+@functools.lru_cache(maxsize=100)
+def _compute_file_hash(path: str, identity: tuple) -> str:
+    # The file identity is part of the cache key, so that modified
+    # files are hashed again.
+    hasher = hashlib.md5()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(2**20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_model_hash(path: pathlib.Path | str) -> str:
+    """Return the MD5 hash of a model file"""
+    return _compute_file_hash(str(path), get_file_identity(path))
+
+
+def sync_model_cache(model_file: pathlib.Path | str) -> pathlib.Path:
+    """Make sure the dcnum model cache does not contain a stale model
+
+    dcnum identifies cached torch models and their metadata only by
+    the name of the model file. If a different file with the same
+    name (e.g. from another directory) was used before, the cached
+    model and metadata are removed.
+
+    Returns the path to the model file.
+    """
+    from dcnum.segm.segm_torch import torch_model
+
+    path = torch_model.retrieve_model_file(model_file)
+    model_hash = get_model_hash(path)
+    prefix = f"{path.name}::"
+    with _lock:
+        if _model_hashes.get(path.name, model_hash) != model_hash:
+            for cache in [torch_model.cache_model,
+                          torch_model.cache_model_meta]:
+                for key in [k for k in cache if k.startswith(prefix)]:
+                    cache.pop(key, None)
+            for key in [k for k, v in _loaded_models.items()
+                        if v.startswith(prefix)]:
+                _loaded_models.pop(key)
+        _model_hashes[path.name] = model_hash
+    return path
+
+
+def preload_model(model_file: pathlib.Path | str, device: str = "cuda"):
+    """Load a torch model into the dcnum model cache ahead of a job
+
+    Segmenters that run in the job process ("torchsto") load their
+    model via :func:`dcnum.segm.segm_torch.torch_model.load_model`,
+    which returns the cached model. Preloading the model while the
+    previous job is still running (e.g. in :func:`.prefetch`) and
+    keeping it for consecutive jobs with the same model file avoids
+    loading it for every input file. The models are identified by
+    the hash of the model file and the device. At most
+    :const:`MAX_CACHED_MODELS` models are kept in memory.
+
+    Note that this does not apply to segmenters that run in the
+    worker processes ("torchmpo"), because these processes are
+    created for every job.
+
+    Returns True if the model was loaded and False if it was already
+    in the cache.
+    """
+    from dcnum.segm.segm_torch import torch_model
+
+    with _lock:
+        path = sync_model_cache(model_file)
+        key = (get_model_hash(path), str(device))
+        dcnum_key = _loaded_models.get(key)
+        if dcnum_key is not None and dcnum_key in torch_model.cache_model:
+            _loaded_models.move_to_end(key)
+            return False
+        _, model_meta = torch_model.load_model(path, device=device)
+        _loaded_models[key] = (f"{model_meta['path'].name}::"
+                               f"{model_meta['backend']}::"
+                               f"{model_meta['device']}")
+        while len(_loaded_models) > MAX_CACHED_MODELS:
+            _, dcnum_key = _loaded_models.popitem(last=False)
+            if dcnum_key not in _loaded_models.values():
+                torch_model.cache_model.pop(dcnum_key, None)
+        return True
@@ -0,0 +1,60 @@
+import pathlib
+from typing import Literal
+import warnings
+
+import h5py
+
+from .dataset_index import DatasetIndex
+
+
+def get_output_hash(path_out: pathlib.Path) -> str | None:
+    """Return the "pipeline:dcnum hash" attribute of an output file
+
+    Returns None if the file does not exist, if it is not a valid
+    HDF5 file, or if the attribute is not set.
+    """
+    path_out = pathlib.Path(path_out)
+    if not path_out.exists():
+        return None
+    try:
+        with h5py.File(path_out) as h5:
+            return h5.attrs.get("pipeline:dcnum hash")
+    except BaseException:
+        warnings.warn(f"Could not extract pipeline identifier "
+                      f"from '{path_out}'!")
+        return None
+
+
+def get_output_state(path_out: pathlib.Path,
+                     pphash: str,
+                     dataset_index: DatasetIndex | None = None,
+                     ) -> Literal["missing", "current", "stale"]:
+    """Determine whether an output file must be (re)computed
+
+    If `dataset_index` is given, the pipeline hash of the output file
+    is taken from the index, if possible, and the index is updated
+    otherwise.
+
+    Returns
+    -------
+    state: str
+        - "missing": the output file does not exist
+        - "current": the output file has the pipeline hash `pphash`,
+          i.e. the data have already been processed with this pipeline
+        - "stale": the output file exists, but it was created with
+          a different pipeline or its hash could not be read
+    """
+    path_out = pathlib.Path(path_out)
+    if not path_out.exists():
+        return "missing"
+    hash_act = None
+    if dataset_index is not None:
+        hash_act = dataset_index.get_output_hash(path_out)
+    if hash_act is None:
+        hash_act = get_output_hash(path_out)
+        if dataset_index is not None and hash_act is not None:
+            dataset_index.set_output_hash(path_out, hash_act)
+    if hash_act == pphash:
+        return "current"
+    else:
+        return "stale"
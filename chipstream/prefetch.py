@@ -0,0 +1,47 @@
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+
+def prefetch(func: Callable,
+             kwargs_list: Iterable[dict],
+             lookahead: int = 1) -> Iterator[Future]:
+    """Call `func` ahead of time for a list of keyword arguments
+
+    This is used for performing the preflight checks of the next
+    datasets in a background thread while the current dataset is
+    being processed, so that there is no dead time between jobs.
+
+    Parameters
+    ----------
+    func:
+        function to call
+    kwargs_list:
+        keyword arguments for each call of `func`; this may be a
+        generator, which is consumed as the calls are started
+    lookahead:
+        number of calls that are started in addition to the call
+        whose result the caller is currently waiting for
+
+    Yields
+    ------
+    future: concurrent.futures.Future
+        One future for each item in `kwargs_list`, in the same order.
+        Exceptions raised by `func` are raised by `future.result()`.
+        If the caller stops iterating, calls that have not yet been
+        started are cancelled.
+    """
+    lookahead = max(1, lookahead)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=lookahead,
+                            thread_name_prefix="ChipStreamPrefetch") as pool:
+        try:
+            for kwargs in kwargs_list:
+                pending.append(pool.submit(func, **kwargs))
+                if len(pending) > lookahead:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for fut in pending:
+                fut.cancel()
@@ -0,0 +1,105 @@
+import datetime
+import pathlib
+from typing import Dict
+
+
+#: Number of input events processed in preview mode
+PREVIEW_EVENTS = 1000
+#: States of the job runner whose duration is proportional to the
+#: number of events; all other states take a fixed amount of time.
+#: The background is always computed from all images of the input
+#: file (the index mapping only applies to segmentation), so the
+#: background time of a preview equals that of a full run.
+SCALING_STATES = ("segmentation",)
+
+
+def extrapolate_runtime(report: dict,
+                        event_count: int,
+                        index_mapping: slice | None) -> Dict:
+    """Predict the runtime of a full run from a preview run
+
+    Parameters
+    ----------
+    report:
+        performance report of the preview run (see :class:`.JobReporter`)
+    event_count:
+        number of events in the input file
+    index_mapping:
+        index mapping of the preview run (see :func:`get_preview_mapping`)
+
+    Returns
+    -------
+    estimate: dict
+        Dictionary with the number of events processed in the preview
+        ("sample_size"), the number of events in the input file
+        ("event_count"), the processing rate ("events_per_second"),
+        and the predicted wall time of the full run in seconds
+        ("predicted_time").
+    """
+    sample_size = get_sample_size(event_count, index_mapping)
+    scaling = sum(report["state_times"].get(state, 0)
+                  for state in SCALING_STATES)
+    fixed = max(0, report["wall_time"] - scaling)
+    return {
+        "sample_size": sample_size,
+        "event_count": event_count,
+        "events_per_second": sample_size / scaling if scaling else 0,
+        "predicted_time":
+            fixed + scaling * event_count / max(sample_size, 1),
+    }
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration like "1:02:03" (hours, minutes, seconds)"""
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def format_estimate(estimate: dict) -> str:
+    """Human-readable summary of :func:`extrapolate_runtime`"""
+    return "\n".join([
+        f"Preview:\t{estimate['sample_size']} of "
+        f"{estimate['event_count']} events "
+        f"({estimate['events_per_second']:.1f} events/s)",
+        f"Predicted time:\t{format_duration(estimate['predicted_time'])}",
+    ])
+
+
+def get_preview_mapping(event_count: int,
+                        num_events: int | None = None) -> slice | None:
+    """Return an index mapping for an evenly spread sample of events
+
+    The sample consists of every n-th event, so that the preview is
+    representative of the entire measurement (e.g. sample properties
+    or flow rate changing over time). `num_events` defaults to
+    :const:`PREVIEW_EVENTS`. Returns None if the input file has at
+    most `num_events` events.
+    """
+    if num_events is None:
+        num_events = PREVIEW_EVENTS
+    if event_count <= num_events:
+        return None
+    step = event_count // num_events
+    return slice(0, step * num_events, step)
+
+
+def get_preview_path(path_out: pathlib.Path) -> pathlib.Path:
+    """Return the path of the preview output file
+
+    The suffix "_preview" is inserted before the "_dcn" suffix, e.g.
+    "M001_data_preview_dcn.rtdc", so that preview files are not
+    mistaken for input files in recursive mode.
+    """
+    path_out = pathlib.Path(path_out)
+    stem = path_out.stem
+    if stem.endswith("_dcn"):
+        stem = f"{stem[:-4]}_preview_dcn"
+    else:
+        stem = f"{stem}_preview"
+    return path_out.with_name(stem + path_out.suffix)
+
+
+def get_sample_size(event_count: int, index_mapping: slice | None) -> int:
+    """Return the number of events selected by an index mapping"""
+    if index_mapping is None:
+        return event_count
+    return len(range(event_count)[index_mapping])
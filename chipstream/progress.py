@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from typing import Iterator
+
+
+def get_file_size(path) -> int:
+    """Return the size of a file or 0 if it does not exist"""
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def monitor_runner(runner,
+                   min_interval: float = 0.05,
+                   max_interval: float = 1.0,
+                   progress_step: float = 0.01) -> Iterator[dict]:
+    """Yield status updates of a running `DCNumJobRunner`
+
+    A status update is yielded whenever the state of the runner
+    changes or when the progress increased by at least `progress_step`.
+    The polling interval adapts to the activity of the runner: It is
+    reset to `min_interval` whenever something changed and doubled
+    (up to `max_interval`) otherwise. Instead of sleeping, this function
+    waits for the runner thread, so that the final status is yielded
+    as soon as the runner is finished.
+
+    Parameters
+    ----------
+    runner: dcnum.logic.DCNumJobRunner
+        started job runner
+    min_interval:
+        minimum polling interval [s]
+    max_interval:
+        maximum polling interval [s]
+    progress_step:
+        minimum change in progress that triggers an update
+
+    Yields
+    ------
+    status: dict
+        Dictionary with the keys "state", "progress" (0 to 1), "events"
+        (number of events written), "frames_per_second" (segmentation
+        rate), "events_per_second" (average since segmentation started),
+        "bytes_written" (size of the output file), and "elapsed"
+        (seconds since the monitoring started).
+    """
+    # These properties register temporary files for deletion at exit,
+    # so we access them only once.
+    path_temp_out = runner.path_temp_out
+    path_out = runner.job["path_out"]
+    time_start = time.monotonic()
+    time_segm = None
+    interval = min_interval
+    last = None
+    while True:
+        # `DCNumJobRunner.join` closes the runner; we only want to wait.
+        threading.Thread.join(runner, timeout=interval)
+        finished = not runner.is_alive()
+        status = runner.get_status()
+        now = time.monotonic()
+        state = status["state"]
+        if state == "segmentation" and time_segm is None:
+            time_segm = now
+        if time_segm is not None and now > time_segm:
+            ev_rate = runner.event_count / (now - time_segm)
+        else:
+            ev_rate = 0
+        if state == "done":
+            bytes_written = get_file_size(path_out)
+        else:
+            bytes_written = get_file_size(path_temp_out)
+        update = {
+            "state": state,
+            "progress": status["progress"],
+            "events": runner.event_count,
+            "frames_per_second": float(status["segm rate"]),
+            "events_per_second": ev_rate,
+            "bytes_written": bytes_written,
+            "elapsed": now - time_start,
+        }
+        if (last is None
+                or state != last["state"]
+                or update["progress"] - last["progress"] >= progress_step
+                or (finished and update["progress"] != last["progress"])):
+            yield update
+            last = update
+            interval = min_interval
+        else:
+            interval = min(2 * interval, max_interval)
+        if finished:
+            # The runner thread is not running anymore, i.e. it is
+            # safe to close the runner.
+            break
+
+
+def format_status_text(status: dict) -> str:
+    """Human-readable representation of a status update"""
+    return f"Processing {status['progress']:.0%} ({status['state']})"
+
+
+def format_status_json(status: dict, event: str = "progress",
+                       **extra) -> str:
+    """JSON-lines representation of a status update
+
+    The `event` is either "state" (the state of the job changed) or
+    "progress". Additional fields (e.g. the input path of the job) may
+    be given as keyword arguments.
+    """
+    data = {"event": event}
+    data.update({k: str(v) for k, v in extra.items()})
+    data.update(status)
+    return json.dumps(data)
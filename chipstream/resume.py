@@ -0,0 +1,214 @@
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+
+from dcnum.logic import DCNumJobRunner
+import h5py
+
+from .background_cache import BACKGROUND_INPUT_ATTR, get_input_fingerprint
+from .staging import rewrite_basin_paths
+
+
+#: HDF5 attribute of the temporary input file that marks a completed
+#: background computation
+BACKGROUND_CHECKPOINT_ATTR = "chipstream:checkpoint background"
+
+
+def has_checkpoint_support() -> bool:
+    """Whether :class:`.DCNumJobRunner` has the internals for checkpoints
+
+    :class:`ResumableJobRunner` overrides private parts of the dcnum
+    job runner (the location of the temporary input file and the
+    background task). If any of them is missing (e.g. after a dcnum
+    update), checkpoints are disabled and jobs are run as usual.
+    """
+    try:
+        params = inspect.signature(DCNumJobRunner).parameters
+        params_close = inspect.signature(DCNumJobRunner.close).parameters
+    except (TypeError, ValueError):
+        return False
+    return ("tmp_suffix" in params
+            and "delete_temporary_files" in params_close
+            and all(isinstance(getattr(DCNumJobRunner, name, None), property)
+                    for name in ["path_temp_in", "path_temp_out"])
+            and all(callable(getattr(DCNumJobRunner, name, None))
+                    for name in ["run_pipeline", "task_background"]))
+
+
+def get_shared_background_path(job) -> pathlib.Path:
+    """Return the temporary input file shared by pipeline variants
+
+    Jobs for the same input file that only differ in segmentation,
+    feature extraction, or gating share the same background data.
+    The file is placed next to the output file of `job` and its name
+    only depends on the input file and on the pipeline identifiers
+    up to the background computation.
+    """
+    _, _, ppdict = job.get_ppid(ret_hash=True, ret_dict=True)
+    path_in = pathlib.Path(job["path_in"])
+    key = "|".join([str(path_in),
+                    ppdict["gen_id"],
+                    ppdict["dat_id"],
+                    ppdict["bg_id"]])
+    digest = hashlib.md5(key.encode("utf-8")).hexdigest()[:12]
+    po = pathlib.Path(job["path_out"])
+    return po.with_name(f"{path_in.stem}_input_bb_shared-{digest}.rtdc~")
+
+
+class ResumableJobRunner(DCNumJobRunner):
+    def __init__(self, job, *args, path_background=None,
+                 background_cache=None, **kwargs):
+        """Job runner that checkpoints the background computation
+
+        The temporary input file containing the background data is kept
+        when a job fails or is interrupted and the runner of the next
+        attempt with the same pipeline reuses it instead of computing
+        the background again.
+
+        For this to work, the names of the temporary files are
+        derived from the pipeline hash instead of being random.
+        This is the only checkpoint: Segmentation and feature
+        extraction cannot be resumed from a partially written output
+        file, because dcnum always processes all image chunks. The
+        partial output of an interrupted run is discarded and the
+        next attempt starts segmentation from the first event.
+
+        If `path_background` is given, it is used as the temporary
+        input file instead (see :func:`get_shared_background_path`),
+        so that several jobs with the same background pipeline reuse
+        the background computed by the first job. This file is never
+        removed by the runner.
+
+        If a :class:`.BackgroundCache` is given as `background_cache`,
+        the background data are taken from the cache if available and
+        added to the cache otherwise.
+
+        If the installed version of dcnum does not provide the
+        internals required for checkpoints (see
+        :func:`has_checkpoint_support`), the runner behaves like
+        :class:`.DCNumJobRunner` and `path_background` and
+        `background_cache` are ignored.
+        """
+        self.path_background = path_background
+        self.background_cache = background_cache
+        #: whether the background computation is checkpointed
+        self.checkpoints = has_checkpoint_support()
+        if self.checkpoints:
+            _, pphash = job.get_ppid(ret_hash=True)
+            kwargs.setdefault("tmp_suffix", f"resume-{pphash[:12]}")
+        super(ResumableJobRunner, self).__init__(job, *args, **kwargs)
+        if not hasattr(self, "_data_temp_in"):
+            self.checkpoints = False
+        if not self.checkpoints:
+            self.logger.warning("Background checkpoints are not supported "
+                                "by this version of dcnum")
+
+    @property
+    def path_temp_in(self) -> pathlib.Path:
+        if not self.checkpoints:
+            return super(ResumableJobRunner, self).path_temp_in
+        # Unlike in the original implementation, the temporary input file
+        # is not removed at exit, because it is the checkpoint.
+        if self.path_background is not None:
+            return pathlib.Path(self.path_background)
+        po = pathlib.Path(self.job["path_out"])
+        return po.with_name(po.stem + f"_input_bb_{self.tmp_suffix}.rtdc~")
+
+    def close(self, delete_temporary_files=True):
+        if not self.checkpoints:
+            super(ResumableJobRunner, self).close(
+                delete_temporary_files=delete_temporary_files)
+            return
+        # Keep the checkpoint unless the job is complete.
+        delete = delete_temporary_files and self.state == "done"
+        super(ResumableJobRunner, self).close(
+            delete_temporary_files=delete and self.path_background is None)
+        if delete and self.path_background is not None:
+            # The shared background data are removed by the owner.
+            self.path_log.unlink(missing_ok=True)
+
+    def get_background_checkpoint_id(self) -> str:
+        """Identifier of the background data for this job and input file
+
+        The input file is identified by its size, modification time,
+        and content fingerprint (see :func:`.get_input_fingerprint`),
+        but not by its path or inode, so that the checkpoint remains
+        valid when the input file is staged again (see
+        :func:`.stage_job`), which preserves the modification time.
+        """
+        st = os.stat(self.job["path_in"])
+        return json.dumps({
+            "gen_id": self.ppdict["gen_id"],
+            "dat_id": self.ppdict["dat_id"],
+            "bg_id": self.ppdict["bg_id"],
+            "input": [st.st_size,
+                      st.st_mtime_ns,
+                      get_input_fingerprint(self.job["path_in"])],
+        }, sort_keys=True)
+
+    def has_background_checkpoint(self) -> bool:
+        """Whether the background was computed by a previous attempt"""
+        if not self.checkpoints or not self.path_temp_in.exists():
+            return False
+        try:
+            with h5py.File(self.path_temp_in, "r") as h5:
+                checkpoint = h5.attrs.get(BACKGROUND_CHECKPOINT_ATTR)
+        except OSError:
+            # e.g. truncated file
+            return False
+        return checkpoint == self.get_background_checkpoint_id()
+
+    def run_pipeline(self):
+        if self.checkpoints:
+            # The partial output of a previous attempt cannot be reused.
+            self.path_temp_out.unlink(missing_ok=True)
+        super(ResumableJobRunner, self).run_pipeline()
+
+    def task_background(self):
+        if not self.checkpoints:
+            super(ResumableJobRunner, self).task_background()
+            return
+        if self._data_temp_in is not None:
+            self._data_temp_in.close()
+            self._data_temp_in = None
+        if self.has_background_checkpoint():
+            self.logger.info("Reusing background data of a previous run")
+            # The input file might have been staged to a different path.
+            with h5py.File(self.path_temp_in, "r") as h5:
+                path_source = h5.attrs.get(BACKGROUND_INPUT_ATTR)
+            path_in = pathlib.Path(self.job["path_in"]).resolve()
+            if path_source and path_source != str(path_in):
+                rewrite_basin_paths(self.path_temp_in, path_source, path_in)
+            return
+        # Remove incomplete background data of a previous attempt.
+        self.path_temp_in.unlink(missing_ok=True)
+        if self.background_cache is not None:
+            key = self.background_cache.get_key(self.job["path_in"],
+                                                self.ppdict)
+            try:
+                cached = self.background_cache.restore(
+                    key, self.path_temp_in, self.job["path_in"])
+            except (OSError, KeyError):
+                self.logger.warning("Could not read cached background data",
+                                    exc_info=True)
+                cached = False
+            if cached:
+                self.logger.info("Reusing cached background data")
+        else:
+            cached = False
+        if not cached:
+            super(ResumableJobRunner, self).task_background()
+        with h5py.File(self.path_temp_in, "a") as h5:
+            h5.attrs[BACKGROUND_CHECKPOINT_ATTR] = \
+                self.get_background_checkpoint_id()
+            h5.attrs[BACKGROUND_INPUT_ATTR] = \
+                str(pathlib.Path(self.job["path_in"]).resolve())
+        if self.background_cache is not None and not cached:
+            try:
+                self.background_cache.store(key, self.path_temp_in,
+                                            self.job["path_in"])
+            except OSError:
+                self.logger.warning("Could not cache background data",
+                                    exc_info=True)
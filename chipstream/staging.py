@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+
+from dcnum.logic import DCNumPipelineJob
+import h5py
+
+
+class StagingArea:
+    def __init__(self,
+                 path: pathlib.Path | str,
+                 max_bytes: int | None = None):
+        """Local directory for copies of input files on slow storage
+
+        Input files on network shares are copied to the staging area
+        (e.g. a local SSD or tmpfs) before they are processed, so that
+        the dcnum worker processes do not read random HDF5 chunks from
+        the network share. Since :func:`stage` blocks until the copy
+        is complete, it should be called for the next input file while
+        the current file is processed (e.g. via :func:`.prefetch`).
+
+        Parameters
+        ----------
+        path:
+            staging directory; it is created if it does not exist
+        max_bytes:
+            maximum total size of the files in the staging area;
+            if not set, only the free disk space limits staging
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        #: dictionary with the staged files as keys and tuples
+        #: (original path, file size) as values
+        self._staged = {}
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def used_bytes(self) -> int:
+        """Total size of the files in the staging area"""
+        with self._condition:
+            return sum(size for _, size in self._staged.values())
+
+    def close(self):
+        """Remove all staged files and stop staging new files"""
+        with self._condition:
+            self._closed = True
+            for path_staged in list(self._staged):
+                self.release(path_staged)
+            self._condition.notify_all()
+
+    def get_original_path(self, path: pathlib.Path) -> pathlib.Path:
+        """Return the original path of a staged file
+
+        If `path` is not a staged file, `path` is returned.
+        """
+        with self._condition:
+            if path in self._staged:
+                return self._staged[path][0]
+        return path
+
+    def get_staged_path(self, path_in: pathlib.Path) -> pathlib.Path:
+        """Return the location of the copy of `path_in` in the staging area
+
+        Files with the same name from different directories do not
+        share the same location.
+        """
+        digest = hashlib.md5(str(path_in).encode("utf-8")).hexdigest()[:10]
+        return self.path / f"{path_in.stem}_{digest}{path_in.suffix}"
+
+    def has_space(self, size: int) -> bool:
+        """Whether a file of `size` bytes fits into the staging area now"""
+        with self._condition:
+            used = self.used_bytes
+            if self.max_bytes is not None and used + size > self.max_bytes:
+                return False
+            return shutil.disk_usage(self.path).free > size
+
+    def release(self, path_staged: pathlib.Path):
+        """Remove a staged file from the staging area"""
+        with self._condition:
+            if path_staged in self._staged:
+                self._staged.pop(path_staged)
+                path_staged.unlink(missing_ok=True)
+                self._condition.notify_all()
+
+    def stage(self, path_in: pathlib.Path) -> pathlib.Path:
+        """Copy a file to the staging area and return the path of the copy
+
+        If the staging area is full, wait until other files are
+        released (see :func:`release`). Files that do not fit into the
+        staging area at all (file larger than `max_bytes` or than the
+        free disk space while no other files are staged) are not
+        copied and `path_in` is returned. The same applies after the
+        staging area was closed.
+        """
+        path_in = pathlib.Path(path_in)
+        size = path_in.stat().st_size
+        path_staged = self.get_staged_path(path_in)
+        with self._condition:
+            if path_staged in self._staged:
+                # Input file was staged already.
+                return path_staged
+            while not self._closed and not self.has_space(size):
+                if not self._staged:
+                    # Waiting would not free any space.
+                    return path_in
+                self._condition.wait()
+            if self._closed:
+                return path_in
+            # reserve space for this file
+            self._staged[path_staged] = (path_in, size)
+        try:
+            # Copy to a temporary file first, so that an incomplete copy
+            # is never mistaken for the staged file.
+            path_temp = path_staged.with_name(path_staged.name + "~")
+            shutil.copy2(path_in, path_temp)
+            path_temp.replace(path_staged)
+        except BaseException:
+            path_temp.unlink(missing_ok=True)
+            self.release(path_staged)
+            raise
+        with self._condition:
+            if path_staged not in self._staged:
+                # The staging area was closed while copying.
+                path_staged.unlink(missing_ok=True)
+                return path_in
+        return path_staged
+
+
+def rewrite_basin_paths(path_out: pathlib.Path,
+                        path_old: pathlib.Path,
+                        path_new: pathlib.Path,
+                        dir_out: pathlib.Path | None = None):
+    """Replace the location of a file basin in an output file
+
+    dcnum stores the absolute and relative path of the input file
+    in the file basins of the output file. When the input file was
+    processed from the staging area, the basins must point to the
+    original input file instead. The relative path is computed with
+    respect to `dir_out`, which defaults to the directory of
+    `path_out` and must be set if the output file will be moved
+    to a different directory.
+    """
+    path_old = pathlib.Path(path_old).resolve()
+    path_new = pathlib.Path(path_new).resolve()
+    dir_cur = pathlib.Path(path_out).resolve().parent
+    if dir_out is None:
+        dir_out = dir_cur
+    dir_out = pathlib.Path(dir_out).resolve()
+    with h5py.File(path_out, "a") as h5:
+        basins = h5.get("basins", {})
+        for key in list(basins.keys()):
+            lines = [ll.decode("utf-8") if isinstance(ll, bytes) else ll
+                     for ll in basins[key][:]]
+            bdat = json.loads("\n".join(lines))
+            if bdat.get("type") != "file":
+                continue
+            resolved = [(dir_cur / pp).resolve() for pp in bdat["paths"]]
+            if path_old not in resolved:
+                continue
+            paths = [str(path_new)]
+            try:
+                paths.append(os.path.relpath(path_new, dir_out))
+            except ValueError:
+                # no relative path possible (different drives on Windows)
+                pass
+            bdat["paths"] = paths
+            # Basins are stored like in `dcnum.write.HDF5Writer.store_basin`.
+            bstring = json.dumps(bdat, indent=2)
+            key_new = hashlib.md5(
+                bstring.encode("utf-8", errors="ignore")).hexdigest()
+            del basins[key]
+            if key_new not in basins:
+                blines = bstring.split("\n")
+                basins.create_dataset(
+                    name=key_new,
+                    data=blines,
+                    shape=(len(blines),),
+                    dtype=f"S{max([len(b) for b in blines])}",
+                    chunks=True)
+
+
+def stage_job(job: DCNumPipelineJob,
+              staging_area: StagingArea) -> DCNumPipelineJob:
+    """Return a copy of `job` that reads from the staged input file"""
+    path_staged = staging_area.stage(job["path_in"])
+    if path_staged == pathlib.Path(job["path_in"]):
+        # not staged
+        return job
+    kwargs = {key: job[key] for key in job.kwargs}
+    kwargs["path_in"] = path_staged
+    return DCNumPipelineJob(**kwargs)
+
+
+def unstage_job(job: DCNumPipelineJob,
+                staging_area: StagingArea,
+                release: bool = True) -> pathlib.Path:
+    """Clean up after a job created with :func:`stage_job` has finished
+
+    The file basins of the output file are pointed to the original
+    input file (see :func:`rewrite_basin_paths`) and the staged input
+    file is released, unless `release` is False (e.g. because other
+    jobs still read from it). Returns the original input path.
+    """
+    path_staged = pathlib.Path(job["path_in"])
+    path_in = staging_area.get_original_path(path_staged)
+    if path_in != path_staged:
+        if job["path_out"].exists():
+            rewrite_basin_paths(job["path_out"], path_staged, path_in)
+        if release:
+            staging_area.release(path_staged)
+    return path_in
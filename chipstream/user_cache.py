@@ -0,0 +1,28 @@
+import os
+import pathlib
+import platform
+
+
+def get_cache_dir() -> pathlib.Path:
+    """Return the directory in which ChipStream caches data
+
+    The directory is created if it does not exist. On Linux, this is
+    the same directory the GUI gets from Qt's `QStandardPaths`. You
+    can override the location with the environment variable
+    ``CHIPSTREAM_CACHE_DIR``.
+    """
+    if path := os.environ.get("CHIPSTREAM_CACHE_DIR"):
+        cache_dir = pathlib.Path(path)
+    elif platform.system() == "Windows":
+        base = os.environ.get("LOCALAPPDATA",
+                              pathlib.Path.home() / "AppData" / "Local")
+        cache_dir = pathlib.Path(base) / "DC-Analysis" / "ChipStream" / "cache"
+    elif platform.system() == "Darwin":
+        cache_dir = (pathlib.Path.home() / "Library" / "Caches"
+                     / "DC-Analysis" / "ChipStream")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME",
+                              pathlib.Path.home() / ".cache")
+        cache_dir = pathlib.Path(base) / "DC-Analysis" / "ChipStream"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
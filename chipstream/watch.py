@@ -0,0 +1,179 @@
+import os
+import pathlib
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Sequence
+
+import h5py
+
+from .discovery import InputDiscovery
+
+
+#: Time between two polls of the watched directory tree in seconds
+WATCH_INTERVAL = 2.0
+
+
+def is_readable_hdf5(path: pathlib.Path) -> bool:
+    """Whether a file is a complete HDF5 file with an "events" group"""
+    try:
+        with h5py.File(path, "r") as h5:
+            return "events" in h5
+    except BaseException:
+        return False
+
+
+class FolderWatcher:
+    def __init__(self,
+                 path: pathlib.Path | str,
+                 include: Sequence[str] = ("*.rtdc",),
+                 exclude: Sequence[str] = ("*_dcn.rtdc",),
+                 max_depth: int | None = None,
+                 interval: float | None = None):
+        """Watch a directory tree for new input files
+
+        Change notifications (e.g. inotify) are not available for
+        network shares, which is where acquisition systems usually
+        store their data. The directory tree is therefore polled
+        every `interval` seconds (defaults to :const:`WATCH_INTERVAL`).
+        A poll only lists directories whose modification time changed
+        (i.e. files were added, removed, or renamed) and checks the
+        files that are not yet complete, so that polling a large tree
+        is cheap.
+
+        A file is complete when its size and modification time did
+        not change between two polls and it can be opened as an HDF5
+        file (see :func:`is_readable_hdf5`). A file that is replaced
+        later on (e.g. by a new acquisition with the same name) is
+        yielded again.
+
+        See :class:`.InputDiscovery` for the parameters `include`,
+        `exclude`, and `max_depth`.
+        """
+        self.path = pathlib.Path(path)
+        self.interval = WATCH_INTERVAL if interval is None else interval
+        self._discovery = InputDiscovery(path=self.path,
+                                         include=include,
+                                         exclude=exclude,
+                                         max_depth=max_depth)
+        #: known directories with their (size, mtime) and subdirectories
+        self._dirs = {}
+        #: files that are (possibly) still being written with their
+        #: last (size, mtime)
+        self._pending = {}
+        #: complete files with their (size, mtime)
+        self._complete = {}
+        self._stop = threading.Event()
+        self._queue = None
+        self._thread = None
+
+    def __iter__(self) -> Iterator[pathlib.Path]:
+        """Yield complete files until :func:`stop` is called"""
+        while not self._stop.is_set():
+            yield from self.poll()
+            self._stop.wait(self.interval)
+
+    @staticmethod
+    def get_stat(path) -> tuple | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def get_ready_paths(self) -> List[pathlib.Path]:
+        """Return the files found by the background thread
+
+        The background thread is started with :func:`start`.
+        """
+        paths = []
+        while self._queue is not None:
+            try:
+                paths.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return paths
+
+    def poll(self) -> List[pathlib.Path]:
+        """Look for new files and return the files that are complete
+
+        The files are returned in alphabetical order.
+        """
+        ready = []
+        for path, stat_prev in sorted(self._pending.items()):
+            stat = self.get_stat(path)
+            if stat is None:
+                # file was removed or renamed
+                self._pending.pop(path)
+            elif stat != stat_prev:
+                # file is still being written
+                self._pending[path] = stat
+            elif is_readable_hdf5(path):
+                self._pending.pop(path)
+                self._complete[path] = stat
+                ready.append(path)
+        # New files are checked in the next poll.
+        self.scan_dirs(self.path, depth=0)
+        return ready
+
+    def scan_dirs(self, path: pathlib.Path, depth: int):
+        """List all directories in a tree whose modification time changed
+
+        New input files are added to the pending files.
+        """
+        stat = self.get_stat(path)
+        if stat is None:
+            # directory was removed
+            self._dirs.pop(path, None)
+            return
+        stat_prev, subdirs = self._dirs.get(path, (None, []))
+        # Directories that were modified recently are listed again,
+        # because the modification time of some network file systems
+        # has a resolution of seconds.
+        if stat != stat_prev or time.time() - stat[1] / 1e9 < 2:
+            subdirs = []
+            for item, is_dir in self._discovery.list_dir(path, depth):
+                if is_dir:
+                    subdirs.append(item)
+                    continue
+                item_stat = self.get_stat(item)
+                if item in self._complete:
+                    if self._complete[item] == item_stat:
+                        continue
+                    # file was replaced
+                    self._complete.pop(item)
+                # The size and mtime are compared in the next poll.
+                self._pending.setdefault(item, item_stat)
+            self._dirs[path] = (stat, subdirs)
+        # Subdirectories must be checked as well, because changes in
+        # a subdirectory do not affect the modification time of `path`.
+        for pp in subdirs:
+            self.scan_dirs(pp, depth + 1)
+
+    def start(self):
+        """Watch the directory tree in a background thread
+
+        The files found are returned by :func:`get_ready_paths`.
+        """
+        self._queue = queue.Queue()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run,
+                                        name="ChipStreamFolderWatcher",
+                                        daemon=True)
+        self._thread.start()
+
+    def run(self):
+        for path in self:
+            self._queue.put(path)
+
+    def stop(self):
+        """Stop watching (ends iteration and the background thread)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_state(self) -> Dict[str, int]:
+        return {"directories": len(self._dirs),
+                "pending": len(self._pending),
+                "complete": len(self._complete)}
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import pathlib
+import queue
+import shutil
+import threading
+import time
+
+from dcnum.logic import DCNumPipelineJob
+
+from .output_state import get_output_hash
+from .staging import rewrite_basin_paths
+
+
+logger = logging.getLogger(__name__)
+
+
+def compute_file_hash(path: pathlib.Path) -> str:
+    """Return the MD5 hash of a file"""
+    hasher = hashlib.md5()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(2**20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def move_file(path_src: pathlib.Path, path_dst: pathlib.Path):
+    """Move a file to a different file system and verify the copy
+
+    The file is copied to a temporary file next to `path_dst` and
+    the size and MD5 hash of the copy are compared to the original
+    before it is renamed to `path_dst`. The original file is only
+    removed after that. An OSError is raised if the copy does not
+    match the original, in which case the original file is kept.
+    """
+    path_src = pathlib.Path(path_src)
+    path_dst = pathlib.Path(path_dst)
+    size = path_src.stat().st_size
+    digest = compute_file_hash(path_src)
+    path_temp = path_dst.with_name(path_dst.name + "~")
+    try:
+        path_dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path_src, path_temp)
+        if path_temp.stat().st_size != size:
+            raise OSError(f"Size mismatch after copying '{path_src}' "
+                          f"to '{path_temp}'")
+        if compute_file_hash(path_temp) != digest:
+            raise OSError(f"Hash mismatch after copying '{path_src}' "
+                          f"to '{path_temp}'")
+        path_temp.replace(path_dst)
+    except BaseException:
+        path_temp.unlink(missing_ok=True)
+        raise
+    path_src.unlink()
+
+
+class OutputMover:
+    def __init__(self,
+                 path: pathlib.Path | str,
+                 num_retries: int = 3,
+                 retry_delay: float = 5.0):
+        """Write output files locally and move them in the background
+
+        Output files on network shares are first written to a local
+        directory (e.g. a local SSD), because the HDF5 writer of dcnum
+        stalls on the latency of the network share. Once a job is
+        complete, its output file is moved to its destination in a
+        background thread (see :func:`move_file`) while the next job
+        is already running.
+
+        Parameters
+        ----------
+        path:
+            local directory for the output files; it is created if it
+            does not exist
+        num_retries:
+            number of times a failed move is retried
+        retry_delay:
+            time to wait before the first retry in seconds; the time
+            is doubled for every following retry
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.num_retries = num_retries
+        self.retry_delay = retry_delay
+        #: list of tuples (local path, destination, exception) of the
+        #: output files that could not be moved
+        self.failed = []
+        #: dictionary with the local paths as keys and the
+        #: destinations as values
+        self._destinations = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._num_pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def num_pending(self) -> int:
+        """Number of submitted files that were not moved yet"""
+        with self._lock:
+            return self._num_pending
+
+    def close(self) -> list:
+        """Wait until all submitted files are moved
+
+        Returns the list of files that could not be moved (see
+        :const:`failed`). These files are kept in the local directory.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        return self.failed
+
+    def get_destination(self, path_local: pathlib.Path) -> pathlib.Path:
+        """Return the destination of a local output file
+
+        If `path_local` is not a local output file, `path_local`
+        is returned.
+        """
+        with self._lock:
+            return self._destinations.get(path_local, path_local)
+
+    def get_local_path(self, path_out: pathlib.Path) -> pathlib.Path:
+        """Return the local path for the output file `path_out`
+
+        The local path is registered, so that the output file is
+        moved to `path_out` when it is submitted (see :func:`submit`).
+        Output files with the same name from different directories do
+        not share the same local path.
+        """
+        path_out = pathlib.Path(path_out)
+        digest = hashlib.md5(str(path_out).encode("utf-8")).hexdigest()[:10]
+        path_local = self.path / f"{path_out.stem}_{digest}{path_out.suffix}"
+        with self._lock:
+            self._destinations[path_local] = path_out
+        return path_local
+
+    def submit(self, path_local: pathlib.Path):
+        """Move a local output file to its destination in the background"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run,
+                    name="OutputMover",
+                    daemon=True)
+                self._thread.start()
+            self._num_pending += 1
+        self._queue.put(path_local)
+
+    def move(self, path_local: pathlib.Path) -> bool:
+        """Move a local output file to its destination, with retries
+
+        Returns True if the file was moved and False otherwise
+        (see :const:`failed`).
+        """
+        path_dst = self.get_destination(path_local)
+        for attempt in range(self.num_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                move_file(path_local, path_dst)
+            except OSError as e:
+                logger.warning(f"Could not move '{path_local}' to "
+                               f"'{path_dst}' (attempt {attempt + 1}): {e}")
+                error = e
+            else:
+                logger.info(f"Moved output file to '{path_dst}'")
+                with self._lock:
+                    self._destinations.pop(path_local, None)
+                return True
+        self.failed.append((path_local, path_dst, error))
+        return False
+
+    def run(self):
+        while (path_local := self._queue.get()) is not None:
+            self.move(path_local)
+            with self._lock:
+                self._num_pending -= 1
+
+
+def write_behind_job(job: DCNumPipelineJob,
+                     output_mover: OutputMover) -> DCNumPipelineJob | None:
+    """Return a copy of `job` that writes to the local directory
+
+    If the local output file of a previous attempt with the same
+    pipeline exists (because it could not be moved), it is submitted
+    for moving and None is returned, i.e. nothing is recomputed.
+    """
+    path_local = output_mover.get_local_path(job["path_out"])
+    if path_local.exists():
+        _, pphash = job.get_ppid(ret_hash=True)
+        if get_output_hash(path_local) == pphash:
+            output_mover.submit(path_local)
+            return None
+        path_local.unlink()
+    kwargs = {key: job[key] for key in job.kwargs}
+    kwargs["path_out"] = path_local
+    return DCNumPipelineJob(**kwargs)
+
+
+def submit_job_output(job: DCNumPipelineJob,
+                      output_mover: OutputMover,
+                      path_in: pathlib.Path | None = None) -> pathlib.Path:
+    """Move the output of a job created with :func:`write_behind_job`
+
+    The relative paths of the file basins pointing to the input file
+    `path_in` (defaults to the input file of the job) are adapted to
+    the destination and the output file is submitted to the
+    `output_mover`. Returns the destination of the output file.
+    """
+    path_local = pathlib.Path(job["path_out"])
+    path_out = output_mover.get_destination(path_local)
+    if path_out != path_local and path_local.exists():
+        if path_in is None:
+            path_in = job["path_in"]
+        rewrite_basin_paths(path_local, path_in, path_in,
+                            dir_out=path_out.parent)
+        output_mover.submit(path_local)
+    return path_out
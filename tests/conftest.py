@@ -3,6 +3,8 @@ import shutil
 import tempfile
 import time
 
+import pytest
+
 # https://github.com/pytorch/pytorch/issues/166628
 # Import pytorch before PyQt6
 try:
@@ -40,3 +42,15 @@ def pytest_configure(config):
     # set global temp directory
     tempfile.tempdir = TMPDIR
     atexit.register(shutil.rmtree, TMPDIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Use a separate cache directory for every test
+
+    This does not clutter the user's cache directory, and the dataset
+    index and background cache of one test do not affect other tests.
+    """
+    path = tmp_path / "cache"
+    monkeypatch.setenv("CHIPSTREAM_CACHE_DIR", str(path))
+    return path
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+
+from dcnum.logic import DCNumJobRunner, DCNumPipelineJob
+import h5py
+
+from chipstream.background_cache import BackgroundCache, get_input_fingerprint
+from chipstream.resume import ResumableJobRunner
+
+from helper_methods import retrieve_data
+
+
+def get_file_basin_paths(path):
+    paths = []
+    with h5py.File(path) as h5:
+        for key in h5["basins"]:
+            lines = [ll.decode("utf-8") if isinstance(ll, bytes) else ll
+                     for ll in h5["basins"][key][:]]
+            bdat = json.loads("\n".join(lines))
+            if bdat["type"] == "file":
+                paths.append(bdat["paths"][0])
+    return paths
+
+
+def test_input_fingerprint(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_copy = tmp_path / "copy.rtdc"
+    shutil.copy(path, path_copy)
+    assert get_input_fingerprint(path) == get_input_fingerprint(path_copy)
+    with path_copy.open("ab") as fd:
+        fd.write(b"\0")
+    assert get_input_fingerprint(path) != get_input_fingerprint(path_copy)
+
+
+def test_background_cache_reuse(tmp_path, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    cache = BackgroundCache(tmp_path / "cache")
+
+    calls = []
+    task_background = DCNumJobRunner.task_background
+
+    def tracked(self):
+        calls.append(self)
+        return task_background(self)
+
+    monkeypatch.setattr(DCNumJobRunner, "task_background", tracked)
+
+    # a copy of the input file in a different directory
+    path_copy = tmp_path / "other" / "copy.rtdc"
+    path_copy.parent.mkdir()
+    shutil.copy2(path, path_copy)
+
+    outputs = []
+    for path_in, thresh in [(path, -4), (path_copy, -6)]:
+        job = DCNumPipelineJob(path_in=path_in,
+                               path_out=path_in.with_name(f"out{thresh}.rtdc"),
+                               background_code="sparsemed",
+                               segmenter_code="thresh",
+                               segmenter_kwargs={"thresh": thresh},
+                               basin_strategy="tap",
+                               debug=True)
+        with ResumableJobRunner(job, background_cache=cache) as runner:
+            runner.run()
+            assert runner.state == "done"
+        outputs.append(job["path_out"])
+    assert len(calls) == 1, "background must be computed only once"
+    assert len(cache.get_entries()) == 1
+
+    # The basins point to the input file of each job.
+    assert str(path) in get_file_basin_paths(outputs[0])
+    assert str(path_copy) in get_file_basin_paths(outputs[1])
+    with h5py.File(outputs[0]) as h5, h5py.File(outputs[1]) as h5_copy:
+        assert h5.attrs["pipeline:dcnum background"] \
+            == h5_copy.attrs["pipeline:dcnum background"]
+        assert h5.attrs["experiment:event count"] \
+            < h5_copy.attrs["experiment:event count"]
+
+
+def test_background_cache_eviction(tmp_path):
+    cache = BackgroundCache(tmp_path / "cache", max_bytes=2500)
+    for ii, name in enumerate(["a", "b", "c"]):
+        path = cache.get_entry_path(name)
+        path.write_bytes(b"\0" * 1000)
+        os.utime(path, (1000 + ii, 1000 + ii))
+    # entry "a" is used
+    os.utime(cache.get_entry_path("a"), (2000, 2000))
+    cache.evict()
+    assert cache.used_bytes == 2000
+    assert not cache.get_entry_path("b").exists()
+
+    # files larger than the cache are not added
+    path_large = tmp_path / "large.rtdc~"
+    path_large.write_bytes(b"\0" * 3000)
+    cache.store("d", path_large, path_large)
+    assert not cache.get_entry_path("d").exists()
+    assert cache.used_bytes == 2000
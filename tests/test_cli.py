@@ -1,4 +1,13 @@
+import csv
+import itertools
+import json
+import shutil
+import subprocess
+import sys
+import types
+
 import dcnum.read
+import dcnum.segm
 import h5py
 import numpy as np
 
@@ -10,7 +19,13 @@ pytest.importorskip("click")
 
 import dcnum  # noqa: E402
 import chipstream  # noqa: E402
-from chipstream.cli import cli_main  # noqa: E402
+from chipstream import preview, write_behind  # noqa: E402
+from chipstream.cli import cli_batch, cli_main  # noqa: E402
+from chipstream.dataset_index import (  # noqa: E402
+    DatasetIndex, get_default_index_path
+)
+from chipstream.input_probe import get_flickering_detector_id  # noqa: E402
+from chipstream.resume import ResumableJobRunner  # noqa: E402
 
 
 @pytest.mark.parametrize("drain", [True, False])
@@ -123,6 +138,98 @@ def test_cli_flickering_correction(cli_runner, add_flickering):
             assert "bg_off" not in h5["events"]
 
 
+def test_cli_skip_existing_output(cli_runner):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_out = path.with_name("output.rtdc")
+    args = [str(path), str(path_out), "-s", "thresh"]
+
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+    mtime = path_out.stat().st_mtime_ns
+
+    # The output file is up to date, nothing should happen.
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+    assert result.stdout.count("Output state:\tcurrent")
+    assert result.stdout.count("is up to date, skipping")
+    assert path_out.stat().st_mtime_ns == mtime
+
+    # A different pipeline renders the output file stale.
+    args_stale = args + ["-ks", "thresh=-5"]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args_stale)
+    assert result.exit_code == 1
+    assert result.stdout.count("Output state:\tstale")
+    assert result.stderr.count("--override")
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               args_stale + ["--override"])
+    assert result.exit_code == 0
+    with h5py.File(path_out) as h5:
+        assert h5.attrs["pipeline:dcnum segmenter"].startswith("thresh:t=-5")
+
+
+def test_cli_skip_existing_output_from_index(cli_runner, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_out = path.with_name("output.rtdc")
+    args = [str(path), str(path_out), "-s", "thresh",
+            "-kb", "offset_correction=0"]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+
+    # In the second run, neither input nor output file are opened.
+    def no_hdf5(*args, **kwargs):
+        raise AssertionError("HDF5 file opened")
+
+    monkeypatch.setattr(dcnum.read.HDF5Data, "__init__", no_hdf5)
+    monkeypatch.setattr(h5py, "File", no_hdf5)
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+    assert result.stdout.count("is up to date, skipping")
+
+    # Without the index, the input file must be opened.
+    result = cli_runner.invoke(cli_main.chipstream_cli, args + ["--no-index"])
+    assert result.exit_code == 1
+    assert result.stderr.count("Not a valid input file")
+
+
+def test_cli_recompute_flickering(cli_runner):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    args = [str(path), "-s", "thresh", "--dry-run"]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+    di = DatasetIndex(get_default_index_path())
+    detector_id = get_flickering_detector_id()
+    assert di.get_flickering(path, detector_id) is False
+
+    # Tamper with the index to see whether the cached result is used
+    di.set_flickering(path, detector_id, True)
+    result2 = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result2.exit_code == 0
+    assert result2.stdout.count("sparsemed:k=200^s=1^t=0^f=0.8^o=1\n")
+
+    result3 = cli_runner.invoke(cli_main.chipstream_cli,
+                                args + ["--recompute-flickering"])
+    assert result3.exit_code == 0
+    assert result3.stdout.count("sparsemed:k=200^s=1^t=0^f=0.8^o=0\n")
+    assert di.get_flickering(path, detector_id) is False
+
+
+def test_cli_flickering_sampled(cli_runner):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    args = [str(path), "-s", "thresh", "--dry-run",
+            "-kd", "num_chunks=4"]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0
+    assert result.stdout.count("sparsemed:k=200^s=1^t=0^f=0.8^o=0\n")
+    di = DatasetIndex(get_default_index_path())
+    assert di.get_flickering(
+        path, get_flickering_detector_id({"num_chunks": 4})) is False
+
+
 def test_invalid_input_data_no_image_data(cli_runner):
     path = retrieve_data(
         "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
@@ -318,6 +425,653 @@ def test_cli_torchmpo_wrong_model(cli_runner):
     assert result.stderr.count("only experiments in channel region supported")
 
 
+def test_cli_recursive_concurrent_jobs(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    for name in ["a", "b", "c"]:
+        (path_in / name).mkdir(parents=True)
+        shutil.copy2(path_temp, path_in / name / "data.rtdc")
+
+    path_out_serial = tmp_path / "serial"
+    path_out_concurrent = tmp_path / "concurrent"
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in),
+                                str(path_out_serial),
+                                "--recursive",
+                                ])
+    assert result.exit_code == 0
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in),
+                                str(path_out_concurrent),
+                                "--recursive",
+                                "--concurrent-jobs", "2",
+                                ])
+    assert result.exit_code == 0
+
+    for name in ["a", "b", "c"]:
+        with (h5py.File(path_out_serial / name / "data_dcn.rtdc") as h5s,
+              h5py.File(path_out_concurrent / name / "data_dcn.rtdc") as h5c):
+            assert h5s.attrs["pipeline:dcnum hash"] \
+                   == h5c.attrs["pipeline:dcnum hash"]
+            assert np.all(h5s["events/deform"][:] == h5c["events/deform"][:])
+
+
+def test_cli_recursive_prefetch(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    for name in ["a", "b", "c"]:
+        (path_in / name).mkdir(parents=True)
+        shutil.copy2(path_temp, path_in / name / "data.rtdc")
+    # The last file is broken, which must stop the batch when it is
+    # its turn, not when its preflight checks fail.
+    with h5py.File(path_in / "c" / "data.rtdc", "a") as h5:
+        del h5["events/image"]
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh"])
+    assert result.exit_code == 1
+    assert result.stderr.count("No image data found in input")
+    for name in ["a", "b"]:
+        assert (path_in / name / "data_dcn.rtdc").exists()
+    assert not (path_in / "c" / "data_dcn.rtdc").exists()
+    # The preflight messages are printed in the order of processing
+    lines = [ll for ll in result.stdout.split("\n")
+             if ll.startswith("Processing /") or ll.startswith("Data ID")]
+    assert len(lines) == 5
+    assert lines[0].endswith(str(path_in / "a" / "data.rtdc"))
+    assert lines[1].startswith("Data ID")
+    assert lines[2].endswith(str(path_in / "b" / "data.rtdc"))
+    assert lines[3].startswith("Data ID")
+    assert lines[4].endswith(str(path_in / "c" / "data.rtdc"))
+
+
+def test_cli_recursive_stage_dir(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    path_stage = tmp_path / "staging"
+    for name in ["a", "b"]:
+        (path_in / name).mkdir(parents=True)
+        shutil.copy2(path_temp, path_in / name / "data.rtdc")
+    size = path_temp.stat().st_size
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh",
+                                "--stage-dir", str(path_stage),
+                                # only one file fits into the staging area
+                                "--stage-max-size", str(int(size * 1.5)),
+                                ])
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("Staged input:") == 2
+    # staged files are removed
+    assert not list(path_stage.iterdir())
+    for name in ["a", "b"]:
+        path_out = path_in / name / "data_dcn.rtdc"
+        with h5py.File(path_out) as h5:
+            paths = []
+            for key in h5["basins"]:
+                bdat = json.loads("\n".join(
+                    ll.decode("utf-8") for ll in h5["basins"][key][:]))
+                if bdat["type"] == "file":
+                    paths += bdat["paths"]
+        # basins point to the original input file
+        assert paths
+        assert set(paths) == {str(path_in / name / "data.rtdc"),
+                              "data.rtdc"}
+        with dcnum.read.HDF5Data(path_out) as hd:
+            assert hd.image[0].shape == (80, 400)
+        report = json.loads(
+            path_out.with_name("data_dcn_report.json").read_text())
+        assert report["path_in"] == str(path_in / name / "data.rtdc")
+
+
+def test_cli_recursive_write_behind_dir(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    path_local = tmp_path / "local"
+    for name in ["a", "b"]:
+        (path_in / name).mkdir(parents=True)
+        shutil.copy2(path_temp, path_in / name / "data.rtdc")
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh",
+                                "--write-behind-dir", str(path_local),
+                                ])
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("Local output:") == 2
+    # output files are moved
+    assert not list(path_local.glob("*.rtdc"))
+    for name in ["a", "b"]:
+        path_out = path_in / name / "data_dcn.rtdc"
+        with h5py.File(path_out) as h5:
+            paths = []
+            for key in h5["basins"]:
+                bdat = json.loads("\n".join(
+                    ll.decode("utf-8") for ll in h5["basins"][key][:]))
+                if bdat["type"] == "file":
+                    paths += bdat["paths"]
+        # relative basin paths refer to the destination
+        assert set(paths) == {str(path_in / name / "data.rtdc"),
+                              "data.rtdc"}
+        with dcnum.read.HDF5Data(path_out) as hd:
+            assert hd.image[0].shape == (80, 400)
+        report = json.loads(
+            path_out.with_name("data_dcn_report.json").read_text())
+        assert report["path_out"] == str(path_out)
+        # the report was created before the output file was moved
+        assert report["output_bytes"] > 0
+        assert "feature extraction" in report["log_times"]
+
+
+def test_cli_write_behind_dir_failed_move(cli_runner, tmp_path, monkeypatch):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "data.rtdc"
+    shutil.copy2(path_temp, path_in)
+    path_out = tmp_path / "data_dcn.rtdc"
+    path_local = tmp_path / "local"
+
+    def move_file_broken(path_src, path_dst):
+        raise OSError("Network share not available")
+
+    monkeypatch.setattr(write_behind, "move_file", move_file_broken)
+    # do not wait between the retries
+    monkeypatch.setattr(write_behind, "time",
+                        types.SimpleNamespace(sleep=lambda delay: None))
+    args = [str(path_in), "-s", "thresh",
+            "--write-behind-dir", str(path_local)]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 1
+    assert not path_out.exists()
+    assert len(list(path_local.glob("*.rtdc"))) == 1
+
+    # The output file is moved in the next run without processing.
+    monkeypatch.undo()
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0, result.output
+    assert "Moving output file" in result.stdout
+    assert "Local output:" not in result.stdout
+    assert path_out.exists()
+    assert not list(path_local.glob("*.rtdc"))
+
+
+def test_cli_compression_auto(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "data.rtdc"
+    shutil.copy2(path_temp, path_in)
+    path_out = tmp_path / "data_dcn.rtdc"
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "-s", "thresh",
+                                "-c", "auto"])
+    assert result.exit_code == 0, result.output
+    assert "calibrated for" in result.stdout
+    compression = result.stdout.split("Compression:\t")[1].split()[0]
+    assert compression.startswith("zstd-")
+    with h5py.File(path_out) as h5:
+        # Zstandard filter of hdf5plugin
+        zstd = h5["events/mask"].id.get_create_plist().get_filter_by_id(32015)
+        assert zstd[1] == (int(compression.split("-")[1]),)
+
+
+def test_cli_recursive_include_exclude(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    for name in ["M001_data.rtdc",
+                 "M002_data.rtdc",
+                 "sub/M003_data.rtdc",
+                 "sub/deeper/M004_data.rtdc",
+                 "other.rtdc"]:
+        (path_in / name).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path_temp, path_in / name)
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh",
+                                "--include", "M00*.rtdc",
+                                "--exclude", "M002*",
+                                "--max-depth", "1",
+                                ])
+    assert result.exit_code == 0, result.output
+    processed = [ll.split()[1] for ll in result.stdout.split("\n")
+                 if ll.startswith(f"Processing {path_in}")]
+    assert processed == [str(path_in / "M001_data.rtdc"),
+                         str(path_in / "sub" / "M003_data.rtdc")]
+
+
+@pytest.mark.parametrize("size,num_entries", [["2G", 1], ["0", 0]])
+def test_cli_background_cache(cli_runner, tmp_path, cache_dir, size,
+                              num_entries):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    for thresh in [-6, -4]:
+        path_out = tmp_path / f"output{thresh}.rtdc"
+        result = cli_runner.invoke(cli_main.chipstream_cli,
+                                   [str(path_temp), str(path_out),
+                                    "-s", "thresh",
+                                    "-ks", f"thresh={thresh}",
+                                    "--background-cache-size", size,
+                                    ])
+        assert result.exit_code == 0, result.output
+        assert path_out.exists()
+    path_cache = cache_dir / "background"
+    assert len(list(path_cache.glob("*.rtdc"))) == num_entries
+
+
+def test_cli_variants(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "data.rtdc"
+    shutil.copy2(path_temp, path_in)
+    args = [str(path_in),
+            "-s", "thresh",
+            "-ks", "thresh=-6",
+            "--variant", "t4:-ks thresh=-4",
+            "--variant", "t8:-ks thresh=-8 -ks clear_border=False",
+            ]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0, result.output
+    # The background is only computed for the first variant.
+    assert result.stdout.count("Reusing shared background data") == 2
+    expected = {"data_dcn.rtdc": "thresh:t=-6:cle=1^f=1^clo=2",
+                "data_t4_dcn.rtdc": "thresh:t=-4:cle=1^f=1^clo=2",
+                "data_t8_dcn.rtdc": "thresh:t=-8:cle=0^f=1^clo=2"}
+    for name, seg_id in expected.items():
+        with h5py.File(tmp_path / name) as h5:
+            assert h5.attrs["pipeline:dcnum segmenter"] == seg_id
+    # no temporary files are left behind
+    assert not list(tmp_path.glob("*~"))
+
+    # Nothing is done when all output files are up to date.
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("is up to date, skipping") == 3
+    assert "Running variant" not in result.stdout
+
+
+def test_cli_variants_recursive(cli_runner, tmp_path):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    path_in.mkdir()
+    shutil.copy2(path_temp, path_in / "a.rtdc")
+    shutil.copy2(path_temp, path_in / "b.rtdc")
+    args = [str(path_in),
+            "--recursive",
+            "-s", "thresh",
+            "--variant", "t4:-ks thresh=-4",
+            ]
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("Reusing shared background data") == 2
+    assert sorted(pp.name for pp in path_in.glob("*_dcn.rtdc")) == [
+        "a_dcn.rtdc", "a_t4_dcn.rtdc", "b_dcn.rtdc", "b_t4_dcn.rtdc"]
+
+    # The output files of the variants are not processed as input files.
+    result = cli_runner.invoke(cli_main.chipstream_cli, args)
+    assert result.exit_code == 0, result.output
+    processed = [ll.split()[1] for ll in result.stdout.split("\n")
+                 if ll.startswith(f"Processing {path_in}")]
+    assert processed == [str(path_in / "a.rtdc"), str(path_in / "b.rtdc")]
+
+
+@pytest.mark.parametrize("variant,message", [
+    ["t4", "Invalid options"],
+    [":-ks thresh=-4", "Invalid variant"],
+    ["t/4:-ks thresh=-4", "Invalid variant"],
+    ["t4:-kb kernel_size=100", "Invalid option '-kb'"],
+    ["t4:-s unknown", "is not available"],
+])
+def test_cli_variants_invalid(cli_runner, variant, message):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_temp), "--variant", variant])
+    assert result.exit_code == 2
+    assert message in result.output
+
+
+def test_cli_watch(cli_runner, tmp_path, monkeypatch):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    (path_in / "sub").mkdir(parents=True)
+    shutil.copy2(path_temp, path_in / "sub" / "M001_data.rtdc")
+    path_out = tmp_path / "output"
+
+    # stop watching after the first file
+    iter_watched = cli_main.iter_watched_path_pairs
+    monkeypatch.setattr(
+        cli_main, "iter_watched_path_pairs",
+        lambda *args, **kwargs: itertools.islice(
+            iter_watched(*args, **kwargs), 1))
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), str(path_out),
+                                "--watch",
+                                "-s", "thresh",
+                                ])
+    assert result.exit_code == 0, result.output
+    assert f"Watching {path_in}" in result.stdout
+    assert (path_out / "sub" / "M001_data_dcn.rtdc").exists()
+
+
+def test_cli_watch_requires_directory(cli_runner):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_temp), "--watch"])
+    assert result.exit_code == 2
+    assert "must be a directory in watch mode" in result.output
+
+
+@pytest.mark.parametrize("order,expected", [
+    ["alphabetical", ["a", "b"]],
+    ["largest", ["b", "a"]],
+    ["smallest", ["a", "b"]],
+])
+def test_cli_recursive_order(cli_runner, tmp_path, order, expected):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    path_in.mkdir()
+    shutil.copy2(path_temp, path_in / "a.rtdc")
+    shutil.copy2(path_temp, path_in / "b.rtdc")
+    with open(path_in / "b.rtdc", "ab") as fd:
+        fd.write(b"\0" * 1000)
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh",
+                                "--order", order])
+    assert result.exit_code == 0, result.output
+    processed = [ll.split()[1] for ll in result.stdout.split("\n")
+                 if ll.startswith(f"Processing {path_in}")]
+    assert processed == [str(path_in / f"{nn}.rtdc") for nn in expected]
+
+
+@pytest.mark.parametrize("suffix", [".json", ".csv"])
+def test_cli_plan(cli_runner, tmp_path, suffix):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_in = tmp_path / "input"
+    for name in ["a", "b", "c"]:
+        (path_in / name).mkdir(parents=True)
+        shutil.copy2(path_temp, path_in / name / "data.rtdc")
+    with h5py.File(path_in / "c" / "data.rtdc", "a") as h5:
+        del h5["events/image"]
+    # process the first file
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in / "a" / "data.rtdc"),
+                                "-s", "thresh"])
+    assert result.exit_code == 0
+
+    path_plan = tmp_path / f"plan{suffix}"
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path_in), "--recursive",
+                                "-s", "thresh",
+                                "--plan", str(path_plan)])
+    assert result.exit_code == 1
+    assert result.stdout.count("Planned 3 files (1 missing, 0 stale, "
+                               "1 up to date, 1 errors)")
+    # nothing was processed
+    assert not (path_in / "b" / "data_dcn.rtdc").exists()
+
+    if suffix == ".json":
+        plans = json.loads(path_plan.read_text())["datasets"]
+    else:
+        with path_plan.open() as fd:
+            plans = list(csv.DictReader(fd))
+    assert [pl["path_in"] for pl in plans] == [
+        str(path_in / name / "data.rtdc") for name in ["a", "b", "c"]]
+    assert [pl["out_state"] for pl in plans] == ["current", "missing",
+                                                 "error"]
+    assert plans[1]["path_out"] == str(path_in / "b" / "data_dcn.rtdc")
+    assert plans[2]["error"].count("No image data found in input")
+    # same input data, same pipeline
+    assert plans[0]["pphash"] == plans[1]["pphash"]
+    with h5py.File(path_in / "a" / "data_dcn.rtdc") as h5:
+        assert h5.attrs["pipeline:dcnum hash"] == plans[0]["pphash"]
+    assert str(plans[0]["event_count"]) == "11"
+    for key in ["dat_id", "bg_id", "seg_id", "feat_id", "gate_id"]:
+        assert plans[0][key]
+
+
+def test_cli_plan_variants(cli_runner, tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_plan = tmp_path / "plan.json"
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh",
+                                "-ks", "thresh=-6",
+                                "--variant", "t4:-ks thresh=-4",
+                                "--plan", str(path_plan)])
+    assert result.exit_code == 0
+    assert result.stdout.count("Planned 2 files (2 missing")
+    plans = json.loads(path_plan.read_text())["datasets"]
+    assert [pl["variant"] for pl in plans] == [None, "t4"]
+    assert [pl["path_out"] for pl in plans] == [
+        str(path.with_name(path.stem + "_dcn.rtdc")),
+        str(path.with_name(path.stem + "_t4_dcn.rtdc"))]
+    assert plans[0]["bg_id"] == plans[1]["bg_id"]
+    assert plans[0]["seg_id"] != plans[1]["seg_id"]
+    assert plans[1]["seg_id"].startswith("thresh:t=-4:")
+
+
+def test_cli_progress_json(cli_runner):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path = path_temp.with_name("input_path.rtdc")
+    shutil.copy2(path_temp, path)
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh",
+                                "--progress", "json"])
+    assert result.exit_code == 0
+    events = [json.loads(ll) for ll in result.stdout.split("\n")
+              if ll.startswith("{")]
+    assert len(events) >= 2
+    states = [ev["state"] for ev in events if ev["event"] == "state"]
+    # every state change is reported exactly once
+    assert len(states) == len(set(states))
+    assert states[-1] == "done"
+    for ev in events:
+        assert ev["path_in"] == str(path)
+    last = events[-1]
+    assert last["progress"] == 1
+    assert last["events"] > 0
+    assert last["bytes_written"] == path.with_name(
+        "input_path_dcn.rtdc").stat().st_size
+    assert "Processing 100%" not in result.stdout
+
+
+def test_cli_report(cli_runner):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path = path_temp.with_name("input_path.rtdc")
+    shutil.copy2(path_temp, path)
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh", "--report"])
+    assert result.exit_code == 0
+    assert result.stdout.count("Wall time:")
+    path_out = path.with_name("input_path_dcn.rtdc")
+    report = json.loads(
+        path.with_name("input_path_dcn_report.json").read_text())
+    assert report["state"] == "done"
+    assert report["path_out"] == str(path_out)
+    assert report["output_bytes"] == path_out.stat().st_size
+    assert report["events"] > 0
+    assert report["peak_rss"] > 0
+    assert report["state_times"]["background"] > 0
+    assert report["state_times"]["segmentation"] > 0
+    assert "feature extraction" in report["log_times"]
+    assert "background computation" in report["log_times"]
+    with h5py.File(path_out) as h5:
+        assert report["pipeline hash"] == h5.attrs["pipeline:dcnum hash"]
+
+
+def test_cli_preview(cli_runner, monkeypatch):
+    monkeypatch.setattr(preview, "PREVIEW_EVENTS", 5)
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path = path_temp.with_name("input_path.rtdc")
+    shutil.copy2(path_temp, path)
+    for _ in range(2):
+        # the preview is replaced in every run
+        result = cli_runner.invoke(cli_main.chipstream_cli,
+                                   [str(path), "-s", "thresh", "--preview"])
+        assert result.exit_code == 0
+        assert result.stdout.count("Preview:\t5 of 11 events")
+        assert result.stdout.count("Predicted time for 1 files:")
+    assert not path.with_name("input_path_dcn.rtdc").exists()
+    path_out = path.with_name("input_path_preview_dcn.rtdc")
+    report = json.loads(
+        path.with_name("input_path_preview_dcn_report.json").read_text())
+    assert report["preview"]["sample_size"] == 5
+    assert report["preview"]["event_count"] == 11
+    assert report["preview"]["predicted_time"] > report["wall_time"] / 2
+    with h5py.File(path_out) as h5:
+        assert "i=0-10-2" in h5.attrs["pipeline:dcnum data"]
+
+
+@pytest.mark.parametrize("args", [["--dry-run"],
+                                  ["--limit-events", "5"],
+                                  ["--plan", "plan.json"],
+                                  ])
+def test_cli_preview_conflicts(cli_runner, args):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "--preview"] + args)
+    assert result.exit_code == 2
+    assert "cannot be combined with `--preview`" in result.output
+
+
+def test_cli_max_memory(cli_runner):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path = path_temp.with_name("input_path.rtdc")
+    shutil.copy2(path_temp, path)
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh", "--num-cpus", "2",
+                                "--max-memory", "1G"])
+    assert result.exit_code == 0
+    assert result.stdout.count("Memory estimate:")
+    assert result.stdout.count("processes, chunk size 1000)")
+    with h5py.File(path.with_name("input_path_dcn.rtdc")) as h5:
+        assert h5.attrs["experiment:event count"] > 0
+
+
+@pytest.mark.parametrize("max_memory,message", [
+    ("10M", "too small"),
+    ("peter", "Invalid memory size"),
+])
+def test_cli_max_memory_error(cli_runner, max_memory, message):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh", "--dry-run",
+                                "--max-memory", max_memory])
+    assert result.exit_code != 0
+    assert result.stderr.count(message)
+
+
+def test_cli_resume(cli_runner, monkeypatch):
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path = path_temp.with_name("input_path.rtdc")
+    shutil.copy2(path_temp, path)
+
+    def task_segment_extract(self):
+        raise ValueError("Simulated crash")
+
+    with monkeypatch.context() as mp:
+        mp.setattr(ResumableJobRunner, "task_segment_extract",
+                   task_segment_extract)
+        result = cli_runner.invoke(cli_main.chipstream_cli,
+                                   [str(path), "-s", "thresh"])
+        assert result.exit_code == 1
+        assert result.stderr.count("Simulated crash")
+
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "thresh"])
+    assert result.exit_code == 0
+    assert result.stdout.count(
+        "Reusing background data of an interrupted run")
+    assert path.with_name("input_path_dcn.rtdc").exists()
+    assert not list(path.parent.glob("input_path_dcn_input_bb_*"))
+
+
+def test_cli_help(cli_runner):
+    result = cli_runner.invoke(cli_main.chipstream_cli, ["--help"])
+    assert result.exit_code == 0
+    assert result.stdout.count("Available segmenters")
+    assert result.stdout.count("'thresh'")
+    assert result.stdout.count("[copy|rollmed|sparsemed]")
+
+
+@pytest.mark.parametrize("args", [["--version"], ["--peter"]])
+def test_cli_lazy_imports(args):
+    """Startup must not require importing dcnum or torch"""
+    code = ("import sys; from chipstream.cli import cli_main\n"
+            "try:\n"
+            f"    cli_main.chipstream_cli({args})\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print([m for m in ['dcnum.segm', 'dcnum.read', 'torch']"
+            " if m in sys.modules])\n")
+    result = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True)
+    assert result.stdout.strip().split("\n")[-1] == "[]"
+
+
+def test_cli_dry_run_lazy_imports():
+    """A dry run must not import torch or the job runner"""
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    code = ("import sys; from chipstream.cli import cli_main\n"
+            "try:\n"
+            f"    cli_main.chipstream_cli([r'{path}', '--dry-run',"
+            f" '--no-index'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print([m for m in ['torch', 'chipstream.cli.cli_batch',"
+            " 'chipstream.job_order'] if m in sys.modules])\n")
+    result = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True)
+    assert result.stdout.count("Dry run complete")
+    assert result.stdout.strip().split("\n")[-1] == "[]"
+
+
+def test_cli_segmenter_not_available(cli_runner, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    seg_cls = dcnum.segm.get_segmenters()["torchmpo"]
+    monkeypatch.setattr(seg_cls, "is_available", staticmethod(lambda: False))
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "torchmpo"])
+    assert result.exit_code == 2
+    assert result.stderr.count("The segmenter 'torchmpo' is not available")
+    assert not path.with_name(path.stem + "_dcn.rtdc").exists()
+    # A dry run only computes the pipeline identifiers.
+    result = cli_runner.invoke(cli_main.chipstream_cli,
+                               [str(path), "-s", "torchmpo", "--dry-run"])
+    assert result.exit_code == 0
+    assert result.stdout.count("Dry run complete")
+
+
+def test_cli_split_cpu_budget():
+    assert cli_batch.split_cpu_budget(8, 1) == [8]
+    assert cli_batch.split_cpu_budget(8, 3) == [3, 3, 2]
+    assert cli_batch.split_cpu_budget(2, 4) == [1, 1, 1, 1]
+
+
 def test_z_cli_info(cli_runner):
     result = cli_runner.invoke(cli_main.chipstream_cli,
                                ["--info"])
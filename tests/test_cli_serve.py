@@ -0,0 +1,172 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+from helper_methods import retrieve_data
+
+pytest.importorskip("click")
+
+from chipstream.cli import _main, cli_serve  # noqa: E402
+
+
+@pytest.fixture
+def job_server():
+    server = cli_serve.JobServer(port=0, index_path=None)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def test_cli_serve_submit(cli_runner, job_server):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_out = path.with_name("output_dcn.rtdc")
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), str(path_out),
+                                "-s", "thresh",
+                                "--server", job_server.url,
+                                "--progress", "json",
+                                "--report"])
+    assert result.exit_code == 0, result.output
+    assert path_out.exists()
+    assert result.stdout.count("Submitted job 1")
+    assert result.stdout.count("Pipeline hash:")
+    assert result.stdout.count("Wall time:")
+    states = [json.loads(line)["state"]
+              for line in result.stdout.split("\n")
+              if line.startswith("{")]
+    assert states[-1] == "done"
+    assert job_server.jobs[1].state == "done"
+
+    # The same job is skipped, because the output file is up to date.
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), str(path_out),
+                                "--server", job_server.url])
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("is up to date")
+    assert job_server.jobs[2].state == "skipped"
+
+    summary = cli_serve.request_server(job_server.url, "/jobs")
+    assert [job["state"] for job in summary] == ["done", "skipped"]
+
+
+def test_cli_serve_dispatch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert _main.is_server_command(["serve", "--port", "0"])
+    assert _main.is_server_command(["submit", "in.rtdc"])
+    assert not _main.is_server_command(["in.rtdc"])
+    assert not _main.is_server_command([])
+    # input paths named like the server commands are processed
+    (tmp_path / "submit").mkdir()
+    assert not _main.is_server_command(["submit"])
+    assert _main.is_server_command(["serve"])
+
+
+def test_cli_serve_submit_error(cli_runner, job_server):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    # invalid segmenter is rejected by the server
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), "-s", "peter",
+                                "--server", job_server.url])
+    assert result.exit_code == 1
+    assert result.stderr.count("The segmenter 'peter' is not available")
+    assert not job_server.jobs
+
+    # invalid keyword argument fails during processing
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), "-ks", "peter=3",
+                                "--server", job_server.url])
+    assert result.exit_code == 1
+    assert result.stdout.count("Encountered problems during processing")
+    assert job_server.jobs[1].state == "error"
+
+
+def test_cli_serve_submit_no_server(cli_runner):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), "--server", "http://127.0.0.1:1"])
+    assert result.exit_code == 1
+    assert result.stderr.count("Cannot connect to the job server")
+
+
+def send_request(job_server, path="/jobs", data=b"{}", headers=None):
+    """Send a raw request and return the HTTP status code"""
+    req = urllib.request.Request(job_server.url + path,
+                                 data=data,
+                                 headers=headers or {},
+                                 method="GET" if data is None else "POST")
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_cli_serve_access_token(job_server):
+    assert job_server.token_path.exists()
+    if os.name == "posix":
+        assert job_server.token_path.stat().st_mode & 0o777 == 0o600
+    auth = {"Authorization": f"Bearer {job_server.token}"}
+    # missing or wrong token
+    assert send_request(job_server, "/", data=None) == 401
+    assert send_request(job_server, "/", data=None,
+                        headers={"Authorization": "Bearer peter"}) == 401
+    assert send_request(job_server, "/", data=None, headers=auth) == 200
+    # cross-site "simple" requests are not JSON
+    assert send_request(job_server, data=b"{}",
+                        headers=dict(auth, **{"Content-Type": "text/plain"})
+                        ) == 415
+    # DNS rebinding
+    assert send_request(job_server, "/", data=None,
+                        headers=dict(auth, Host="example.com:8477")) == 403
+    assert not job_server.jobs
+
+
+def test_cli_serve_submit_invalid_path_out(cli_runner, job_server):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    # only output files can be replaced
+    result = cli_runner.invoke(cli_serve.chipstream_submit,
+                               [str(path), str(path.with_name("other.rtdc")),
+                                "--override",
+                                "--server", job_server.url])
+    assert result.exit_code == 1
+    assert result.stderr.count("must be an absolute path ending with")
+    with pytest.raises(ValueError, match="must be an absolute path"):
+        job_server.submit({"path_in": str(path),
+                           "path_out": "relative_dcn.rtdc"})
+    assert not job_server.jobs
+
+
+def test_cli_serve_evict_jobs(job_server):
+    job_server.max_finished_jobs = 2
+    for job_id in range(1, 5):
+        job = cli_serve.ServerJob(job_id, {"path_in": "data.rtdc"})
+        job_server.jobs[job_id] = job
+        job_server.finish_job(job, "done")
+    assert sorted(job_server.jobs) == [3, 4]
+    with pytest.raises(KeyError):
+        job_server.get_events(1)
+    assert send_request(job_server, "/jobs/1", data=None, headers={
+        "Authorization": f"Bearer {job_server.token}"}) == 404
+
+
+def test_cli_serve_max_job_events(job_server):
+    job = cli_serve.ServerJob(1, {"path_in": "data.rtdc"})
+    job_server.jobs[1] = job
+    num_events = cli_serve.MAX_JOB_EVENTS + 10
+    for ii in range(num_events):
+        job_server.add_event(job, {"event": "progress", "index": ii})
+    assert len(job.events) == cli_serve.MAX_JOB_EVENTS
+    # the oldest events are skipped
+    events, next_event = job_server.get_events(1, since=0)
+    assert events[0]["index"] == 10
+    assert next_event == num_events
+    events, next_event = job_server.get_events(1, since=num_events - 1)
+    assert [ev["index"] for ev in events] == [num_events - 1]
+    assert job_server.get_events(1, since=num_events) == ([], num_events)
@@ -0,0 +1,58 @@
+import json
+
+import dcnum.read
+import numpy as np
+
+from chipstream import compression
+
+from helper_methods import retrieve_data
+
+
+def test_get_sample_data():
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    with dcnum.read.HDF5Data(path) as hd:
+        image, mask = compression.get_sample_data(hd, num_events=5)
+    assert image.shape == (5, 80, 400)
+    assert image.dtype == np.uint8
+    assert mask.shape == (5, 80, 400)
+    assert mask.dtype == bool
+
+
+def test_select_compression(tmp_path):
+    rng = np.random.default_rng(42)
+    data = [rng.integers(0, 10, size=(10, 80, 400), dtype=np.uint8)]
+    calibration = compression.select_compression(data, tmp_path,
+                                                 levels=(1, 5))
+    assert calibration["compression"] in ["zstd-1", "zstd-5"]
+    assert sorted(calibration["throughput"]) == ["zstd-1", "zstd-5"]
+    assert calibration["write_throughput"] > 0
+    # the temporary file is removed
+    assert not list(tmp_path.iterdir())
+
+
+def test_get_auto_compression_cached(tmp_path, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    calls = []
+
+    def select_compression(data, dir_out):
+        calls.append(dir_out)
+        return {"compression": "zstd-3"}
+
+    monkeypatch.setattr(compression, "select_compression",
+                        select_compression)
+    with dcnum.read.HDF5Data(path) as hd:
+        assert compression.get_auto_compression(hd, tmp_path) == "zstd-3"
+        assert compression.get_auto_compression(hd, tmp_path) == "zstd-3"
+        assert len(calls) == 1
+        # different output directories are calibrated separately
+        dir_other = tmp_path / "other"
+        dir_other.mkdir()
+        compression.get_auto_compression(hd, dir_other)
+        assert len(calls) == 2
+        # recompute
+        compression.get_auto_compression(hd, tmp_path, recompute=True)
+        assert len(calls) == 3
+    cache = json.loads(compression.get_calibration_path().read_text())
+    assert compression.get_calibration_key(tmp_path) in cache
@@ -0,0 +1,88 @@
+import os
+
+from chipstream import dataset_index
+
+
+def test_dataset_index_dataset(tmp_path):
+    path = tmp_path / "data.rtdc"
+    path.write_text("peter")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    assert di.get_dataset(path) is None
+    di.set_dataset(path,
+                   pixel_size=0.34,
+                   pixel_size_valid=0.2645,
+                   image_shape=(80, 320),
+                   event_count=42)
+    info = di.get_dataset(path)
+    assert info["pixel_size"] == 0.34
+    assert info["pixel_size_valid"] == 0.2645
+    assert info["image_shape"] == (80, 320)
+    assert info["event_count"] == 42
+
+    # A new instance uses the same database
+    di2 = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    assert di2.get_dataset(path)["event_count"] == 42
+
+    # Modifying the file invalidates the entry
+    path.write_text("peter and paul")
+    assert di.get_dataset(path) is None
+
+
+def test_dataset_index_dataset_no_image(tmp_path):
+    path = tmp_path / "data.rtdc"
+    path.write_text("peter")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    di.set_dataset(path,
+                   pixel_size=0.34,
+                   pixel_size_valid=0.34,
+                   image_shape=None,
+                   event_count=42)
+    assert di.get_dataset(path)["image_shape"] is None
+
+
+def test_dataset_index_flickering(tmp_path):
+    path = tmp_path / "data.rtdc"
+    path.write_text("peter")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    assert di.get_flickering(path, "default") is None
+    di.set_flickering(path, "default", True)
+    assert di.get_flickering(path, "default") is True
+    di.set_flickering(path, "default", False)
+    assert di.get_flickering(path, "default") is False
+    # Results are stored per detector
+    assert di.get_flickering(path, "sampled") is None
+    di.set_flickering(path, "sampled", True)
+    assert di.get_flickering(path, "sampled") is True
+    assert di.get_flickering(path, "default") is False
+    # Modifying the file invalidates the entry
+    path.write_text("peter and paul")
+    assert di.get_flickering(path, "default") is None
+
+
+def test_dataset_index_output_hash(tmp_path):
+    path = tmp_path / "data_dcn.rtdc"
+    path.write_text("peter")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    assert di.get_output_hash(path) is None
+    di.set_output_hash(path, "1234abcd")
+    assert di.get_output_hash(path) == "1234abcd"
+
+    # Changing the modification time invalidates the entry
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert di.get_output_hash(path) is None
+    # Deleted files are not in the index
+    path.unlink()
+    assert di.get_output_hash(path) is None
+
+
+def test_dataset_index_schema_reset(tmp_path):
+    path = tmp_path / "data.rtdc"
+    path.write_text("peter")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    di.set_output_hash(path, "1234abcd")
+    # Opening a database with a different schema version resets it
+    with di._connect() as con:
+        con.execute("PRAGMA user_version=0")
+    di2 = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    assert di2.get_output_hash(path) is None
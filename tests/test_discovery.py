@@ -0,0 +1,105 @@
+import threading
+
+from chipstream.discovery import InputDiscovery, iter_input_files
+
+
+def make_tree(path):
+    """Create a directory tree with input and output files"""
+    names = [
+        "a.rtdc",
+        "a_dcn.rtdc",
+        "b/c.rtdc",
+        "b/d.txt",
+        "b-c/e.rtdc",
+        "b.c/f.rtdc",
+        "b/g/h/i.rtdc",
+        "b/g/h.rtdc",
+        ".snapshot/j.rtdc",
+        "z/M001_data.rtdc",
+        "z/M002_data.rtdc",
+    ]
+    for name in names:
+        pp = path / name
+        pp.parent.mkdir(parents=True, exist_ok=True)
+        pp.write_text("")
+
+
+def test_iter_input_files_order(tmp_path):
+    make_tree(tmp_path)
+    expected = [pp for pp in sorted(tmp_path.rglob("*.rtdc"))
+                if not pp.name.endswith("_dcn.rtdc")]
+    for num_threads in [1, 4]:
+        assert list(iter_input_files(tmp_path,
+                                     num_threads=num_threads)) == expected
+
+
+def test_iter_input_files_patterns(tmp_path):
+    make_tree(tmp_path)
+    found = list(iter_input_files(tmp_path,
+                                  include=["M*.rtdc", "*.txt"],
+                                  exclude=["M002*"]))
+    assert found == [tmp_path / "b" / "d.txt",
+                     tmp_path / "z" / "M001_data.rtdc"]
+    # excluded directories are not searched
+    found = list(iter_input_files(tmp_path, exclude=[".*", "b*"]))
+    assert found == [tmp_path / "a.rtdc",
+                     tmp_path / "a_dcn.rtdc",
+                     tmp_path / "z" / "M001_data.rtdc",
+                     tmp_path / "z" / "M002_data.rtdc"]
+
+
+def test_iter_input_files_max_depth(tmp_path):
+    make_tree(tmp_path)
+    assert list(iter_input_files(tmp_path, max_depth=0)) == [
+        tmp_path / "a.rtdc"]
+    found = list(iter_input_files(tmp_path, max_depth=2))
+    assert tmp_path / "b" / "g" / "h.rtdc" in found
+    assert tmp_path / "b" / "g" / "h" / "i.rtdc" not in found
+
+
+def test_iter_input_files_streaming(tmp_path, monkeypatch):
+    """The first file is yielded before the whole tree is listed"""
+    make_tree(tmp_path)
+    release = threading.Event()
+    scan_orig = InputDiscovery.scan
+
+    def scan_slow(self, path, depth, parents=()):
+        if path.name == "z":
+            # simulate a slow directory on a network share
+            assert release.wait(timeout=10)
+        return scan_orig(self, path, depth, parents)
+
+    monkeypatch.setattr(InputDiscovery, "scan", scan_slow)
+    files = iter_input_files(tmp_path)
+    assert next(files) == tmp_path / ".snapshot" / "j.rtdc"
+    assert next(files) == tmp_path / "a.rtdc"
+    release.set()
+    assert list(files)[-1] == tmp_path / "z" / "M002_data.rtdc"
+
+
+def test_iter_input_files_stop_early(tmp_path):
+    make_tree(tmp_path)
+    disc = InputDiscovery(tmp_path)
+    for _ in disc:
+        break
+    # The pool is shut down and no further directories are submitted.
+    assert disc.submit(tmp_path, depth=1) is None
+
+
+def test_iter_input_files_symlinks(tmp_path):
+    data = tmp_path / "data"
+    search = tmp_path / "search"
+    for pp in [data / "x.rtdc", data / "sub" / "y.rtdc"]:
+        pp.parent.mkdir(parents=True, exist_ok=True)
+        pp.write_text("")
+    search.mkdir()
+    (search / "link").symlink_to(data / "sub")
+    # loops
+    (data / "sub" / "back").symlink_to(data)
+    (search / "self").symlink_to(search)
+    assert list(iter_input_files(data)) == [data / "sub" / "y.rtdc",
+                                            data / "x.rtdc"]
+    assert list(iter_input_files(search)) == [
+        search / "link" / "back" / "x.rtdc",
+        search / "link" / "y.rtdc"]
+    assert not list(iter_input_files(search, follow_symlinks=False))
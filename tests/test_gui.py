@@ -18,6 +18,7 @@ pytest.importorskip("PyQt6")
 
 from PyQt6 import QtCore, QtWidgets, QtTest  # noqa: E402
 
+from chipstream import preview  # noqa: E402
 from chipstream.gui.main_window import ChipStream  # noqa: E402
 
 
@@ -61,6 +62,9 @@ def test_gui_basins(mw, use_basins):
         time.sleep(.1)
     out_path = path.with_name(path.stem + "_dcn.rtdc")
     assert out_path.exists()
+    # performance report
+    assert path.with_name(path.stem + "_dcn_report.json").exists()
+    assert mw.job_manager.get_info(0).startswith("Wall time:")
 
     with h5py.File(out_path) as h5:
         for feat in ["image", "frame"]:
@@ -72,8 +76,9 @@ def test_gui_basins(mw, use_basins):
             assert feat in h5["events"]
 
 
+@pytest.mark.parametrize("sampled", [True, False])
 @pytest.mark.parametrize("add_flickering", [True, False])
-def test_gui_correct_offset(mw, add_flickering):
+def test_gui_correct_offset(mw, add_flickering, sampled):
     """Offset correction is done automatically"""
     path_temp = retrieve_data(
         "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
@@ -102,6 +107,7 @@ def test_gui_correct_offset(mw, add_flickering):
     mw.append_paths([path])
     mw.ui.checkBox_pixel_size.setChecked(True)
     mw.ui.doubleSpinBox_pixel_size.setValue(0.666)
+    mw.ui.checkBox_flickering_sampled.setChecked(sampled)
     mw.on_run()
     while mw.job_manager.is_busy():
         time.sleep(.1)
@@ -244,3 +250,132 @@ def test_gui_use_volume(mw, use_volume):
                            0.666,
                            atol=0, rtol=1e-5)
         assert ("volume" in h5["events"]) == use_volume
+
+
+@pytest.mark.parametrize("max_memory,success", [(0.1, False), (2, True)])
+def test_gui_max_memory(mw, qtbot, max_memory, success):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    mw.append_paths([path])
+    mw.ui.doubleSpinBox_max_memory.setValue(max_memory)
+    mw.on_run()
+    while mw.job_manager.is_busy():
+        time.sleep(.1)
+    out_path = path.with_name(path.stem + "_dcn.rtdc")
+    assert out_path.exists() == success
+    if not success:
+        qtbot.mouseClick(mw.ui.tableWidget_input.cellWidget(0, 2),
+                         QtCore.Qt.MouseButton.LeftButton)
+        assert mw.ui.textBrowser.toPlainText().count(
+            "memory budget of 102 MiB is too small")
+
+
+def test_gui_stage_dir(mw, tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_stage = tmp_path / "staging"
+    mw.append_paths([path])
+    assert mw.get_stage_dir() is None
+    assert not mw.ui.lineEdit_stage_dir.isEnabled()
+    mw.ui.checkBox_stage.setChecked(True)
+    assert mw.ui.lineEdit_stage_dir.isEnabled()
+    mw.ui.lineEdit_stage_dir.setText(str(path_stage))
+    assert mw.get_stage_dir() == path_stage
+    mw.on_run()
+    while mw.job_manager.is_busy():
+        time.sleep(.1)
+    assert path.with_name(path.stem + "_dcn.rtdc").exists()
+    assert mw.job_manager.get_runner(0).job["path_in"].parent == path_stage
+    assert not list(path_stage.iterdir())
+
+
+def test_gui_drop_directory(mw, qtbot, tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_dir = tmp_path / "drop"
+    (path_dir / "sub").mkdir(parents=True)
+    path_in = path_dir / "sub" / "data.rtdc"
+    path_dcn = path_dir / "data_dcn.rtdc"
+    path_in.write_bytes(path.read_bytes())
+    path_dcn.write_bytes(path.read_bytes())
+
+    mime = QtCore.QMimeData()
+    mime.setUrls([QtCore.QUrl.fromLocalFile(str(path_dir))])
+
+    class DropEvent:
+        def mimeData(self):
+            return mime
+
+    mw.dropEvent(DropEvent())
+    # the directory is searched in the background
+    qtbot.waitUntil(lambda: not mw.timer_drop.isActive(), timeout=10000)
+    # output files are not filtered out, like in the file dialog
+    assert mw.job_manager.get_paths_in() == [path_dcn, path_in]
+
+
+def test_gui_preview(mw, qtbot, monkeypatch):
+    monkeypatch.setattr(preview, "PREVIEW_EVENTS", 5)
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    mw.append_paths([path])
+    qtbot.mouseClick(mw.ui.pushButton_preview,
+                     QtCore.Qt.MouseButton.LeftButton)
+    qtbot.waitUntil(lambda: mw.ui.widget_options.isEnabled(), timeout=30000)
+    assert not path.with_name(path.stem + "_dcn.rtdc").exists()
+    with h5py.File(path.with_name(path.stem + "_preview_dcn.rtdc")) as h5:
+        assert "i=0-10-2" in h5.attrs["pipeline:dcnum data"]
+    assert mw.ui.statusbar.currentMessage().startswith(
+        "Predicted processing time: 0:00:")
+
+
+def test_gui_watch(mw, qtbot, monkeypatch, tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_watch = tmp_path / "watch"
+    path_watch.mkdir()
+    monkeypatch.setattr(QtWidgets.QFileDialog, "getExistingDirectory",
+                        lambda *args: str(path_watch))
+    mw.ui.actionWatch.setChecked(True)
+    assert mw.watcher is not None
+    mw.watcher.interval = 0.1
+
+    # a new file is processed automatically
+    path_in = path_watch / "data.rtdc"
+    path_in.write_bytes(path.read_bytes())
+    out_path = path_watch / "data_dcn.rtdc"
+    qtbot.waitUntil(out_path.exists, timeout=30000)
+    while mw.job_manager.is_busy():
+        time.sleep(.1)
+    assert mw.job_manager.get_paths_in() == [path_in]
+
+    # a failed job is not retried when the next file is processed
+    path_broken = path_watch / "broken.rtdc"
+    path_broken.write_bytes(path.read_bytes())
+    with h5py.File(path_broken, "a") as h5:
+        del h5["events/image"]
+    path_broken.touch()
+    qtbot.waitUntil(lambda: len(mw.job_manager) == 2, timeout=30000)
+    qtbot.waitUntil(lambda: mw.job_manager[1]["state"] == "error",
+                    timeout=30000)
+    runner_error = mw.job_manager.get_runner(1)
+    path_new = path_watch / "new.rtdc"
+    path_new.write_bytes(path.read_bytes())
+    qtbot.waitUntil(path_new.with_name("new_dcn.rtdc").exists,
+                    timeout=30000)
+    while mw.job_manager.is_busy():
+        time.sleep(.1)
+    assert mw.job_manager.get_paths_in() == [path_in, path_broken, path_new]
+    assert mw.job_manager[0]["state"] == "done"
+    assert mw.job_manager[1]["state"] == "error"
+    assert mw.job_manager.get_runner(1) is runner_error
+
+    mw.ui.actionWatch.setChecked(False)
+    assert mw.watcher is None
+
+
+def test_gui_watch_cancel(mw, monkeypatch):
+    monkeypatch.setattr(QtWidgets.QFileDialog, "getExistingDirectory",
+                        lambda *args: "")
+    mw.ui.actionWatch.setChecked(True)
+    assert mw.watcher is None
+    assert not mw.ui.actionWatch.isChecked()
@@ -4,6 +4,7 @@ import pytest
 
 from dcnum.meta import ppid
 
+from chipstream import preview
 from chipstream.gui import manager
 
 import h5py
@@ -53,6 +54,32 @@ def test_manager_get_paths_out(tmp_path):
     assert mg.get_paths_out()[1] == pout / "baz" / "data_dcn.rtdc"
 
 
+def test_manager_order_paths(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    p1 = tmp_path / "a.rtdc"
+    p2 = tmp_path / "b.rtdc"
+    shutil.copy2(path, p1)
+    shutil.copy2(path, p2)
+    with open(p2, "ab") as fd:
+        fd.write(b"\0" * 1000)
+
+    mg = manager.ChipStreamJobManager()
+    mg.add_path(p1)
+    mg.add_path(p2)
+    mg.order_paths("largest")
+    assert mg.get_paths_in() == [p2, p1]
+    mg.run_all_in_thread()
+    mg.join()
+    assert mg[0]["state"] == "done"
+    assert mg.get_runner(0).job["path_in"] == p2
+    mg.order_paths("alphabetical")
+    assert mg.get_paths_in() == [p1, p2]
+    # the runners of the previous run are discarded
+    assert mg.get_runner(0) is None
+    mg.close()
+
+
 def test_manager_read_data():
     path = retrieve_data(
         "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
@@ -100,6 +127,46 @@ def test_manager_run_defaults():
                                      "norm:o=0^s=10")
 
 
+def test_manager_run_stage_dir(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_stage = tmp_path / "staging"
+
+    mg = manager.ChipStreamJobManager()
+    mg.add_path(path)
+    mg.run_all_in_thread(stage_dir=path_stage)
+    mg.join()
+
+    assert mg[0]["state"] == "done"
+    runner = mg.get_runner(0)
+    # the job read the staged file, which is removed afterwards
+    assert runner.job["path_in"].parent == path_stage
+    assert not list(path_stage.iterdir())
+    with h5py.File(runner.job["path_out"]) as h5:
+        basins = [h5["basins"][key][:] for key in h5["basins"]]
+    assert not [b for b in basins if str(path_stage).encode() in b"".join(b)]
+
+
+def test_manager_run_preview(tmp_path, monkeypatch):
+    monkeypatch.setattr(preview, "PREVIEW_EVENTS", 5)
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+
+    mg = manager.ChipStreamJobManager()
+    mg.add_path(path)
+    assert mg.get_predicted_time() is None
+    mg.run_all_in_thread(preview=True)
+    mg.join()
+
+    assert mg[0]["state"] == "done"
+    runner = mg.get_runner(0)
+    assert runner.job["path_out"] == path.with_name(
+        path.stem + "_preview_dcn.rtdc")
+    assert runner.job["data_kwargs"]["index_mapping"] == slice(0, 10, 2)
+    assert mg.get_predicted_time() > 0
+    assert "Predicted time:" in mg.get_info(0)
+
+
 def test_manager_run_error_wrong_model():
     pytest.importorskip("torch")
     model_file = retrieve_model(
@@ -126,6 +193,8 @@ def test_manager_run_error_wrong_model():
     assert mg[0]["progress"] == 0
     assert mg[0]["state"] == "error"
     assert mg.get_info(0).count("only experiments in channel region supported")
+    # the job that failed validation is listed
+    assert [job["path_in"] for job in mg._worker.jobs] == [path]
 
     assert not mg.is_busy()
 
@@ -167,3 +236,36 @@ def test_manager_run_with_path_out(tmp_path):
     # make sure the output paths exist
     assert (pout / "bar" / "data_dcn.rtdc").exists()
     assert (pout / "baz" / "data_dcn.rtdc").exists()
+
+
+def test_manager_run_paths(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    p1 = tmp_path / "broken.rtdc"
+    p2 = tmp_path / "data.rtdc"
+    p3 = tmp_path / "new.rtdc"
+    for pp in [p1, p2, p3]:
+        shutil.copy2(path, pp)
+    with h5py.File(p1, "a") as h5:
+        del h5["events/image"]
+
+    mg = manager.ChipStreamJobManager()
+    mg.add_path(p1)
+    mg.add_path(p2)
+    mg.run_all_in_thread()
+    mg.join()
+    assert mg[0]["state"] == "error"
+    assert mg[1]["state"] == "done"
+    runner_error = mg.get_runner(0)
+    runner_done = mg.get_runner(1)
+
+    # only the new path is processed
+    mg.run_paths([p3])
+    mg.join()
+    assert len(mg) == 3
+    assert mg[2]["state"] == "done"
+    assert mg[2]["path"] == str(p3)
+    assert mg[0]["state"] == "error"
+    assert mg.get_runner(0) is runner_error
+    assert mg.get_runner(1) is runner_done
+    assert not mg.is_busy()
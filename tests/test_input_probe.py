@@ -0,0 +1,156 @@
+import dcnum.read
+from dcnum.read.cache import HDF5ImageCache
+import h5py
+import numpy as np
+import pytest
+
+from chipstream import dataset_index, input_probe
+
+from helper_methods import calltracker, retrieve_data
+
+
+def test_input_probe_info():
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    with h5py.File(path) as h5:
+        size = len(h5["events/deform"])
+        pixel_size = h5.attrs["imaging:pixel size"]
+    with input_probe.InputProbe(path) as probe:
+        assert probe.has_image
+        assert probe.image_shape == (80, 400)
+        assert probe.event_count == size
+        assert probe.pixel_size == pixel_size
+        assert probe.pixel_size_valid == pixel_size
+        assert not probe.detect_flickering()
+        assert len(probe.get_dat_id()) > 0
+        assert probe.get_dat_id() == probe.get_dat_id(pixel_size=pixel_size)
+        assert probe.get_dat_id() != probe.get_dat_id(pixel_size=0.1)
+    assert probe._hd is None
+
+
+def test_input_probe_opens_file_once(monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    calls = []
+
+    class TrackedHDF5Data(dcnum.read.HDF5Data):
+        def __init__(self, *args, **kwargs):
+            calls.append(args[0])
+            super(TrackedHDF5Data, self).__init__(*args, **kwargs)
+
+    monkeypatch.setattr(input_probe.dcnum.read, "HDF5Data", TrackedHDF5Data)
+    with input_probe.InputProbe(path) as probe:
+        assert probe.has_image
+        probe.detect_flickering()
+        probe.get_dat_id()
+    assert len(calls) == 1
+
+
+def test_input_probe_with_index(tmp_path, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    with input_probe.InputProbe(path, di) as probe:
+        info = probe.info
+    assert di.get_dataset(path) == info
+
+    # The second probe must not open the file
+    class ForbiddenFile(h5py.File):
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("file opened")
+
+    monkeypatch.setattr(input_probe.h5py, "File", ForbiddenFile)
+    with input_probe.InputProbe(path, di) as probe:
+        assert probe.info == info
+        assert probe.has_image
+        probe.get_dat_id()
+
+
+def test_input_probe_flickering_cached(tmp_path, monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    di = dataset_index.DatasetIndex(tmp_path / "index.sqlite3")
+    detect_flickering = calltracker(dcnum.read.detect_flickering)
+    monkeypatch.setattr(input_probe.dcnum.read, "detect_flickering",
+                        detect_flickering)
+
+    with input_probe.InputProbe(path, di) as probe:
+        assert not probe.detect_flickering()
+    assert detect_flickering.calls == 1
+
+    # The result is taken from the index
+    with input_probe.InputProbe(path, di) as probe:
+        assert not probe.detect_flickering()
+    assert detect_flickering.calls == 1
+
+    # Unless we force recomputation
+    with input_probe.InputProbe(path, di) as probe:
+        assert not probe.detect_flickering(recompute=True)
+    assert detect_flickering.calls == 2
+
+    # Or use a different detector
+    with input_probe.InputProbe(path, di) as probe:
+        assert not probe.detect_flickering(
+            flickering_kwargs={"num_chunks": 3})
+        assert not probe.detect_flickering(
+            flickering_kwargs={"num_chunks": 3})
+    assert detect_flickering.calls == 3
+
+
+def make_flickering_images(size=2000, period=5):
+    rng = np.random.default_rng(42)
+    images = rng.normal(100, 1, size=(size, 20, 30)).astype(np.uint8)
+    images[::period] += 5
+    return images
+
+
+@pytest.mark.parametrize("num_chunks", [0, 1, 4, 100])
+def test_input_probe_detect_flickering_sampled(num_chunks):
+    images = make_flickering_images()
+    assert input_probe.detect_flickering(images, num_chunks=num_chunks)
+    assert not input_probe.detect_flickering(images[1::5],
+                                             num_chunks=num_chunks)
+
+
+def test_input_probe_detect_flickering_sampled_late():
+    """Flickering that starts late in the dataset is only sampled"""
+    images = make_flickering_images(size=20000)
+    images[:10000] = images[1]
+    assert not input_probe.detect_flickering(images)
+    assert input_probe.detect_flickering(images, num_chunks=10)
+
+
+def test_input_probe_detect_flickering_sampled_budget(tmp_path):
+    path = tmp_path / "data.h5"
+    with h5py.File(path, "w") as h5:
+        h5.create_dataset("events/image",
+                          data=make_flickering_images(size=5000),
+                          chunks=(100, 20, 30))
+    with h5py.File(path) as h5:
+        image = HDF5ImageCache(h5["events/image"], chunk_size=100)
+        image._get_chunk_data = calltracker(image._get_chunk_data)
+        assert input_probe.detect_flickering(image, num_chunks=5)
+    assert image._get_chunk_data.calls == 5
+
+
+def test_input_probe_get_flickering_kwargs():
+    kwargs = input_probe.get_flickering_kwargs({"num_chunks": "5"})
+    assert kwargs["num_chunks"] == 5
+    assert kwargs["max_frames"] == 1000
+    with pytest.raises(ValueError, match="peter"):
+        input_probe.get_flickering_kwargs({"peter": 1})
+
+
+def test_input_probe_validate_flickering_kwargs():
+    pytest.importorskip("click")
+    from chipstream.cli.cli_valid import validate_flickering_kwargs
+    # the CLI and the GUI use the same defaults
+    assert validate_flickering_kwargs([]) \
+        == input_probe.get_flickering_kwargs()
+    kwargs = validate_flickering_kwargs(["num_chunks=5",
+                                         "brightness_threshold=3"])
+    assert kwargs["num_chunks"] == 5
+    assert kwargs["brightness_threshold"] == 3.0
+    assert kwargs["max_frames"] == 1000
+    with pytest.raises(ValueError, match="peter"):
+        validate_flickering_kwargs(["peter=1"])
@@ -0,0 +1,65 @@
+import shutil
+
+import dcnum.read
+import pytest
+
+from chipstream.job_order import estimate_cost, order_paths
+
+from helper_methods import retrieve_data
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    """Three input files; "b" has three times as many events as "a"/"c"
+
+    The file "b" only contains the image data and is the smallest
+    file. The file "c" is padded, so that it is the largest file.
+    """
+    path_temp = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_a = tmp_path / "a.rtdc"
+    path_b = tmp_path / "b.rtdc"
+    path_c = tmp_path / "c.rtdc"
+    shutil.copy2(path_temp, path_a)
+    with dcnum.read.concatenated_hdf5_data(
+            paths=3 * [path_temp],
+            path_out=path_b,
+            compute_frame=True):
+        pass
+    shutil.copy2(path_temp, path_c)
+    with open(path_c, "ab") as fd:
+        fd.write(b"\0" * path_a.stat().st_size)
+    assert path_c.stat().st_size > path_a.stat().st_size
+    assert path_a.stat().st_size > path_b.stat().st_size
+    return path_a, path_b, path_c
+
+
+def test_estimate_cost(input_files, tmp_path):
+    path_a, path_b, _ = input_files
+    assert estimate_cost(path_a) == 11 * 80 * 400
+    assert estimate_cost(path_b) == 3 * estimate_cost(path_a)
+    # invalid files have no cost
+    path_invalid = tmp_path / "invalid.rtdc"
+    path_invalid.write_text("no HDF5 data")
+    assert estimate_cost(path_invalid) == 0
+
+
+@pytest.mark.parametrize("strategy,expected", [
+    ["given", "bca"],
+    ["alphabetical", "abc"],
+    ["largest", "cab"],
+    ["smallest", "bac"],
+    ["cost", "bca"],
+])
+def test_order_paths(input_files, strategy, expected):
+    path_a, path_b, path_c = input_files
+    pairs = [(path_b, None), (path_c, None), (path_a, None)]
+    ordered = order_paths(pairs, strategy=strategy, key=lambda pp: pp[0])
+    assert "".join(pp[0].stem for pp in ordered) == expected
+    # the input list is not modified
+    assert pairs[0][0] == path_b
+
+
+def test_order_paths_invalid_strategy():
+    with pytest.raises(ValueError, match="Unknown order strategy"):
+        order_paths([], strategy="random")
@@ -0,0 +1,64 @@
+import pytest
+
+from chipstream.job_report import format_report, parse_log_times
+
+
+def test_parse_log_times():
+    log = "\n".join([
+        "18:56:20 INFO dcnum.Runner-59: Run start: 2026-10-18-18.56.20",
+        "18:56:20 INFO dcnum.feat.feat_background.BackgroundSparseMed: "
+        "Background computation time: 0.2s",
+        "18:56:22 INFO dcnum.write.QueueWriterProcess.ChunkWriter: "
+        "Disk time: 0.1s",
+        "18:56:22 INFO dcnum.Runner-59: Data load time: 0.3s",
+        "18:56:22 INFO dcnum.Runner-59: Feature extraction time: 1.5s",
+        "18:56:22 INFO dcnum.Runner-59: Feature extraction time: 0.5s",
+        "18:56:24 INFO dcnum.Runner-59: Run duration: 0:00:04",
+    ])
+    times = parse_log_times(log)
+    assert times == {"background computation": pytest.approx(0.2),
+                     "disk": pytest.approx(0.1),
+                     "data load": pytest.approx(0.3),
+                     "feature extraction": pytest.approx(2.0),
+                     }
+
+
+def test_format_report():
+    report = {"wall_time": 10.0,
+              "state_times": {"background": 2.0, "segmentation": 7.0},
+              "log_times": {"feature extraction": 12.0},
+              "events": 1000,
+              "events_per_second": 142.9,
+              "cpu_time": 20.0,
+              "cpu_utilization": 0.5,
+              "num_procs": 4,
+              "peak_rss": 512 * 1024**2,
+              "output_bytes": 3 * 1024**2,
+              }
+    text = format_report(report)
+    assert "Wall time:\t10.0s" in text
+    assert " - segmentation:\t7.0s" in text
+    assert " - feature extraction (log):\t12.0s" in text
+    assert "50% of 4 processes" in text
+    assert "Peak memory:\t512 MiB" in text
+
+
+def test_format_report_preview():
+    report = {"wall_time": 10.0,
+              "state_times": {},
+              "log_times": {},
+              "events": 100,
+              "events_per_second": 10.0,
+              "cpu_time": 20.0,
+              "cpu_utilization": 0.5,
+              "num_procs": 4,
+              "peak_rss": 512 * 1024**2,
+              "output_bytes": 3 * 1024**2,
+              "preview": {"sample_size": 1000,
+                          "event_count": 50000,
+                          "events_per_second": 125.0,
+                          "predicted_time": 402.4},
+              }
+    text = format_report(report)
+    assert "Preview:\t1000 of 50000 events (125.0 events/s)" in text
+    assert "Predicted time:\t0:06:42" in text
@@ -0,0 +1,72 @@
+import pytest
+
+from chipstream.memory import (
+    MiB, estimate_job_memory, fit_job_to_memory, get_max_concurrent_jobs,
+    parse_memory
+)
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("1024", 1024),
+    ("512M", 512 * MiB),
+    ("512MiB", 512 * MiB),
+    ("1.5g", int(1.5 * 1024 * MiB)),
+    ("2T", 2 * 1024**4),
+])
+def test_parse_memory(value, expected):
+    assert parse_memory(value) == expected
+
+
+def test_parse_memory_auto():
+    assert parse_memory("auto") > 0
+
+
+def test_parse_memory_invalid():
+    with pytest.raises(ValueError, match="Invalid memory size"):
+        parse_memory("lots")
+
+
+def test_estimate_job_memory():
+    small = estimate_job_memory((80, 320), 5000, num_procs=4)
+    # more processes, more memory
+    assert estimate_job_memory((80, 320), 5000, num_procs=8) > small
+    # larger images, more memory
+    assert estimate_job_memory((160, 320), 5000, num_procs=4) > small
+    # smaller datasets only use small chunks
+    assert estimate_job_memory((80, 320), 50, num_procs=4) < small
+    # torch models in every worker
+    assert estimate_job_memory((80, 320), 5000, num_procs=4,
+                               segmenter_code="torchmpo") \
+        > estimate_job_memory((80, 320), 5000, num_procs=4,
+                              segmenter_code="torchsto") > small
+
+
+def test_fit_job_to_memory_procs():
+    mem_4 = estimate_job_memory((80, 320), 5000, num_procs=4)
+    num_procs, chunk_size, memory = fit_job_to_memory(
+        mem_4 + 1, (80, 320), 5000, num_procs=64)
+    assert num_procs == 4
+    assert chunk_size == 1000
+    assert memory == mem_4
+    # plenty of memory
+    assert fit_job_to_memory(1024**4, (80, 320), 5000, num_procs=64)[0] == 64
+
+
+def test_fit_job_to_memory_chunk_size():
+    # Large images require smaller chunks
+    num_procs, chunk_size, memory = fit_job_to_memory(
+        16 * 1024 * MiB, (2000, 2000), 100000, num_procs=256)
+    assert chunk_size < 1000
+    assert 1 <= num_procs < 256
+    assert memory <= 16 * 1024 * MiB
+
+
+def test_fit_job_to_memory_too_small():
+    with pytest.raises(ValueError, match="too small"):
+        fit_job_to_memory(100 * MiB, (80, 320), 5000, num_procs=4)
+
+
+def test_get_max_concurrent_jobs():
+    assert get_max_concurrent_jobs(10, 3, 8) == 3
+    assert get_max_concurrent_jobs(10, 3, 2) == 2
+    assert get_max_concurrent_jobs(10, 30, 2) == 1
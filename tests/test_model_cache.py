@@ -0,0 +1,57 @@
+import pytest
+
+from chipstream import model_cache
+
+from helper_methods import retrieve_model
+
+torch_model = pytest.importorskip("dcnum.segm.segm_torch.torch_model")
+
+
+def count_loads(monkeypatch):
+    calls = []
+    load_model_v1_jit = torch_model.load_model_v1_jit
+
+    def tracked(model_meta):
+        calls.append(model_meta["path"])
+        return load_model_v1_jit(model_meta)
+
+    monkeypatch.setattr(torch_model, "load_model_v1_jit", tracked)
+    return calls
+
+
+@pytest.fixture(autouse=True)
+def clear_model_cache():
+    torch_model.cache_model.clear()
+    torch_model.cache_model_meta.clear()
+    model_cache._loaded_models.clear()
+    model_cache._model_hashes.clear()
+
+
+def test_preload_model(monkeypatch):
+    mpath = retrieve_model("segm-torch-model_unet-dcnum-test_g1_910c2.zip")
+    calls = count_loads(monkeypatch)
+    assert model_cache.preload_model(mpath, device="cpu")
+    assert len(calls) == 1
+    # the model is in the dcnum cache
+    torch_model.load_model(mpath, device="cpu")
+    assert len(calls) == 1
+    # loading it again is not necessary
+    assert not model_cache.preload_model(str(mpath), device="cpu")
+    assert len(calls) == 1
+    assert list(model_cache._loaded_models) == [
+        (model_cache.get_model_hash(mpath), "cpu")]
+
+
+def test_sync_model_cache_stale(monkeypatch):
+    mpath = retrieve_model("segm-torch-model_unet-dcnum-test_g1_910c2.zip")
+    calls = count_loads(monkeypatch)
+    model_cache.preload_model(mpath, device="cpu")
+    assert torch_model.cache_model
+    # pretend that a different file with the same name was loaded before
+    model_cache._model_hashes[mpath.name] = "0" * 32
+    model_cache.sync_model_cache(mpath)
+    assert not torch_model.cache_model
+    assert not torch_model.cache_model_meta
+    assert not model_cache._loaded_models
+    assert model_cache.preload_model(mpath, device="cpu")
+    assert len(calls) == 2
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from chipstream.prefetch import prefetch
+
+
+def test_prefetch_order():
+    def func(value):
+        time.sleep(0.01 * (5 - value))
+        return value ** 2
+
+    futures = prefetch(func, [{"value": ii} for ii in range(5)])
+    assert [fut.result() for fut in futures] == [0, 1, 4, 9, 16]
+
+
+def test_prefetch_lookahead():
+    started = []
+
+    def func(value):
+        started.append(value)
+        return value
+
+    futures = prefetch(func, [{"value": ii} for ii in range(5)],
+                       lookahead=2)
+    fut = next(futures)
+    assert fut.result() == 0
+    # While the caller works on the first item, the next two are prepared
+    time.sleep(0.1)
+    assert sorted(started) == [0, 1, 2]
+    assert [fut.result() for fut in futures] == [1, 2, 3, 4]
+
+
+def test_prefetch_error():
+    def func(value):
+        if value == 1:
+            raise ValueError("peter")
+        return value
+
+    futures = prefetch(func, [{"value": ii} for ii in range(3)])
+    assert next(futures).result() == 0
+    with pytest.raises(ValueError, match="peter"):
+        next(futures).result()
+    assert next(futures).result() == 2
+
+
+def test_prefetch_close_cancels_pending():
+    started = []
+    event = threading.Event()
+
+    def func(value):
+        started.append(value)
+        event.wait(timeout=5)
+        return value
+
+    futures = prefetch(func, [{"value": ii} for ii in range(5)],
+                       lookahead=1)
+    fut = next(futures)
+    event.set()
+    assert fut.result() == 0
+    futures.close()
+    # The first item and at most one lookahead item were started
+    assert sorted(started) in [[0], [0, 1]]
@@ -0,0 +1,50 @@
+import pathlib
+
+import pytest
+
+from chipstream.preview import (
+    extrapolate_runtime, format_duration, get_preview_mapping,
+    get_preview_path, get_sample_size
+)
+
+
+@pytest.mark.parametrize("event_count,num_events,mapping", [
+    (1000, 1000, None),
+    (10, 1000, None),
+    (5000, 1000, slice(0, 5000, 5)),
+    (5999, 1000, slice(0, 5000, 5)),
+    (11, 5, slice(0, 10, 2)),
+])
+def test_preview_mapping(event_count, num_events, mapping):
+    assert get_preview_mapping(event_count, num_events) == mapping
+    size = get_sample_size(event_count, mapping)
+    assert size == min(event_count, num_events)
+
+
+def test_preview_path():
+    assert get_preview_path(pathlib.Path("/data/M001_data_dcn.rtdc")) \
+        == pathlib.Path("/data/M001_data_preview_dcn.rtdc")
+    assert get_preview_path(pathlib.Path("/data/out.rtdc")) \
+        == pathlib.Path("/data/out_preview.rtdc")
+
+
+def test_preview_extrapolate_runtime():
+    report = {"wall_time": 12.0,
+              "state_times": {"init": 1.0,
+                              "background": 2.0,
+                              "segmentation": 8.0,
+                              "plumbing": 1.0},
+              }
+    estimate = extrapolate_runtime(report,
+                                   event_count=100000,
+                                   index_mapping=slice(0, 100000, 100))
+    assert estimate["sample_size"] == 1000
+    assert estimate["event_count"] == 100000
+    assert estimate["events_per_second"] == pytest.approx(125)
+    # fixed time plus 100 times the segmentation time of the sample
+    assert estimate["predicted_time"] == pytest.approx(4 + 800)
+
+
+def test_preview_format_duration():
+    assert format_duration(59.6) == "0:01:00"
+    assert format_duration(3723) == "1:02:03"
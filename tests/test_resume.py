@@ -0,0 +1,226 @@
+import inspect
+import os
+
+from dcnum.logic import DCNumJobRunner, DCNumPipelineJob
+import h5py
+import pytest
+
+from chipstream import resume
+from chipstream.resume import (
+    ResumableJobRunner, get_shared_background_path, has_checkpoint_support
+)
+from chipstream.staging import StagingArea, stage_job, unstage_job
+
+from helper_methods import retrieve_data
+
+
+def get_job(path):
+    return DCNumPipelineJob(path_in=path,
+                            path_out=path.with_name("output.rtdc"),
+                            background_code="sparsemed",
+                            segmenter_code="thresh",
+                            debug=True)
+
+
+def crash_after_background(job, monkeypatch):
+    """Run a job that fails during segmentation"""
+    def task_segment_extract(self):
+        raise ValueError("Simulated crash")
+
+    with monkeypatch.context() as mp:
+        mp.setattr(ResumableJobRunner, "task_segment_extract",
+                   task_segment_extract)
+        with ResumableJobRunner(job) as runner:
+            assert not runner.has_background_checkpoint()
+            with pytest.raises(ValueError, match="Simulated crash"):
+                runner.run()
+            assert runner.state == "error"
+    return runner
+
+
+def track_background(monkeypatch):
+    calls = []
+    task_background = DCNumJobRunner.task_background
+
+    def tracked(self):
+        calls.append(self)
+        return task_background(self)
+
+    monkeypatch.setattr(DCNumJobRunner, "task_background", tracked)
+    return calls
+
+
+def test_resume_dcnum_internals(monkeypatch):
+    """ResumableJobRunner relies on internals of DCNumJobRunner
+
+    If this test fails after a dcnum update, background checkpoints
+    are disabled (or temporary files are not cleaned up). Update
+    `ResumableJobRunner` and `has_checkpoint_support`.
+    """
+    assert has_checkpoint_support()
+    assert "tmp_suffix" in inspect.signature(DCNumJobRunner).parameters
+    assert "delete_temporary_files" \
+        in inspect.signature(DCNumJobRunner.close).parameters
+    for name in ["path_temp_in", "path_temp_out"]:
+        assert isinstance(getattr(DCNumJobRunner, name), property)
+    for name in ["run_pipeline", "task_background", "task_segment_extract"]:
+        assert callable(getattr(DCNumJobRunner, name))
+
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    job = get_job(path)
+    with ResumableJobRunner(job) as runner:
+        assert runner.checkpoints
+        assert runner._data_temp_in is None
+        assert runner.tmp_suffix.startswith("resume-")
+        # the temporary input file is named like in dcnum
+        runner2 = DCNumJobRunner(job, tmp_suffix=runner.tmp_suffix)
+        with monkeypatch.context() as mp:
+            # do not remove the file at exit
+            mp.setattr("atexit.register", lambda *args, **kwargs: None)
+            assert runner2.path_temp_in == runner.path_temp_in
+        runner2.close()
+        # dcnum removes the temporary input file at exit, the
+        # checkpoint must be kept
+        registered = []
+        monkeypatch.setattr("atexit.register",
+                            lambda *args, **kwargs: registered.append(args))
+        assert runner.path_temp_in
+        assert not registered
+        assert runner.path_temp_out
+        assert registered
+
+
+def test_resume_without_checkpoint_support(monkeypatch):
+    """Unknown dcnum internals disable checkpoints, jobs still run"""
+    monkeypatch.setattr(resume, "has_checkpoint_support", lambda: False)
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    runner = crash_after_background(get_job(path), monkeypatch)
+    assert not runner.checkpoints
+    assert not runner.tmp_suffix.startswith("resume-")
+
+    calls = track_background(monkeypatch)
+    with ResumableJobRunner(get_job(path),
+                            path_background=path.with_name("bg.rtdc~")) \
+            as runner2:
+        assert not runner2.has_background_checkpoint()
+        assert runner2.path_temp_in != runner.path_temp_in
+        runner2.run()
+        assert runner2.state == "done"
+    assert len(calls) == 1
+    assert path.with_name("output.rtdc").exists()
+    assert not path.with_name("bg.rtdc~").exists()
+
+
+def test_resume_background(monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    runner = crash_after_background(get_job(path), monkeypatch)
+    # The checkpoint is kept after the failure
+    assert runner.path_temp_in.exists()
+    assert not runner.path_temp_out.exists()
+
+    calls = track_background(monkeypatch)
+    with ResumableJobRunner(get_job(path)) as runner2:
+        assert runner2.path_temp_in == runner.path_temp_in
+        assert runner2.has_background_checkpoint()
+        runner2.run()
+        assert runner2.state == "done"
+    assert not calls, "background must not be computed again"
+    # The checkpoint is removed after the job completed
+    assert not runner2.path_temp_in.exists()
+
+    # Compare with a regular run
+    path_ref = path.with_name("reference.rtdc")
+    job_ref = DCNumPipelineJob(path_in=path,
+                               path_out=path_ref,
+                               background_code="sparsemed",
+                               segmenter_code="thresh",
+                               debug=True)
+    with DCNumJobRunner(job_ref) as runner_ref:
+        runner_ref.run()
+    with h5py.File(path.with_name("output.rtdc")) as h5, \
+            h5py.File(path_ref) as h5_ref:
+        assert h5.attrs["pipeline:dcnum hash"] \
+            == h5_ref.attrs["pipeline:dcnum hash"]
+        assert h5.attrs["experiment:event count"] \
+            == h5_ref.attrs["experiment:event count"]
+
+
+def test_resume_background_input_modified(monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    crash_after_background(get_job(path), monkeypatch)
+    # Modify the input file
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    calls = track_background(monkeypatch)
+    with ResumableJobRunner(get_job(path)) as runner:
+        assert not runner.has_background_checkpoint()
+        runner.run()
+        assert runner.state == "done"
+    assert len(calls) == 1
+
+
+def test_resume_background_staged(monkeypatch, tmp_path):
+    """Checkpoints are valid for a new copy of the staged input file"""
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    job = get_job(path)
+    with StagingArea(tmp_path / "stage1") as area:
+        job_staged = stage_job(job, area)
+        assert job_staged["path_in"] != path
+        runner = crash_after_background(job_staged, monkeypatch)
+    assert runner.path_temp_in.exists()
+    assert not job_staged["path_in"].exists()
+
+    calls = track_background(monkeypatch)
+    with StagingArea(tmp_path / "stage2") as area:
+        job_staged2 = stage_job(job, area)
+        assert job_staged2["path_in"].parent != job_staged["path_in"].parent
+        with ResumableJobRunner(job_staged2) as runner2:
+            assert runner2.has_background_checkpoint()
+            runner2.run()
+            assert runner2.state == "done"
+        assert unstage_job(job_staged2, area) == path
+    assert not calls, "background must not be computed again"
+
+    with h5py.File(path.with_name("output.rtdc")) as h5:
+        assert h5.attrs["pipeline:dcnum hash"] == runner2.pphash
+        assert h5.attrs["experiment:event count"] > 0
+
+
+def test_shared_background(monkeypatch):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    jobs = [DCNumPipelineJob(path_in=path,
+                             path_out=path.with_name(f"output_{thresh}.rtdc"),
+                             background_code="sparsemed",
+                             segmenter_code="thresh",
+                             segmenter_kwargs={"thresh": thresh},
+                             debug=True)
+            for thresh in [-4, -6]]
+    path_bg = get_shared_background_path(jobs[0])
+    assert path_bg == get_shared_background_path(jobs[1])
+    assert jobs[0].get_ppid(ret_hash=True)[1] \
+        != jobs[1].get_ppid(ret_hash=True)[1]
+
+    calls = track_background(monkeypatch)
+    for job in jobs:
+        with ResumableJobRunner(job, path_background=path_bg) as runner:
+            assert runner.path_temp_in == path_bg
+            runner.run()
+            assert runner.state == "done"
+        # The shared background data are not removed by the runner.
+        assert path_bg.exists()
+    assert len(calls) == 1, "background must be computed only once"
+
+    counts = []
+    for job in jobs:
+        with h5py.File(job["path_out"]) as h5:
+            counts.append(h5.attrs["experiment:event count"])
+            assert h5.attrs["pipeline:dcnum background"] \
+                == "sparsemed:k=200^s=1^t=0^f=0.8^o=1"
+    assert counts[0] < counts[1]
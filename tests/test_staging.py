@@ -0,0 +1,73 @@
+import threading
+import time
+
+from chipstream.staging import StagingArea
+
+
+def test_staging_area(tmp_path):
+    path_in = tmp_path / "input" / "data.rtdc"
+    path_in.parent.mkdir()
+    path_in.write_bytes(b"0" * 100)
+    with StagingArea(tmp_path / "staging") as area:
+        path_staged = area.stage(path_in)
+        assert path_staged.parent == tmp_path / "staging"
+        assert path_staged.read_bytes() == path_in.read_bytes()
+        assert area.get_original_path(path_staged) == path_in
+        assert area.used_bytes == 100
+        # staging again returns the same file
+        assert area.stage(path_in) == path_staged
+        area.release(path_staged)
+        assert not path_staged.exists()
+        assert area.used_bytes == 0
+        path_staged = area.stage(path_in)
+    # all files are removed when the staging area is closed
+    assert not path_staged.exists()
+    assert area.stage(path_in) == path_in
+
+
+def test_staging_area_max_bytes(tmp_path):
+    paths = []
+    for name in ["a", "b"]:
+        path = tmp_path / f"{name}.rtdc"
+        path.write_bytes(b"0" * 100)
+        paths.append(path)
+    large = tmp_path / "large.rtdc"
+    large.write_bytes(b"0" * 200)
+
+    area = StagingArea(tmp_path / "staging", max_bytes=150)
+    # too large files are not staged
+    assert area.stage(large) == large
+    path_a = area.stage(paths[0])
+    assert path_a != paths[0]
+
+    # the second file is only staged after the first one was released
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        area.stage(paths[1])))
+    thread.start()
+    time.sleep(0.2)
+    assert not result
+    area.release(path_a)
+    thread.join(timeout=5)
+    assert result[0].parent == tmp_path / "staging"
+    area.close()
+
+
+def test_staging_area_close_while_waiting(tmp_path):
+    paths = []
+    for name in ["a", "b"]:
+        path = tmp_path / f"{name}.rtdc"
+        path.write_bytes(b"0" * 100)
+        paths.append(path)
+    area = StagingArea(tmp_path / "staging", max_bytes=150)
+    area.stage(paths[0])
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        area.stage(paths[1])))
+    thread.start()
+    time.sleep(0.2)
+    area.close()
+    thread.join(timeout=5)
+    # not staged
+    assert result == [paths[1]]
+    assert not list((tmp_path / "staging").iterdir())
@@ -0,0 +1,69 @@
+import shutil
+import time
+
+from chipstream.watch import FolderWatcher, is_readable_hdf5
+
+from helper_methods import retrieve_data
+
+
+def test_is_readable_hdf5(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    assert is_readable_hdf5(path)
+    # truncated file
+    path_trunc = tmp_path / "truncated.rtdc"
+    path_trunc.write_bytes(path.read_bytes()[:1000])
+    assert not is_readable_hdf5(path_trunc)
+
+
+def test_folder_watcher_poll(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    path_watch = tmp_path / "watch"
+    path_watch.mkdir()
+    shutil.copy2(path, path_watch / "a.rtdc")
+    (path_watch / "a_dcn.rtdc").write_text("output file")
+
+    watcher = FolderWatcher(path_watch)
+    # Files are complete once they did not change between two polls.
+    assert watcher.poll() == []
+    assert watcher.poll() == [path_watch / "a.rtdc"]
+    assert watcher.poll() == []
+
+    # a file that is still being written
+    path_b = path_watch / "sub" / "b.rtdc"
+    path_b.parent.mkdir()
+    data = path.read_bytes()
+    path_b.write_bytes(data[:1000])
+    assert watcher.poll() == []
+    with path_b.open("ab") as fd:
+        fd.write(data[1000:])
+    assert watcher.poll() == []
+    assert watcher.poll() == [path_b]
+    assert watcher.get_state() == {"directories": 2,
+                                   "pending": 0,
+                                   "complete": 2}
+
+    # a replaced file is yielded again
+    time.sleep(0.01)
+    path_b.unlink()
+    shutil.copy(path, path_b)
+    assert watcher.poll() == []
+    assert watcher.poll() == [path_b]
+
+
+def test_folder_watcher_thread(tmp_path):
+    path = retrieve_data(
+        "fmt-hdf5_cytoshot_full-features_legacy_allev_2023.zip")
+    watcher = FolderWatcher(tmp_path, interval=0.05)
+    watcher.start()
+    try:
+        shutil.copy2(path, tmp_path / "data.rtdc")
+        for _ in range(100):
+            paths = watcher.get_ready_paths()
+            if paths:
+                break
+            time.sleep(0.05)
+        assert paths == [tmp_path / "data.rtdc"]
+    finally:
+        watcher.stop()
@@ -0,0 +1,79 @@
+import shutil
+
+import pytest
+
+from chipstream import write_behind
+from chipstream.write_behind import OutputMover, move_file
+
+
+def test_move_file(tmp_path):
+    path_src = tmp_path / "local" / "data_dcn.rtdc"
+    path_src.parent.mkdir()
+    path_src.write_bytes(b"0123456789" * 100)
+    path_dst = tmp_path / "share" / "data_dcn.rtdc"
+    move_file(path_src, path_dst)
+    assert not path_src.exists()
+    assert path_dst.read_bytes() == b"0123456789" * 100
+    assert not list(path_dst.parent.glob("*~"))
+
+
+def test_move_file_corrupt_copy(tmp_path, monkeypatch):
+    path_src = tmp_path / "data_dcn.rtdc"
+    path_src.write_bytes(b"0123456789" * 100)
+    path_dst = tmp_path / "share" / "data_dcn.rtdc"
+
+    copyfile = shutil.copyfile
+
+    def copyfile_corrupt(src, dst):
+        copyfile(src, dst)
+        with open(dst, "r+b") as fd:
+            fd.write(b"x")
+
+    monkeypatch.setattr(write_behind.shutil, "copyfile", copyfile_corrupt)
+    with pytest.raises(OSError, match="Hash mismatch"):
+        move_file(path_src, path_dst)
+    # the original file is kept
+    assert path_src.exists()
+    assert not path_dst.exists()
+    assert not list(path_dst.parent.iterdir())
+
+
+def test_output_mover_retry(tmp_path, monkeypatch):
+    attempts = []
+
+    def move_file_flaky(path_src, path_dst):
+        attempts.append(path_src)
+        if len(attempts) < 3:
+            raise OSError("Network share not available")
+        move_file(path_src, path_dst)
+
+    monkeypatch.setattr(write_behind, "move_file", move_file_flaky)
+    path_out = tmp_path / "share" / "data_dcn.rtdc"
+    with OutputMover(tmp_path / "local", retry_delay=0.01) as mover:
+        path_local = mover.get_local_path(path_out)
+        assert path_local.parent == tmp_path / "local"
+        assert mover.get_destination(path_local) == path_out
+        path_local.write_bytes(b"0" * 100)
+        mover.submit(path_local)
+    assert len(attempts) == 3
+    assert not mover.failed
+    assert mover.num_pending == 0
+    assert path_out.read_bytes() == b"0" * 100
+    assert not path_local.exists()
+
+
+def test_output_mover_failed(tmp_path, monkeypatch):
+    def move_file_broken(path_src, path_dst):
+        raise OSError("Network share not available")
+
+    monkeypatch.setattr(write_behind, "move_file", move_file_broken)
+    path_out = tmp_path / "share" / "data_dcn.rtdc"
+    mover = OutputMover(tmp_path / "local", num_retries=1, retry_delay=0.01)
+    path_local = mover.get_local_path(path_out)
+    path_local.write_bytes(b"0" * 100)
+    mover.submit(path_local)
+    failed = mover.close()
+    assert len(failed) == 1
+    assert failed[0][:2] == (path_local, path_out)
+    # the local file is kept
+    assert path_local.exists()